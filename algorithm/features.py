@@ -0,0 +1,152 @@
+from collections import deque
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from algorithm.rollups import LANE_METRICS
+from algorithm.timestamps import MICROS
+
+# Окна признаков в секундах до текущего момента: последняя минута, предпоследняя,
+# от 2 до 5 минут и от 5 до 15 минут, как в признаках модели из ноутбука
+WINDOWS = ((0, 60), (60, 120), (120, 300), (300, 900))
+
+
+def window_name(window: Tuple[int, int]) -> str:
+    lo, hi = window
+    return f"{lo // 60}_{hi // 60}m"
+
+
+class FeatureWindows:
+    """
+    Скользящие окна признаков по полосам, обновляемые инкрементально.
+
+    Значения метрик (как в snapshot_series и lane_series, NaN - не наблюдалось)
+    копятся в секундной корзине. Закрытая корзина входит в окна и выходит из
+    них по мере старения: для каждого окна держатся сумма и число наблюдений и
+    номера первой и следующей за последней корзин в нем, поэтому продвижение
+    времени стоит O(число окон) на корзину, а признаки - одно деление.
+    Признаки меняются раз в секунду, текущая незакрытая секунда в них не входит.
+    """
+
+    def __init__(self, lanes: Sequence[int], windows: Sequence[Tuple[int, int]] = WINDOWS):
+        self.lanes = list(lanes)
+        self.windows = list(windows)
+        self.keys: List[Tuple[int, str]] = [(lane, name) for lane in self.lanes for name in LANE_METRICS]
+        self.key_index = {key: i for i, key in enumerate(self.keys)}
+        self.horizon = max(hi for _, hi in self.windows)
+        n_windows, n_keys = len(self.windows), len(self.keys)
+        self.win_sum = np.zeros((n_windows, n_keys))
+        self.win_count = np.zeros((n_windows, n_keys), dtype=np.int64)
+        # Закрытые корзины: (секунда, сумма, число наблюдений), номер корзины - base + позиция
+        self.buckets = deque()
+        self.base = 0
+        self.head = [0] * n_windows  # первая корзина окна
+        self.tail = [0] * n_windows  # следующая за последней корзиной окна
+        self.second: Optional[int] = None  # открытая корзина
+        self.open_sum = np.zeros(n_keys)
+        self.open_count = np.zeros(n_keys, dtype=np.int64)
+
+    @property
+    def time(self) -> Optional[int]:
+        """Момент, на который посчитаны признаки, микросекунды от эпохи"""
+        return None if self.second is None else self.second * MICROS
+
+    @property
+    def feature_names(self) -> List[str]:
+        return ['lane', 'hour'] + [f"{name}_{window_name(window)}"
+                                   for window in self.windows for name in LANE_METRICS]
+
+    def _bucket(self, serial: int) -> tuple:
+        return self.buckets[serial - self.base]
+
+    def _advance(self, now: int) -> None:
+        # Окна относительно секунды now: корзина входит в окно [lo, hi), когда ее секунда < now - lo,
+        # и выходит, когда ее секунда < now - hi
+        end = self.base + len(self.buckets)
+        for w, (lo, hi) in enumerate(self.windows):
+            while self.tail[w] < end and self._bucket(self.tail[w])[0] < now - lo:
+                _, values, counts = self._bucket(self.tail[w])
+                self.win_sum[w] += values
+                self.win_count[w] += counts
+                self.tail[w] += 1
+            while self.head[w] < self.tail[w] and self._bucket(self.head[w])[0] < now - hi:
+                _, values, counts = self._bucket(self.head[w])
+                self.win_sum[w] -= values
+                self.win_count[w] -= counts
+                self.head[w] += 1
+        while self.base < min(self.head):
+            self.buckets.popleft()
+            self.base += 1
+        # Суммы копят ошибку округления, в пустом окне сбрасываем их в ноль
+        self.win_sum[self.win_count == 0] = 0.0
+
+    def _close(self, now: int) -> None:
+        if self.second is not None and self.open_count.any():
+            self.buckets.append((self.second, self.open_sum, self.open_count))
+        self.open_sum = np.zeros(len(self.keys))
+        self.open_count = np.zeros(len(self.keys), dtype=np.int64)
+        self.second = now
+        self._advance(now)
+
+    def add(self, time_us: int, values: Dict[Hashable, float]) -> bool:
+        """
+        Добавляет значения метрик одного кадра
+
+        Args:
+            time_us (int): Время кадра в микросекундах от эпохи
+            values (Dict[Hashable, float]): Значения по ключам (полоса, метрика), NaN - нет наблюдения
+
+        Returns:
+            bool: Закрылась ли секунда, то есть обновились ли признаки
+        """
+        second = time_us // MICROS
+        closed = self.second is not None and second > self.second
+        if self.second is None or closed:
+            self._close(second)
+        for key, value in values.items():
+            i = self.key_index.get(key)
+            if i is not None and value == value:
+                self.open_sum[i] += value
+                self.open_count[i] += 1
+        return closed
+
+    def add_series(self, ts: np.ndarray, series: Dict[Hashable, np.ndarray]) -> None:
+        """
+        Добавляет ряды метрик сразу за много кадров, например хвост индекса очередей
+
+        Args:
+            ts (np.ndarray): Время кадров в микросекундах, по возрастанию
+            series (Dict[Hashable, np.ndarray]): Ряды по ключам (полоса, метрика), как из lane_series
+        """
+        if not len(ts):
+            return
+        values = np.full((len(ts), len(self.keys)), np.nan)
+        for key, column in series.items():
+            if key in self.key_index:
+                values[:, self.key_index[key]] = column
+        observed = ~np.isnan(values)
+        seconds = np.asarray(ts) // MICROS
+        starts = np.flatnonzero(np.r_[True, seconds[1:] != seconds[:-1]])
+        sums = np.add.reduceat(np.where(observed, values, 0.0), starts)
+        counts = np.add.reduceat(observed.astype(np.int64), starts)
+        for second, bucket_sum, bucket_count in zip(seconds[starts].tolist(), sums, counts):
+            if self.second is None or second > self.second:
+                self._close(second)
+            self.open_sum += bucket_sum
+            self.open_count += bucket_count
+
+    def features(self) -> np.ndarray:
+        """
+        Матрица признаков: строка на полосу, столбцы в порядке feature_names
+
+        Returns:
+            np.ndarray: Признаки, NaN - метрика не наблюдалась в окне
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(self.win_count > 0, self.win_sum / self.win_count, np.nan)
+        n_metrics = len(LANE_METRICS)
+        # (окна, полосы * метрики) -> (полосы, окна * метрики)
+        means = means.reshape(len(self.windows), len(self.lanes), n_metrics).transpose(1, 0, 2)
+        hour = (self.second // 3600 % 24) if self.second is not None else np.nan
+        static = np.column_stack([self.lanes, np.full(len(self.lanes), hour, dtype=np.float64)])
+        return np.hstack([static, means.reshape(len(self.lanes), -1)])
@@ -0,0 +1,210 @@
+from array import array
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+
+from algorithm.models import Objects
+
+# Колонки хранилища и их типы
+COLUMNS = {
+    'obj_id': np.int32,
+    'lane': np.int16,
+    'obj_speed': np.float64,
+    'point_x': np.float64,
+    'point_y': np.float64,
+    'heading': np.float64,
+    'time': np.int64,
+    'obj_class': np.int16,
+}
+
+# Коды array.array для накопления колонок до перевода в numpy
+_ARRAY_CODES = {
+    'obj_id': 'i',
+    'lane': 'h',
+    'obj_speed': 'd',
+    'point_x': 'd',
+    'point_y': 'd',
+    'heading': 'd',
+    'time': 'q',
+    'obj_class': 'h',
+}
+
+
+class Row(NamedTuple):
+    """Легковесное представление строки кадра с теми же полями, что и у RowData"""
+    obj_id: int
+    lane: int
+    obj_speed: float
+    point_x: float
+    point_y: float
+    heading: float
+    time: int  # микросекунды от эпохи
+    obj_class: int = 0
+
+
+class Frame(NamedTuple):
+    """Кадр, совместимый с Objects по полю rows_data"""
+    rows_data: List[Row]
+
+
+class FrameBuilder:
+    """
+    Накопитель кадров: складывает строки в array.array и в конце
+    собирает из них FrameStore
+    """
+
+    def __init__(self):
+        self.columns = {name: array(code) for name, code in _ARRAY_CODES.items()}
+        self.offsets = array('q', [0])
+
+    def append(self, obj: Objects) -> None:
+        columns = self.columns
+        for row in obj.rows_data:
+            columns['obj_id'].append(row.obj_id)
+            columns['lane'].append(row.lane)
+            columns['obj_speed'].append(row.obj_speed)
+            columns['point_x'].append(row.point_x)
+            columns['point_y'].append(row.point_y)
+            columns['heading'].append(row.heading)
+            columns['time'].append(row.time)
+            columns['obj_class'].append(row.obj_class)
+        self.offsets.append(len(columns['time']))
+
+    def build(self) -> 'FrameStore':
+        columns = {name: np.frombuffer(self.columns[name], dtype=COLUMNS[name]).copy() for name in COLUMNS}
+        return FrameStore(columns, np.frombuffer(self.offsets, dtype=np.int64).copy())
+
+
+class FrameStore:
+    """
+    Колоночное хранилище кадров.
+
+    Строки всех кадров лежат подряд в numpy-массивах колонок, а строки кадра i
+    занимают диапазон offsets[i]:offsets[i + 1]. Время хранится как int64
+    микросекунд от эпохи.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], offsets: np.ndarray):
+        self.columns = columns
+        self.offsets = offsets
+
+    @classmethod
+    def from_objects(cls, objects: Iterable[Objects]) -> 'FrameStore':
+        """
+        Собирает хранилище из потока кадров
+
+        Args:
+            objects (Iterable[Objects]): Кадры в порядке времени
+
+        Returns:
+            FrameStore: Колоночное хранилище
+        """
+        builder = FrameBuilder()
+        for obj in objects:
+            builder.append(obj)
+        return builder.build()
+
+    @classmethod
+    def concat(cls, stores: List['FrameStore']) -> 'FrameStore':
+        """Склеивает несколько хранилищ в одно в переданном порядке"""
+        stores = [store for store in stores if len(store)]
+        if not stores:
+            return FrameBuilder().build()
+        columns = {name: np.concatenate([store.columns[name] for store in stores]) for name in COLUMNS}
+        offsets = [stores[0].offsets - stores[0].offsets[0]]
+        shift = offsets[0][-1]
+        for store in stores[1:]:
+            offsets.append(store.offsets[1:] - store.offsets[0] + shift)
+            shift = offsets[-1][-1]
+        return cls(columns, np.concatenate(offsets))
+
+    @classmethod
+    def merge(cls, stores: List['FrameStore']) -> 'FrameStore':
+        """
+        Сливает хранилища соседних файлов в одно по времени кадров.
+
+        Дампы пишутся кусками по несколько минут, и на стыке файлов кадры могут
+        повторяться или идти вперемешку. Кадр со временем, которое уже есть в
+        более раннем хранилище, считается повтором и отбрасывается, кадры с
+        одинаковым временем внутри одного хранилища сохраняются. Если хранилища
+        не пересекаются по времени и упорядочены внутри, это обычная склейка
+
+        Args:
+            stores (List[FrameStore]): Хранилища в порядке файлов
+
+        Returns:
+            FrameStore: Хранилище с кадрами по возрастанию времени
+        """
+        stores = [store for store in stores if len(store)]
+        times = [np.asarray(store.frame_times) for store in stores]
+        ordered = all(len(t) < 2 or not np.any(t[1:] < t[:-1]) for t in times) and \
+            all(prev[-1] < curr[0] for prev, curr in zip(times, times[1:]))
+        merged = cls.concat(stores)
+        if ordered:
+            return merged
+
+        ts = np.concatenate(times)
+        source = np.repeat(np.arange(len(stores)), [len(t) for t in times])
+        order = np.lexsort((source, ts))
+        ts, source = ts[order], source[order]
+        # Кадр остается, если он из того же хранилища, что и первый кадр с таким временем
+        group = np.cumsum(np.r_[True, ts[1:] != ts[:-1]]) - 1
+        first_source = source[np.flatnonzero(np.r_[True, ts[1:] != ts[:-1]])]
+        return merged.take(order[source == first_source[group]])
+
+    def take(self, frames: np.ndarray) -> 'FrameStore':
+        """Возвращает новое хранилище из кадров с номерами frames в переданном порядке"""
+        frames = np.asarray(frames, dtype=np.int64)
+        starts = np.asarray(self.offsets[:-1])[frames]
+        lengths = np.asarray(self.offsets[1:])[frames] - starts
+        offsets = np.zeros(len(frames) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        rows = np.arange(offsets[-1], dtype=np.int64) + np.repeat(starts - offsets[:-1], lengths)
+        return FrameStore({name: np.asarray(col)[rows] for name, col in self.columns.items()}, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def n_rows(self) -> int:
+        return int(self.offsets[-1] - self.offsets[0])
+
+    @property
+    def frame_times(self) -> np.ndarray:
+        """Время каждого кадра (по первой строке кадра)"""
+        return self.columns['time'][self.offsets[:-1]]
+
+    @property
+    def frame_index(self) -> np.ndarray:
+        """Номер кадра для каждой строки"""
+        return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.offsets))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(col.nbytes for col in self.columns.values()) + self.offsets.nbytes
+
+    def slice(self, start: int, stop: Optional[int] = None) -> 'FrameStore':
+        """Возвращает хранилище с кадрами start:stop без копирования колонок"""
+        offsets = self.offsets[start:(len(self) if stop is None else stop) + 1]
+        if not len(offsets):
+            return FrameBuilder().build()
+        lo, hi = offsets[0], offsets[-1]
+        return FrameStore({name: col[lo:hi] for name, col in self.columns.items()}, offsets - lo)
+
+    def row(self, i: int) -> Row:
+        """Возвращает строку по ее индексу в колонках"""
+        c = self.columns
+        return Row(int(c['obj_id'][i]), int(c['lane'][i]), float(c['obj_speed'][i]), float(c['point_x'][i]),
+                   float(c['point_y'][i]), float(c['heading'][i]), int(c['time'][i]), int(c['obj_class'][i]))
+
+    def __getitem__(self, i: int) -> Frame:
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        c = self.columns
+        return Frame(list(map(Row._make, zip(
+            c['obj_id'][lo:hi].tolist(), c['lane'][lo:hi].tolist(), c['obj_speed'][lo:hi].tolist(),
+            c['point_x'][lo:hi].tolist(), c['point_y'][lo:hi].tolist(), c['heading'][lo:hi].tolist(),
+            c['time'][lo:hi].tolist(), c['obj_class'][lo:hi].tolist()))))
+
+    def __iter__(self) -> Iterator[Frame]:
+        for i in range(len(self)):
+            yield self[i]
@@ -1,13 +1,15 @@
 import json
-from typing import List, Dict
+import re
+from typing import List, Dict, Iterator, IO
 from datetime import datetime
 import glob
 import os
 from algorithm.models import SensorConfig, Objects, RowData, RoadSensorLane, Zone, Trigger, Segment, DividingLineObj
+from algorithm.timestamps import TIME_FORMAT, parse_micros
 
 
 def parse_datetime(dt_str: str) -> datetime:
-    return datetime.strptime(dt_str, '%Y-%m-%d %H:%M:%S.%f')
+    return datetime.strptime(dt_str, TIME_FORMAT)
 
 
 length_types = {
@@ -17,6 +19,29 @@ length_types = {
 }
 
 
+def _prepare_row(row: dict) -> dict:
+    if isinstance(row.get('time'), str):
+        row['time'] = parse_micros(row['time'])
+    if row['obj_length'] == 0:
+        row['obj_length'] = length_types.get(row['obj_class'], 0)
+    return row
+
+
+def frame_to_model(frame: dict) -> Objects:
+    """
+    Преобразует один кадр objects[] из JSON в модель Objects
+
+    Args:
+        frame (dict): JSON данные кадра
+
+    Returns:
+        Objects: Модель кадра
+    """
+    for row in frame.get('rows_data', []):
+        _prepare_row(row)
+    return Objects(**frame)
+
+
 def convert_json_to_models(json_data: dict) -> List[SensorConfig]:
     """
     Преобразует JSON данные в список моделей SensorConfig
@@ -27,13 +52,10 @@ def convert_json_to_models(json_data: dict) -> List[SensorConfig]:
     Returns:
         List[SensorConfig]: Список моделей SensorConfig
     """
-    # Преобразуем строки времени в объекты datetime
+    # Преобразуем строки времени в микросекунды от эпохи
     for obj in json_data.get('objects', []):
         for row in obj.get('rows_data', []):
-            if 'time' in row:
-                row['time'] = parse_datetime(row['time'])
-            if row['obj_length'] == 0:
-                row['obj_length'] = length_types.get(row['obj_class'], 0)
+            _prepare_row(row)
     
     # Создаем модель SensorConfig
     sensor_config = SensorConfig(**json_data)
@@ -56,3 +78,162 @@ def process_json_file(file_path: str) -> List[SensorConfig]:
     except Exception as e:
         print(f"Ошибка при обработке файла {file_path}: {str(e)}")
         return []
+
+
+# Размер блока, которым читается файл при потоковом разборе
+CHUNK_SIZE = 1 << 20
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class _JsonStream:
+    """
+    Буферизованный читатель JSON, который декодирует или пропускает
+    значения по одному, не держа в памяти весь файл
+    """
+
+    def __init__(self, f: IO[str]):
+        self.f = f
+        self.buf = ''
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        chunk = self.f.read(CHUNK_SIZE)
+        if not chunk:
+            return False
+        if self.pos > CHUNK_SIZE:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        self.buf += chunk
+        return True
+
+    def peek(self) -> str:
+        """Возвращает следующий значимый символ, не сдвигая позицию"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError('Неожиданный конец JSON')
+
+    def expect(self, ch: str) -> None:
+        if self.peek() != ch:
+            raise ValueError(f"Ожидался символ '{ch}' в позиции {self.pos}")
+        self.pos += 1
+
+    def decode(self):
+        """Декодирует одно значение целиком"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # Число на границе буфера могло быть обрезано, дочитываем и декодируем заново
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def skip(self) -> None:
+        """
+        Пропускает значение. Массивы пропускаются поэлементно, поэтому
+        в памяти одновременно находится не больше одного элемента
+        """
+        if self.peek() != '[':
+            self.decode()
+            return
+        self.pos += 1
+        if self.peek() != ']':
+            while True:
+                self.decode()
+                if self.peek() == ']':
+                    break
+                self.expect(',')
+        self.pos += 1
+
+
+def iter_frame_dicts(file_path: str) -> Iterator[dict]:
+    """
+    Потоково читает JSON файл и отдает кадры objects[] как словари, без
+    преобразования в модели. Блоки конфигурации сенсора, полос и зон
+    пропускаются без разбора, кадры без строк не возвращаются.
+
+    Args:
+        file_path (str): Путь к JSON файлу
+
+    Returns:
+        Iterator[dict]: JSON данные кадров в порядке следования в файле
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        stream = _JsonStream(f)
+        stream.expect('{')
+        if stream.peek() == '}':
+            return
+        while True:
+            key = stream.decode()
+            stream.expect(':')
+            if key == 'objects':
+                stream.expect('[')
+                if stream.peek() != ']':
+                    while True:
+                        frame = stream.decode()
+                        if frame.get('rows_data'):
+                            yield frame
+                        if stream.peek() == ']':
+                            break
+                        stream.expect(',')
+                stream.expect(']')
+            else:
+                stream.skip()
+            if stream.peek() == '}':
+                return
+            stream.expect(',')
+
+
+def iter_objects(file_path: str) -> Iterator[Objects]:
+    """
+    Потоково читает JSON файл и отдает кадры objects[] по мере декодирования,
+    см. iter_frame_dicts
+
+    Args:
+        file_path (str): Путь к JSON файлу
+
+    Returns:
+        Iterator[Objects]: Кадры в порядке следования в файле
+    """
+    try:
+        for frame in iter_frame_dicts(file_path):
+            yield frame_to_model(frame)
+    except Exception as e:
+        print(f"Ошибка при обработке файла {file_path}: {str(e)}")
+
+
+def read_sensor_config(file_path: str) -> SensorConfig:
+    """
+    Читает конфигурацию сенсора из файла, пропуская блок objects без разбора
+
+    Args:
+        file_path (str): Путь к JSON файлу
+
+    Returns:
+        SensorConfig: Конфигурация сенсора с пустым списком objects
+    """
+    config = {}
+    with open(file_path, 'r', encoding='utf-8') as f:
+        stream = _JsonStream(f)
+        stream.expect('{')
+        while stream.peek() != '}':
+            key = stream.decode()
+            stream.expect(':')
+            if key == 'objects':
+                stream.skip()
+            else:
+                config[key] = stream.decode()
+            if stream.peek() == ',':
+                stream.expect(',')
+    config['objects'] = []
+    return SensorConfig(**config)
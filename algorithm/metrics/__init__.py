@@ -0,0 +1,3 @@
+from algorithm.metrics.avg_stops_count import StopsTracker, StopsWindow, avg_multiple_stops
+from algorithm.metrics.delay_time import DelayTracker, calc_time_diff
+from algorithm.metrics.queue_time import QueueStopsTracker
@@ -0,0 +1,12 @@
+from typing import Iterable
+
+from algorithm.models import Objects
+
+
+def load_objects(objects: Iterable[Objects] | None = None) -> Iterable[Objects]:
+    """returns the given frames or lazily loads the whole dataset"""
+    if objects is not None:
+        return objects
+    # загружаем данные только по требованию, чтобы импорт метрик ничего не читал
+    from backend.data_loader import get_frame_store
+    return get_frame_store()
@@ -1,28 +1,20 @@
-import datetime
 from collections import deque
 from pprint import pprint
 
-from backend.data_loader import get_all_objects
-
-objects = get_all_objects()
+from algorithm.metrics._data import load_objects
+from algorithm.spatial import SpatialIndex
+from algorithm.timestamps import MICROS, from_micros
+from algorithm.tracks import FrameTracks, TrackStore
 
 STOP_TIME_THRESHOLD_SECS = 5
 AVG_STOPS_VALUE_THRESHOLD_MIN = 3
+# jam starts and ends remembered by StopsTracker, older ones are dropped
+JAM_HISTORY = 10000
 
-traffic_jams = []  # starts of
-traffic_jams_end = []  # ends of
-lanes = [[] for _ in range(8)]  # (point_x, speed, id)
-cars = dict()
-cars_speed = dict()
-traffic_jams_car_ids = set()
-
-
-def has_left(curr_dt: datetime.datetime, last_seen_dt: datetime.datetime) -> bool:
-    """car is no longer displayed within the sensor"""
-    time_diff = curr_dt - last_seen_dt
-    seconds = time_diff.total_seconds()
 
-    return seconds >= 10.0
+def has_left(curr_ts: int, last_seen_ts: int) -> bool:
+    """car is no longer displayed within the sensor, times in microseconds since epoch"""
+    return curr_ts - last_seen_ts >= 10 * MICROS
 
 
 def check_heading(angle: int) -> bool:
@@ -36,112 +28,204 @@ def is_traffic_lane(lane: int) -> bool:
     return 0 <= lane <= 2
 
 
-def calc_avg_stops_count(curr_dt: datetime.datetime, avg_sum: float, stops: deque, car_ids: list[int]) -> float:
-    if not stops or not car_ids:
-        return 0.0
-
-    while len(stops) and stops[0][0] < curr_dt - datetime.timedelta(minutes=AVG_STOPS_VALUE_THRESHOLD_MIN):
-        avg_sum -= 1
-        stops.popleft()
-    
-    real_stops = []
-    for stop in stops:
-        if stop[1] in car_ids:
-            real_stops.append(stop[1])
-
-    return len(real_stops) / len(car_ids)
-
-
-def get_all_car_stops_by_id(car_id: int) -> None:
+class StopsWindow:
+    """
+    sliding window of counted stops.
+
+    stops are kept in arrival order together with per-car counters, so expiry
+    is amortized O(1) and the number of stops of currently tracked cars is
+    kept up to date instead of rescanning the window on every frame.
+    removing all stops of a car is O(1): its entries are invalidated by
+    bumping the car generation and skipped lazily on expiry. a generation is
+    forgotten once no entries of the car are left in the deque.
+    """
+
+    def __init__(self, minutes: float = AVG_STOPS_VALUE_THRESHOLD_MIN):
+        self.window = round(minutes * 60 * MICROS)
+        self.stops = deque()  # (stop_ts, car_id, generation)
+        self.counts = dict()  # car_id -> stops of the car in window
+        self.generations = dict()  # car_id -> current generation
+        self.dead = dict()  # car_id -> invalidated stops still in the deque
+        self.tracked = set()
+        self.size = 0  # stops in window
+        self.tracked_size = 0  # stops of tracked cars in window
+
+    def track(self, car_id: int) -> None:
+        if car_id not in self.tracked:
+            self.tracked.add(car_id)
+            self.tracked_size += self.counts.get(car_id, 0)
+
+    def untrack(self, car_id: int) -> None:
+        if car_id in self.tracked:
+            self.tracked.remove(car_id)
+            self.tracked_size -= self.counts.get(car_id, 0)
+
+    def add(self, stop_ts: int, car_id: int) -> None:
+        self.stops.append((stop_ts, car_id, self.generations.get(car_id, 0)))
+        self.counts[car_id] = self.counts.get(car_id, 0) + 1
+        self.size += 1
+        if car_id in self.tracked:
+            self.tracked_size += 1
+
+    def remove_car(self, car_id: int) -> int:
+        """drops all stops of the car, returns how many were dropped"""
+        count = self.counts.pop(car_id, 0)
+        if count:
+            self.generations[car_id] = self.generations.get(car_id, 0) + 1
+            self.dead[car_id] = self.dead.get(car_id, 0) + count
+            self.size -= count
+            if car_id in self.tracked:
+                self.tracked_size -= count
+        return count
+
+    def _is_live(self, stop: tuple) -> bool:
+        return stop[2] == self.generations.get(stop[1], 0)
+
+    def _drop_dead(self, car_id: int) -> None:
+        # once no invalidated stops are left, the generation is not needed:
+        # track keys are not reused, so the map would otherwise only grow
+        self.dead[car_id] -= 1
+        if not self.dead[car_id]:
+            del self.dead[car_id]
+            if car_id not in self.counts:
+                del self.generations[car_id]
+
+    def expire(self, curr_ts: int) -> None:
+        threshold = curr_ts - self.window
+        stops = self.stops
+        while stops:
+            stop_ts, car_id, _ = stops[0]
+            if not self._is_live(stops[0]):
+                stops.popleft()
+                self._drop_dead(car_id)
+                continue
+            if stop_ts >= threshold:
+                break
+            stops.popleft()
+            self.counts[car_id] -= 1
+            if not self.counts[car_id]:
+                del self.counts[car_id]
+                if car_id not in self.dead:
+                    self.generations.pop(car_id, None)
+            self.size -= 1
+            if car_id in self.tracked:
+                self.tracked_size -= 1
+
+    def average(self, curr_ts: int) -> float:
+        """average stops count of tracked cars within the window"""
+        if not self.size or not self.tracked:
+            return 0.0
+        self.expire(curr_ts)
+        return self.tracked_size / len(self.tracked)
+
+
+def get_all_car_stops_by_id(car_id: int, objects=None) -> None:
     stops = []
-    for object_frame in objects:
-        curr_dt = object_frame.rows_data[0].time
+    for object_frame in load_objects(objects):
+        curr_ts = object_frame.rows_data[0].time
         for car in object_frame.rows_data:
             if car.obj_id == car_id and car.obj_speed == 0:
-                stops.append(curr_dt)
-
-    pprint(stops)
-
-
-def avg_multiple_stops():
-    """calculate time for cars with few stops before traffic lights"""
-    general_stops_sum, general_cars_sum = 0, 0
-    d = set()
-    stops = deque()
-    result = []
-    for object_frame in objects:
-        lanes = [[] for _ in range(8)]
-        curr_dt = object_frame.rows_data[0].time
-        for car in object_frame.rows_data:
-            if not is_traffic_lane(car.lane) or not check_heading(car.heading) or not check_x(car.point_x):
-                new_stops = []
-                for stop in stops:
-                    if stop[1] != car.obj_id:
-                        new_stops.append(stop)
-                    else:
-                        general_stops_sum -= 1
-                stops = deque(new_stops)
-                if car.obj_id in cars:
-                    del cars[car.obj_id]
+                stops.append(curr_ts)
+
+    pprint([from_micros(ts) for ts in stops])
+
+
+class StopsTracker:
+    """
+    incremental average stops count, one frame at a time.
+
+    cars are keyed by the track key of the shared TrackStore, so a reused
+    radar obj_id starts a new car instead of inheriting the stops of the old one.
+    lane, heading and stop line distance filters come from the sensor SpatialIndex.
+    """
+
+    def __init__(self, keep_history: bool = True, spatial: SpatialIndex | None = None):
+        self.keep_history = keep_history
+        self.spatial = spatial or SpatialIndex.fallback()
+        self.stops = StopsWindow()
+        self.track_store = TrackStore()
+        self.cars = dict()
+        self.traffic_jams = deque(maxlen=JAM_HISTORY)  # starts of
+        self.traffic_jams_end = deque(maxlen=JAM_HISTORY)  # ends of
+        self.traffic_jams_car_ids = set()
+
+    def update(self, object_frame, tracks: FrameTracks | None = None) -> float:
+        """tracks is the TrackStore result for this frame when it is shared with other metrics"""
+        if tracks is None:
+            tracks = self.track_store.update(object_frame)
+        cars = self.cars
+        curr_ts = object_frame.rows_data[0].time
+        classes = self.spatial.classify(object_frame.rows_data)
+        for car, car_id, traffic, heading_ok, stop_dist in zip(
+                object_frame.rows_data, tracks.keys, classes.traffic, classes.heading_ok, classes.stop_dist):
+            if not traffic or not heading_ok or not check_x(stop_dist):
+                self.stops.remove_car(car_id)
+                if car_id in cars:
+                    self._delete_car(car_id)
                 continue
 
-            # старый id привязан к новой машине, не успели почистить
-            if car.obj_id in cars and abs(cars[car.obj_id]["last_point_x"] - car.point_x) >= 100:
-                del cars[car.obj_id]
-
-            if car.obj_id not in cars:
-                cars[car.obj_id] = {
+            if car_id not in cars:
+                self.stops.track(car_id)
+                cars[car_id] = {
                     "last_speed": 0,
                     "stops_cnt": 0,
-                    "last_seen_dt": curr_dt,
-                    "last_stop_dt": None,
+                    "last_seen_ts": curr_ts,
+                    "last_stop_ts": None,
                     "last_point_x": car.point_x,
                     "last_point_x_stop": None,
                     "counted": False,
                 }
 
-            cars[car.obj_id]["last_seen_dt"] = curr_dt
+            cars[car_id]["last_seen_ts"] = curr_ts
 
             # машина останавливается в первый раз
             if car.obj_speed == 0 \
-                        and (cars[car.obj_id]["last_speed"] > 0 or cars[car.obj_id]["last_speed"] is None):
-                cars[car.obj_id]["last_stop_dt"] = curr_dt
-                cars[car.obj_id]["last_point_x_stop"] = car.point_x
+                        and (cars[car_id]["last_speed"] > 0 or cars[car_id]["last_speed"] is None):
+                cars[car_id]["last_stop_ts"] = curr_ts
+                cars[car_id]["last_point_x_stop"] = car.point_x
 
             # все еще стоит какое-то время. считаем за остановку
-            if car.obj_speed == 0 and cars[car.obj_id]["last_stop_dt"] is not None and not cars[car.obj_id]["counted"] \
-                    and (curr_dt - cars[car.obj_id]["last_stop_dt"]).total_seconds() > STOP_TIME_THRESHOLD_SECS:
-                cars[car.obj_id]["stops_cnt"] += 1
-                cars[car.obj_id]["counted"] = True
-                traffic_jams_car_ids.add(car.obj_id)
-                traffic_jams.append(curr_dt)
-                stops.append((cars[car.obj_id]["last_stop_dt"], car.obj_id))
-                general_stops_sum += 1
-                d.add(car.obj_id)
+            if car.obj_speed == 0 and cars[car_id]["last_stop_ts"] is not None and not cars[car_id]["counted"] \
+                    and curr_ts - cars[car_id]["last_stop_ts"] > STOP_TIME_THRESHOLD_SECS * MICROS:
+                cars[car_id]["stops_cnt"] += 1
+                cars[car_id]["counted"] = True
+                self.traffic_jams_car_ids.add(car_id)
+                if self.keep_history:
+                    self.traffic_jams.append(curr_ts)
+                self.stops.add(cars[car_id]["last_stop_ts"], car_id)
 
             # начала двигаться после остановки
-            if car.obj_speed > 1.0 and cars[car.obj_id]["counted"]:
-                cars[car.obj_id]["counted"] = False
-                cars[car.obj_id]["last_stop_dt"] = None
-                cars[car.obj_id]["last_point_x_stop"] = None
-
-            cars[car.obj_id]["last_speed"] = car.obj_speed
-
-        ids_to_delete = []
-        for car_id, car_data in cars.items():
-            last_seen_dt = car_data["last_seen_dt"]
-            if has_left(curr_dt, last_seen_dt):
-                ids_to_delete.append(car_id)
-
-        for car_id in ids_to_delete:
-            if car_id in traffic_jams_car_ids:
-                traffic_jams_end.append(curr_dt)
-                traffic_jams_car_ids.remove(car_id)
-            del cars[car_id]
-
-        avg_stops_sum = calc_avg_stops_count(curr_dt, general_stops_sum, stops, cars.keys())
+            if car.obj_speed > 1.0 and cars[car_id]["counted"]:
+                cars[car_id]["counted"] = False
+                cars[car_id]["last_stop_ts"] = None
+                cars[car_id]["last_point_x_stop"] = None
+
+            cars[car_id]["last_speed"] = car.obj_speed
+
+        # треки уехавших машин закрывает TrackStore
+        for car_id in tracks.ended:
+            if car_id in self.traffic_jams_car_ids:
+                if self.keep_history:
+                    self.traffic_jams_end.append(curr_ts)
+                self.traffic_jams_car_ids.remove(car_id)
+            if car_id in cars:
+                self._delete_car(car_id)
+
+        return self.stops.average(curr_ts)
+
+    def _delete_car(self, car_id: int) -> None:
+        self.stops.untrack(car_id)
+        del self.cars[car_id]
+
+
+def avg_multiple_stops(objects=None, spatial: SpatialIndex | None = None):
+    """calculate time for cars with few stops before traffic lights"""
+    tracker = StopsTracker(spatial=spatial)
+    result = []
+    for object_frame in load_objects(objects):
+        avg_stops_sum = tracker.update(object_frame)
         if avg_stops_sum > 50:
-            print([t for t in cars.keys()])
+            print([t for t in tracker.cars.keys()])
         result.append((object_frame.rows_data[0].time, avg_stops_sum))
     return result
 
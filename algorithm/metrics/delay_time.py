@@ -1,56 +1,47 @@
-import datetime
 from collections import deque
 
 from algorithm.models import Objects
-from backend.data_loader import get_all_objects
+from algorithm.metrics._data import load_objects
+from algorithm.spatial import SpatialIndex
+from algorithm.timestamps import MICROS
+from algorithm.tracks import FrameTracks, TrackStore
 AVG_VALUE_THRESHOLD_MIN = 10
-from backend.data_loader import get_all_objects
-
-objects = get_all_objects()
-cars = dict()
-ids = set()
 
 
 standard_time_seconds = 50  # 200 m / 60 km p h
 
 
-def has_left(curr_dt: datetime.datetime, last_seen_dt: datetime.datetime) -> bool:
-    """car is no longer displayed within the sensor"""
-    time_diff = curr_dt - last_seen_dt
-    seconds = time_diff.total_seconds()
-
-    return seconds >= 10.0
-
+def has_left(curr_ts: int, last_seen_ts: int) -> bool:
+    """car is no longer displayed within the sensor, times in microseconds since epoch"""
+    return curr_ts - last_seen_ts >= 10 * MICROS
 
-def calculate_time(curr_dt: datetime.datetime, first_seen_dt: datetime.datetime) -> float:
-    """from first time of stop to current time"""
-    time_diff = curr_dt - first_seen_dt
-    seconds = time_diff.total_seconds()
 
-    return seconds
+def calculate_time(curr_ts: int, first_seen_ts: int) -> float:
+    """from first time of stop to current time, in seconds"""
+    return (curr_ts - first_seen_ts) / MICROS
 
 
 def is_traffic_lane(lane: int) -> bool:
     return 0 <= lane <= 2
 
 
-def car_time(car_id):
-    min_dt = datetime.datetime(2070, 1, 1)
-    max_dt = datetime.datetime(1970, 1, 1)
+def car_time(car_id, objects=None):
+    min_ts = 100 * 365 * 86400 * MICROS
+    max_ts = 0
 
-    for object_frame in models.objects:
+    for object_frame in load_objects(objects):
         for car in object_frame.rows_data:
             if car.obj_id == car_id:
-                min_dt = min(min_dt, car.time)
-                max_dt = max(max_dt, car.time)
+                min_ts = min(min_ts, car.time)
+                max_ts = max(max_ts, car.time)
 
-    return min_dt, max_dt
+    return min_ts, max_ts
 
 
-def get_max_point_x():
+def get_max_point_x(objects=None):
     x_max = 0
     x_min = 10000
-    for object_frame in models.objects:
+    for object_frame in load_objects(objects):
         for car in object_frame.rows_data:
             if is_traffic_lane(car.lane):
                 x_max = max(car.point_x, x_max)
@@ -67,78 +58,104 @@ def check_heading(angle: int):
     return 160 <= angle <= 200
 
 
-def calc_avg_delay_time(curr_dt: datetime.datetime, avg_sum: float, car_leaves: deque) -> float:
+def calc_avg_delay_time(curr_ts: int, avg_sum: float, car_leaves: deque) -> float:
     if not car_leaves:
         return 0.0
 
-    while len(car_leaves) and car_leaves[0][0] < curr_dt - datetime.timedelta(minutes=AVG_VALUE_THRESHOLD_MIN):
+    while len(car_leaves) and car_leaves[0][0] < curr_ts - AVG_VALUE_THRESHOLD_MIN * 60 * MICROS:
         avg_sum -= car_leaves[0][1]
         car_leaves.popleft()
 
     return avg_sum / len(car_leaves)
 
 
-def calc_time_diff(objects: list[Objects]) -> None:
-    avg_sum = 0
-    car_leaves = deque()
-
-    for object_frame in objects:
-        curr_dt = object_frame.rows_data[0].time
-        for car in object_frame.rows_data:
-            if not is_traffic_lane(car.lane) and check_heading(car.heading):
+class DelayTracker:
+    """
+    incremental delay time, one frame at a time.
+
+    per car only the first and last timestamps within 200 m are kept. cars are
+    keyed by the track key of the shared TrackStore, which also tells when a
+    car has left, so a reused radar obj_id does not stretch the delay of the
+    previous car. the 200 m are measured to the stop line given by the sensor
+    SpatialIndex, which also filters lanes and headings.
+    """
+
+    def __init__(self, spatial: SpatialIndex | None = None):
+        self.spatial = spatial or SpatialIndex.fallback()
+        self.avg_sum = 0
+        self.car_leaves = deque()
+        self.track_store = TrackStore()
+        self.cars = dict()
+
+    def update(self, object_frame, tracks: FrameTracks | None = None) -> tuple[float, float] | None:
+        """
+        returns (avg_delay_time, avg_delay_time_mins) if some cars left on this frame.
+        tracks is the TrackStore result for this frame when it is shared with other metrics
+        """
+        if tracks is None:
+            tracks = self.track_store.update(object_frame)
+        cars = self.cars
+        curr_ts = object_frame.rows_data[0].time
+        classes = self.spatial.classify(object_frame.rows_data)
+        for car, car_id, lane, traffic, heading_ok, stop_dist in zip(
+                object_frame.rows_data, tracks.keys, classes.lane, classes.traffic, classes.heading_ok,
+                classes.stop_dist):
+            if not traffic and heading_ok:
                 continue
 
-            if car.obj_id not in cars:
-                cars[car.obj_id] = {
+            car_data = cars.get(car_id)
+            if car_data is None:
+                car_data = cars[car_id] = {
                     "from_beginning": False,
-                    "time_entries": []
+                    "first_seen": None,
+                    "last_seen": None,
+                    "first_lane": None,
                 }
 
-            if car.point_x >= 200:
-                cars[car.obj_id]["from_beginning"] = True
-            if car.point_x <= 200:
-                cars[car.obj_id]["time_entries"].append((car.time, car.obj_speed, car.lane))
-
-            if car.obj_speed == 0:
-                ids.add(car.obj_id)
+            if stop_dist >= 200:
+                car_data["from_beginning"] = True
+            if stop_dist <= 200:
+                if car_data["first_seen"] is None:
+                    car_data["first_seen"] = car.time
+                    car_data["first_lane"] = lane
+                car_data["last_seen"] = car.time
 
         sum_delay, sum_cars = 0, 0
-        ids_to_delete = []
-
-        for car_id, car_data in cars.items():
-            from_beginning = car_data["from_beginning"]
-            car = car_data["time_entries"]
-            if car:
-                first_seen_dt = car[0][0]
-                last_seen_dt = car[-1][0]
-
-                if has_left(curr_dt, last_seen_dt):
-                    if from_beginning and is_traffic_lane(car[0][2]):
-                        time_diff = calculate_time(last_seen_dt, first_seen_dt)
-                        delay = time_diff - standard_time_seconds
-                        sum_delay += delay
-                        avg_sum += delay
-                        sum_cars += 1
-                        car_leaves.append((curr_dt, delay))
-
-                    ids_to_delete.append(car_id)
-
-        for car_id in ids_to_delete:
-            del cars[car_id]
-
-        if sum_cars:
-            avg_delay_time_mins = max(0, calc_avg_delay_time(curr_dt, avg_sum, car_leaves))
-            avg_delay_time = sum_delay / (sum_cars if sum_cars else 1)
-            print(f"avg_delay_time: {avg_delay_time}, avg_delay_time_mins: {avg_delay_time_mins} for "
-                  f"{AVG_VALUE_THRESHOLD_MIN}min")
-
-
-# print(cars)
-calc_time_diff(objects)
-# print(ids)
-# print(car_time(car_id=67))
-# print(get_max_point_x())
-
-# avg_delay_time, sum_delay_time, std_delay_time
-
-
+        for car_id in tracks.ended:
+            car_data = cars.pop(car_id, None)
+            if car_data is None or car_data["first_seen"] is None:
+                continue
+            if car_data["from_beginning"] and car_data["first_lane"] in self.spatial.traffic_lanes:
+                time_diff = calculate_time(car_data["last_seen"], car_data["first_seen"])
+                delay = time_diff - standard_time_seconds
+                sum_delay += delay
+                self.avg_sum += delay
+                sum_cars += 1
+                self.car_leaves.append((curr_ts, delay))
+
+        if not sum_cars:
+            return None
+        avg_delay_time_mins = max(0, calc_avg_delay_time(curr_ts, self.avg_sum, self.car_leaves))
+        avg_delay_time = sum_delay / (sum_cars if sum_cars else 1)
+        return avg_delay_time, avg_delay_time_mins
+
+
+def calc_time_diff(objects: list[Objects] | None = None, spatial: SpatialIndex | None = None) -> list[dict]:
+    tracker = DelayTracker(spatial)
+    result = []
+    for object_frame in load_objects(objects):
+        delays = tracker.update(object_frame)
+        if delays:
+            avg_delay_time, avg_delay_time_mins = delays
+            result.append({
+                "time": object_frame.rows_data[0].time,
+                "avg_delay_time": avg_delay_time,
+                "avg_delay_time_mins": avg_delay_time_mins,
+            })
+    return result
+
+
+if __name__ == "__main__":
+    for item in calc_time_diff():
+        print(f"avg_delay_time: {item['avg_delay_time']}, avg_delay_time_mins: {item['avg_delay_time_mins']} for "
+              f"{AVG_VALUE_THRESHOLD_MIN}min")
@@ -1,28 +1,21 @@
-import datetime
 from collections import deque
 from pprint import pprint
 
-from algorithm.json_to_models import main
-
-models = main()
+from algorithm.metrics._data import load_objects
+from algorithm.metrics.avg_stops_count import StopsWindow
+from algorithm.spatial import SpatialIndex
+from algorithm.timestamps import MICROS, from_micros
+from algorithm.tracks import FrameTracks, TrackStore
 
 STOP_TIME_THRESHOLD_SECS = 5
 AVG_STOPS_VALUE_THRESHOLD_MIN = 5
+# how many jam starts and ends QueueStopsTracker keeps
+JAM_HISTORY = 10000
 
-traffic_jams = []  # starts of
-traffic_jams_end = []  # ends of
-lanes = [[] for _ in range(8)]  # (point_x, speed, id)
-cars = dict()
-cars_speed = dict()
-traffic_jams_car_ids = set()
-
-
-def has_left(curr_dt: datetime.datetime, last_seen_dt: datetime.datetime) -> bool:
-    """car is no longer displayed within the sensor"""
-    time_diff = curr_dt - last_seen_dt
-    seconds = time_diff.total_seconds()
 
-    return seconds >= 10.0
+def has_left(curr_ts: int, last_seen_ts: int) -> bool:
+    """car is no longer displayed within the sensor, times in microseconds since epoch"""
+    return curr_ts - last_seen_ts >= 10 * MICROS
 
 
 def check_heading(angle: int):
@@ -33,104 +26,108 @@ def is_traffic_lane(lane: int) -> bool:
     return 0 <= lane <= 2
 
 
-def calc_avg_stops_count(curr_dt: datetime.datetime, avg_sum: float, stops: deque) -> float:
-    if not stops:
-        return 0.0
-
-    while len(stops) and stops[0][0] < curr_dt - datetime.timedelta(minutes=AVG_STOPS_VALUE_THRESHOLD_MIN):
-        avg_sum -= 1
-        stops.popleft()
-
-    print('car_len: ', len(set([stop[1] for stop in stops])))
-    return avg_sum / len(set([stop[1] for stop in stops]))
+def calc_avg_stops_count(curr_ts: int, stops: StopsWindow) -> float:
+    """average stops per car over the cars that stopped within the window"""
+    stops.expire(curr_ts)
+    return stops.size / len(stops.counts) if stops.counts else 0.0
 
 
-def get_all_car_stops_by_id(car_id: int) -> None:
+def get_all_car_stops_by_id(car_id: int, objects=None) -> None:
     stops = []
-    for object_frame in models.objects:
-        curr_dt = object_frame.rows_data[0].time
+    for object_frame in load_objects(objects):
+        curr_ts = object_frame.rows_data[0].time
         for car in object_frame.rows_data:
             if car.obj_id == car_id and car.obj_speed == 0:
-                stops.append(curr_dt)
-
-    pprint(stops)
-
-
-def avg_multiple_stops():
-    """calculate time for cars with few stops before traffic lights"""
-    general_stops_sum, general_cars_sum = 0, 0
-    d = set()
-    stops = deque()
-
-    for object_frame in models.objects:
-        lanes = [[] for _ in range(8)]
-        curr_dt = object_frame.rows_data[0].time
-        for car in object_frame.rows_data:
-            if not is_traffic_lane(car.lane) and check_heading(car.heading):
+                stops.append(curr_ts)
+
+    pprint([from_micros(ts) for ts in stops])
+
+
+class QueueStopsTracker:
+    """stops of cars waiting in the queue, one frame at a time, keyed by TrackStore track keys"""
+
+    def __init__(self, spatial: SpatialIndex | None = None):
+        self.spatial = spatial or SpatialIndex.fallback()
+        self.stops = StopsWindow(AVG_STOPS_VALUE_THRESHOLD_MIN)
+        self.track_store = TrackStore()
+        self.cars = dict()
+        self.traffic_jams = deque(maxlen=JAM_HISTORY)  # starts of
+        self.traffic_jams_end = deque(maxlen=JAM_HISTORY)  # ends of
+        self.traffic_jams_car_ids = set()
+
+    def update(self, object_frame, tracks: FrameTracks | None = None) -> float:
+        """tracks is the TrackStore result for this frame when it is shared with other metrics"""
+        if tracks is None:
+            tracks = self.track_store.update(object_frame)
+        cars = self.cars
+        curr_ts = object_frame.rows_data[0].time
+        classes = self.spatial.classify(object_frame.rows_data)
+        for car, car_id, traffic, heading_ok in zip(
+                object_frame.rows_data, tracks.keys, classes.traffic, classes.heading_ok):
+            if not traffic and heading_ok:
                 continue
 
-            # старый id привязан к новой машине, не успели почистить
-            if car.obj_id in cars and abs(cars[car.obj_id]["last_point_x"] - car.point_x) >= 100:
-                del cars[car.obj_id]
-
-            if car.obj_id not in cars:
-                cars[car.obj_id] = {
+            if car_id not in cars:
+                cars[car_id] = {
                     "last_speed": 0,
                     "stops_cnt": 0,
-                    "last_seen_dt": curr_dt,
-                    "last_stop_dt": None,
+                    "last_seen_ts": curr_ts,
+                    "last_stop_ts": None,
                     "last_point_x": car.point_x,
                     "last_point_x_stop": None,
                     "counted": False,
                 }
 
-            cars[car.obj_id]["last_seen_dt"] = curr_dt
+            cars[car_id]["last_seen_ts"] = curr_ts
 
             # машина останавливается в первый раз
             if car.obj_speed == 0 \
-                        and (cars[car.obj_id]["last_speed"] > 0 or cars[car.obj_id]["last_speed"] is None):
-                cars[car.obj_id]["last_stop_dt"] = curr_dt
-                cars[car.obj_id]["last_point_x_stop"] = car.point_x
+                        and (cars[car_id]["last_speed"] > 0 or cars[car_id]["last_speed"] is None):
+                cars[car_id]["last_stop_ts"] = curr_ts
+                cars[car_id]["last_point_x_stop"] = car.point_x
 
             # все еще стоит какое-то время. считаем за остановку
-            if car.obj_speed == 0 and cars[car.obj_id]["last_stop_dt"] is not None and not cars[car.obj_id]["counted"] \
-                    and (curr_dt - cars[car.obj_id]["last_stop_dt"]).total_seconds() > STOP_TIME_THRESHOLD_SECS:
-                cars[car.obj_id]["stops_cnt"] += 1
-                cars[car.obj_id]["counted"] = True
-                traffic_jams_car_ids.add(car.obj_id)
-                traffic_jams.append(curr_dt)
-                stops.append((cars[car.obj_id]["last_stop_dt"], car.obj_id))
-                general_stops_sum += 1
-                d.add(car.obj_id)
+            if car.obj_speed == 0 and cars[car_id]["last_stop_ts"] is not None and not cars[car_id]["counted"] \
+                    and curr_ts - cars[car_id]["last_stop_ts"] > STOP_TIME_THRESHOLD_SECS * MICROS:
+                cars[car_id]["stops_cnt"] += 1
+                cars[car_id]["counted"] = True
+                self.traffic_jams_car_ids.add(car_id)
+                self.traffic_jams.append(curr_ts)
+                self.stops.add(cars[car_id]["last_stop_ts"], car_id)
 
             # начала двигаться после остановки
-            if car.obj_speed > 0 and cars[car.obj_id]["counted"]:
-                cars[car.obj_id]["counted"] = False
-                cars[car.obj_id]["last_stop_dt"] = None
-                cars[car.obj_id]["last_point_x_stop"] = None
-
-            cars[car.obj_id]["last_speed"] = car.obj_speed
-
-        ids_to_delete = []
-        for car_id, car_data in cars.items():
-            last_seen_dt = car_data["last_seen_dt"]
-            if has_left(curr_dt, last_seen_dt):
-                ids_to_delete.append(car_id)
-
-        for car_id in ids_to_delete:
-            if car_id in traffic_jams_car_ids:
-                traffic_jams_end.append(curr_dt)
-                traffic_jams_car_ids.remove(car_id)
-            del cars[car_id]
-
-        avg_stops_sum = calc_avg_stops_count(curr_dt, general_stops_sum, stops)
-        print(f"avg_stops_sum: {avg_stops_sum}")
+            if car.obj_speed > 0 and cars[car_id]["counted"]:
+                cars[car_id]["counted"] = False
+                cars[car_id]["last_stop_ts"] = None
+                cars[car_id]["last_point_x_stop"] = None
+
+            cars[car_id]["last_speed"] = car.obj_speed
 
+        # треки уехавших машин закрывает TrackStore
+        for car_id in tracks.ended:
+            if car_id in self.traffic_jams_car_ids:
+                self.traffic_jams_end.append(curr_ts)
+                self.traffic_jams_car_ids.remove(car_id)
+            cars.pop(car_id, None)
 
-def calc_queue_time_for_lanes():
-    for object_frame in models.objects:
-        lanes = [[] for _ in range(8)]
-        curr_dt = object_frame.rows_data[0].time
+        return calc_avg_stops_count(curr_ts, self.stops)
+
+
+def avg_multiple_stops(objects=None, spatial: SpatialIndex | None = None) -> list:
+    """calculate time for cars with few stops before traffic lights"""
+    tracker = QueueStopsTracker(spatial)
+    result = []
+    for object_frame in load_objects(objects):
+        result.append((object_frame.rows_data[0].time, tracker.update(object_frame)))
+    return result
+
+
+def calc_queue_time_for_lanes(objects=None) -> None:
+    cars_speed = dict()
+    traffic_jams = []
+    for object_frame in load_objects(objects):
+        lanes = [[] for _ in range(8)]  # (point_x, speed, id)
+        curr_ts = object_frame.rows_data[0].time
         for car in object_frame.rows_data:
             if not is_traffic_lane(car.lane) and check_heading(car.heading):
                 continue
@@ -141,7 +138,7 @@ def calc_queue_time_for_lanes():
             cars_speed[car.obj_id].append((car.obj_speed, car.lane, car.point_x))
 
             if car.obj_speed == 0:
-                traffic_jams.append(curr_dt)
+                traffic_jams.append(curr_ts)
 
             lanes[car.lane].append((car.point_x, car.obj_speed, car.obj_id))
 
@@ -154,6 +151,8 @@ def calc_queue_time_for_lanes():
     # pprint(cars_speed)
 
 
-avg_multiple_stops()
-# calc_queue_time()
-# get_all_car_stops_by_id(136)
+if __name__ == "__main__":
+    for ts, avg_stops_sum in avg_multiple_stops():
+        print(f"avg_stops_sum: {avg_stops_sum}")
+    # calc_queue_time_for_lanes()
+    # get_all_car_stops_by_id(136)
@@ -1,6 +1,5 @@
 from typing import List, Optional, Dict, Any, Union
 from pydantic import BaseModel, Field
-from datetime import datetime
 import uuid
 
 
@@ -113,7 +112,7 @@ class RowData(BaseModel):
     point_y: Union[float, int] = Field(default=0.0)
     quality: int = Field(default=0)
     sensor_id: str
-    time: Union[datetime, str]
+    time: int  # микросекунды от эпохи, см. algorithm.timestamps
     uuid: str = Field(default_factory=lambda: str(uuid.uuid4()))
 
 
@@ -162,3 +161,15 @@ class SensorConfig(BaseModel):
     type_name: TypeName
     xM: Union[float, int]
     yM: Union[float, int]
+
+    @property
+    def sensor_id(self) -> str:
+        """Идентификатор сенсора, к которому относится конфигурация"""
+        for lane in self.road_sensor_lanes:
+            return lane.sensor_id
+        return self.dividing_line_obj.sensor_id
+
+    @property
+    def lane_indexes(self) -> List[int]:
+        """Номера полос сенсора из road_sensor_lanes"""
+        return sorted({lane.lane_index for lane in self.road_sensor_lanes})
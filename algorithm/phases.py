@@ -0,0 +1,224 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from algorithm.models import SensorConfig
+
+# Расстояние между машинами в очереди, м: переводит длину очереди в число машин
+VEHICLE_SPACING = 7.0
+# Задержка, при которой вес машины удваивается, секунды
+DELAY_NORM = 60.0
+# Шаг округления весов: одинаковые после округления наборы весов решаются один раз
+WEIGHT_STEP = 0.5
+# Сколько решений помнит PhaseOptimizer
+CACHE_SIZE = 4096
+# Цикл светофора и минимальный зеленый на фазу, секунды
+CYCLE_SECS = 90.0
+MIN_GREEN_SECS = 10.0
+MAX_PHASES = 4
+
+
+class Movement(NamedTuple):
+    """Направление движения: полоса подхода к перекрестку"""
+    sensor_id: str
+    lane: int
+    approach: int  # сторона подхода, 0-3 по часовой стрелке
+    turn: str  # left, through или right
+
+
+def _lane_turns(lanes: List[int]) -> Dict[int, str]:
+    # Полоса у разделительной линии - левый поворот, крайняя - правый, остальные прямо
+    if len(lanes) == 1:
+        return {lanes[0]: 'through'}
+    turns = {lane: 'through' for lane in lanes}
+    turns[lanes[-1]] = 'left'
+    if len(lanes) > 2:
+        turns[lanes[0]] = 'right'
+    return turns
+
+
+def movements_from_config(config: SensorConfig, approach: Optional[int] = None) -> List[Movement]:
+    """
+    Направления движения одного подхода по конфигурации сенсора
+
+    Полосы подхода - полосы с direction < 0 по эту сторону разделительной линии:
+    до dividing_line_obj.follow_index и без флага dividing_line.
+
+    Args:
+        config (SensorConfig): Конфигурация сенсора
+        approach (Optional[int]): Сторона подхода, по умолчанию sensor_road_direction
+
+    Returns:
+        List[Movement]: Направления по полосам подхода
+    """
+    divider = config.dividing_line_obj.follow_index
+    lanes = sorted(lane.lane_index for lane in config.road_sensor_lanes
+                   if lane.direction < 0 and not lane.dividing_line and lane.lane_index <= divider)
+    if not lanes:
+        return []
+    approach = config.sensor_road_direction if approach is None else approach
+    return [Movement(config.sensor_id, lane, approach % 4, turn) for lane, turn in _lane_turns(lanes).items()]
+
+
+def compatible(a: Movement, b: Movement) -> bool:
+    """
+    Могут ли два направления ехать на один зеленый при правостороннем движении:
+    полосы одного подхода, встречные прямо и направо, встречные левые повороты
+    и правые повороты с соседних подходов
+    """
+    side = (b.approach - a.approach) % 4
+    if side == 0:
+        return True
+    if side == 2:
+        return (a.turn == 'left') == (b.turn == 'left')
+    return a.turn == 'right' and b.turn == 'right'
+
+
+def compatibility_masks(movements: Sequence[Movement]) -> List[int]:
+    """Битовые маски смежности графа совместимых направлений"""
+    masks = [0] * len(movements)
+    for i, a in enumerate(movements):
+        for j in range(i + 1, len(movements)):
+            if compatible(a, movements[j]):
+                masks[i] |= 1 << j
+                masks[j] |= 1 << i
+    return masks
+
+
+def movement_weight(lane: dict) -> float:
+    """Вес направления: число машин в очереди, взвешенное их задержкой"""
+    vehicles = (lane.get('queueLength') or 0.0) / VEHICLE_SPACING
+    return vehicles * (1.0 + max(lane.get('delay') or 0.0, 0.0) / DELAY_NORM)
+
+
+def max_weight_clique(weights: Sequence[float], adjacency: Sequence[int],
+                      candidates: Optional[int] = None) -> Tuple[float, int]:
+    """
+    Точная клика максимального веса методом ветвей и границ на битовых масках.
+
+    Граница - сумма максимальных весов классов жадной раскраски кандидатов:
+    клика берет не больше одной вершины из каждого независимого множества.
+    Вершины перебираются от последнего класса раскраски к первому, поэтому,
+    как только граница не лучше найденного, отсекается вся оставшаяся ветка.
+
+    Args:
+        weights (Sequence[float]): Неотрицательные веса вершин
+        adjacency (Sequence[int]): Битовые маски соседей вершин
+        candidates (Optional[int]): Маска вершин, среди которых ищется клика, по умолчанию все
+
+    Returns:
+        Tuple[float, int]: Вес клики и ее битовая маска
+    """
+    n = len(weights)
+    order = sorted(range(n), key=lambda v: -weights[v])
+    best = [0.0, 0]
+
+    def expand(clique: int, weight: float, pool: int) -> None:
+        if not pool:
+            if weight > best[0]:
+                best[0], best[1] = weight, clique
+            return
+        # Жадная раскраска: вершина идет в первый класс, где у нее нет соседей
+        classes: List[int] = []
+        colored: List[Tuple[int, int]] = []
+        for v in order:
+            if not pool >> v & 1:
+                continue
+            for k, members in enumerate(classes):
+                if not members & adjacency[v]:
+                    classes[k] |= 1 << v
+                    break
+            else:
+                k = len(classes)
+                classes.append(1 << v)
+            colored.append((k, v))
+        # Вершины одного класса идут в порядке убывания веса, первая - максимум класса
+        class_max, bound = [], 0.0
+        for members in classes:
+            top = next(v for v in order if members >> v & 1)
+            bound += weights[top]
+            class_max.append(bound)
+        colored.sort(key=lambda kv: kv[0])
+        for k, v in reversed(colored):
+            if weight + class_max[k] <= best[0]:
+                return
+            expand(clique | 1 << v, weight + weights[v], pool & adjacency[v])
+            pool &= ~(1 << v)
+        if weight > best[0]:
+            best[0], best[1] = weight, clique
+
+    expand(0, 0.0, ((1 << n) - 1) if candidates is None else candidates)
+    return best[0], best[1]
+
+
+class PhaseOptimizer:
+    """
+    Рекомендация фаз светофора по весам направлений.
+
+    Первая фаза - клика максимального веса в графе совместимых направлений,
+    следующие - клики среди еще не обслуженных направлений, дополненные
+    совместимыми уже обслуженными. Решения кэшируются по округленным до
+    WEIGHT_STEP весам: от цикла к циклу веса часто повторяются, особенно
+    нулевые у пустых полос, и такие циклы не решаются заново.
+    """
+
+    def __init__(self, movements: Sequence[Movement]):
+        self.movements = list(movements)
+        self.index = {(m.sensor_id, m.lane): i for i, m in enumerate(self.movements)}
+        self.adjacency = compatibility_masks(self.movements)
+        self.cache: OrderedDict = OrderedDict()
+        self.hits = 0
+
+    @classmethod
+    def from_configs(cls, configs: Iterable[SensorConfig]) -> 'PhaseOptimizer':
+        return cls([movement for config in configs for movement in movements_from_config(config)])
+
+    def _plan(self, weights: Tuple[float, ...]) -> List[Tuple[int, float]]:
+        n = len(weights)
+        phases = []
+        waiting = sum(1 << v for v in range(n) if weights[v] > 0)
+        served = 0
+        while waiting and len(phases) < MAX_PHASES:
+            weight, clique = max_weight_clique(weights, self.adjacency, waiting)
+            if not clique:
+                break
+            # Добираем в фазу совместимые направления, уже получившие зеленый
+            for v in range(n):
+                if served >> v & 1 and all(self.adjacency[v] >> u & 1 for u in range(n) if clique >> u & 1):
+                    clique |= 1 << v
+            phases.append((clique, weight))
+            served |= clique
+            waiting &= ~clique
+        return phases
+
+    def recommend(self, lanes: Dict[Tuple[str, int], dict]) -> List[dict]:
+        """
+        Фазы на следующий цикл по текущим метрикам полос
+
+        Args:
+            lanes (Dict[Tuple[str, int], dict]): Метрики полос (queueLength, delay) по (sensor_id, полоса)
+
+        Returns:
+            List[dict]: Фазы по убыванию веса: направления, вес и рекомендуемый зеленый в секундах
+        """
+        weights = [0.0] * len(self.movements)
+        for key, lane in lanes.items():
+            if key in self.index:
+                weights[self.index[key]] = round(movement_weight(lane) / WEIGHT_STEP) * WEIGHT_STEP
+        key = tuple(weights)
+        plan = self.cache.get(key)
+        if plan is None:
+            plan = self._plan(key)
+            self.cache[key] = plan
+            if len(self.cache) > CACHE_SIZE:
+                self.cache.popitem(last=False)
+        else:
+            self.hits += 1
+            self.cache.move_to_end(key)
+
+        total = sum(weight for _, weight in plan)
+        spare = max(CYCLE_SECS - MIN_GREEN_SECS * len(plan), 0.0)
+        return [{
+            'movements': [self.movements[v] for v in range(len(self.movements)) if clique >> v & 1],
+            'weight': weight,
+            'green': MIN_GREEN_SECS + (spare * weight / total if total else spare / len(plan)),
+        } for clique, weight in plan]
@@ -1,12 +1,22 @@
+import numpy as np
+
 from algorithm.models import RowData, Objects
+from algorithm.frames import FrameStore
+from algorithm.timestamps import MICROS
+from algorithm.metrics.delay_time import standard_time_seconds
+from algorithm.tracks import MAX_LANE_JUMP, MAX_SPEED, POSITION_MARGIN, TRACK_GAP_SECS, FrameTracks, TrackStore
 
 LANES = [0, 1, 2]
+# Скорость свободного потока, м/с: 200 м зоны за standard_time_seconds
+FREE_FLOW_SPEED = 200 / standard_time_seconds
 
-def separate_row_by_lane(rows: list[RowData]):
-    rows_by_lane = {lane: [] for lane in LANES}
+def separate_row_by_lane(rows: list[RowData], lanes: list[int] = LANES):
+    rows_by_lane = {lane: [] for lane in lanes}
     for row in rows:
         if row.lane in rows_by_lane:
             rows_by_lane[row.lane].append(row) 
+    for lane_rows in rows_by_lane.values():
+        lane_rows.sort(key=lambda row: row.point_x)
     return rows_by_lane
 
 def get_queue_start(rows: list[RowData]) -> RowData | None:
@@ -27,11 +37,220 @@ def get_queue_end(rows: list[RowData]) -> RowData | None:
     return None
 
 
-def is_car_going(row_data: RowData)
+def _track_starts(store: FrameStore) -> np.ndarray:
+    """
+    Для каждой строки хранилища возвращает индекс строки, с которой начался трек машины.
+    Правила разбиения на треки те же, что и в TrackStore
+    """
+    c = store.columns
+    n = store.n_rows
+    if not n:
+        return np.zeros(0, dtype=np.int64)
+    obj_id = c['obj_id'].astype(np.int64)
+    ts = c['time']
+    id_min, t_min = obj_id.min(), ts.min()
+    id_span, t_span = int(obj_id.max() - id_min) + 1, int(ts.max() - t_min) + 1
+    if id_span * t_span < np.iinfo(np.int64).max:
+        # Как и в calculate_lane_metrics, один составной ключ вместо lexsort
+        order = np.argsort((obj_id - id_min) * t_span + (ts - t_min), kind='stable')
+    else:
+        order = np.lexsort((ts, obj_id))
+    sorted_ids, sorted_ts = obj_id[order], ts[order]
+    elapsed = np.diff(sorted_ts) / MICROS
+    new_track = np.r_[True, (sorted_ids[1:] != sorted_ids[:-1])
+                      | (elapsed >= TRACK_GAP_SECS)
+                      | (np.abs(np.diff(c['point_x'][order])) > POSITION_MARGIN + MAX_SPEED * elapsed)
+                      | (np.abs(np.diff(c['lane'][order].astype(np.int64))) > MAX_LANE_JUMP)]
+    first = np.maximum.accumulate(np.where(new_track, np.arange(n), 0))
+    starts = np.empty(n, dtype=np.int64)
+    starts[order] = order[first]
+    return starts
+
+
+def row_delays(store: FrameStore) -> np.ndarray:
+    """
+    Задержка каждой машины на момент строки: время с начала трека минус время,
+    за которое пройденное расстояние проезжается со скоростью FREE_FLOW_SPEED
+    """
+    c = store.columns
+    starts = _track_starts(store)
+    elapsed = (c['time'] - c['time'][starts]) / MICROS
+    travelled = np.abs(c['point_x'] - c['point_x'][starts])
+    return np.maximum(elapsed - travelled / FREE_FLOW_SPEED, 0.0)
+
+
+def calculate_lane_metrics(store: FrameStore, lanes: list[int] = LANES) -> dict:
+    """
+    Считает все метрики полос для каждого кадра за один проход по строкам.
+
+    Строки явно сортируются по (кадр, полоса, point_x), после чего начало очереди -
+    первая стоящая машина сегмента, а конец - первая движущаяся машина за ней
+    (или последняя машина сегмента). Скорость потока - средняя скорость
+    движущихся машин сегмента, задержка - средняя задержка машин сегмента
+    (см. row_delays). Все величины считаются сегментными редукциями reduceat
+    по одной и той же сортировке. Длительность очереди - время с кадра,
+    начиная с которого очередь на полосе не пропадала.
+
+    Args:
+        store (FrameStore): Колоночный блок кадров
+        lanes (list[int]): Номера полос
+
+    Returns:
+        dict: Для каждой полосы массивы длины len(store): ts, has_rows,
+        start_row/end_row (индекс строки в store или -1), start_id/end_id,
+        start_x/end_x, length в метрах, duration в секундах, flow_speed в м/с
+        и delay в секундах
+    """
+    n_frames, n_lanes = len(store), len(lanes)
+    c = store.columns
+    lanes_arr = np.asarray(lanes, dtype=c['lane'].dtype)
+    lane_order = np.argsort(lanes_arr)
+
+    lane_pos = np.searchsorted(lanes_arr[lane_order], c['lane'])
+    lane_pos = np.minimum(lane_pos, n_lanes - 1)
+    valid = lanes_arr[lane_order][lane_pos] == c['lane']
+    rows = np.flatnonzero(valid)
+    seg = store.frame_index[rows] * n_lanes + lane_order[lane_pos[rows]]
+    if len(rows):
+        # Один составной ключ сортируется заметно быстрее, чем lexsort по двум колонкам
+        x = c['point_x'][rows]
+        x_min = x.min()
+        order = np.argsort(seg * (x.max() - x_min + 1.0) + (x - x_min), kind='stable')
+        rows, seg = rows[order], seg[order]
+
+    start_row = np.full(n_frames * n_lanes, -1, dtype=np.int64)
+    end_row = np.full(n_frames * n_lanes, -1, dtype=np.int64)
+    has_rows = np.zeros(n_frames * n_lanes, dtype=bool)
+    flow_speed = np.zeros(n_frames * n_lanes)
+    delay = np.zeros(n_frames * n_lanes)
+
+    n = len(rows)
+    if n:
+        pos = np.arange(n)
+        seg_starts = np.flatnonzero(np.r_[True, seg[1:] != seg[:-1]])
+        seg_lens = np.diff(np.r_[seg_starts, n])
+        seg_last = seg_starts + seg_lens - 1
+        speed = c['obj_speed'][rows]
+        stopped = speed == 0
+        moving = speed > 0
+
+        first_stop = np.minimum.reduceat(np.where(stopped, pos, n), seg_starts)
+        after_stop = ~stopped & (pos > np.repeat(first_stop, seg_lens))
+        first_move = np.minimum.reduceat(np.where(after_stop, pos, n), seg_starts)
+        speed_sum = np.add.reduceat(np.where(moving, speed, 0.0), seg_starts)
+        moving_count = np.add.reduceat(moving.astype(np.int64), seg_starts)
+        delay_sum = np.add.reduceat(row_delays(store)[rows], seg_starts)
+
+        found = first_stop < n
+        ids = seg[seg_starts]
+        has_rows[ids] = True
+        start_row[ids[found]] = rows[first_stop[found]]
+        end_row[ids[found]] = rows[np.where(first_move < n, first_move, seg_last)[found]]
+        # obj_speed в км/ч, скорость потока отдаем в м/с
+        flow_speed[ids] = np.where(moving_count > 0, speed_sum / np.maximum(moving_count, 1) / 3.6, 0.0)
+        delay[ids] = delay_sum / seg_lens
+
+    ts = store.frame_times
+    frame_pos = np.arange(n_frames)
+    result = {}
+    for i, lane in enumerate(lanes):
+        lane_start = start_row[i::n_lanes]
+        lane_end = end_row[i::n_lanes]
+        found = lane_start >= 0
+        start_x = np.where(found, c['point_x'][lane_start], np.nan)
+        end_x = np.where(found, c['point_x'][lane_end], np.nan)
+        formed = found & ~np.r_[False, found[:-1]]
+        since = np.maximum.accumulate(np.where(formed, frame_pos, 0))
+        result[lane] = {
+            'ts': ts,
+            'has_rows': has_rows[i::n_lanes],
+            'start_row': lane_start,
+            'end_row': lane_end,
+            'start_id': np.where(found, c['obj_id'][lane_start], -1),
+            'end_id': np.where(found, c['obj_id'][lane_end], -1),
+            'start_x': start_x,
+            'end_x': end_x,
+            'length': np.where(found, np.abs(end_x - start_x), 0.0),
+            'duration': np.where(found, (ts - ts[since]) / MICROS, 0.0) if n_frames else np.zeros(0),
+            'flow_speed': flow_speed[i::n_lanes],
+            'delay': delay[i::n_lanes],
+        }
+    return result
+
+
+class LaneMetricsTracker:
+    """
+    Потоковая версия calculate_lane_metrics: те же метрики полос по одному кадру.
+
+    Начало трека каждой машины (время и point_x) берется из TrackStore. Для
+    каждой полосы хранится время кадра, с которого держится текущая очередь.
+    """
+
+    def __init__(self, lanes: list[int] = LANES, track_store: TrackStore | None = None):
+        self.lanes = lanes
+        self.track_store = track_store if track_store is not None else TrackStore()
+        self.queue_since = {}
+
+    def _row_delay(self, row, slot: int) -> float:
+        store = self.track_store
+        elapsed = (row.time - store.first_time[slot]) / MICROS
+        return max(elapsed - abs(row.point_x - store.first_x[slot]) / FREE_FLOW_SPEED, 0.0)
+
+    def update(self, frame: Objects, tracks: FrameTracks | None = None) -> list[dict]:
+        """
+        Обрабатывает один кадр
+
+        Args:
+            frame (Objects): Кадр с сенсора
+            tracks (FrameTracks | None): Результат self.track_store.update для этого кадра,
+            если трекер разделяет TrackStore с другими метриками и кадр уже сопоставлен
+
+        Returns:
+            list[dict]: По полосам: laneId, carStartId, carEndId, queueStart, queueEnd,
+            queueLength, queueDuration, flowSpeed, delay и carCount
+        """
+        if tracks is None:
+            tracks = self.track_store.update(frame)
+        frame_time = frame.rows_data[0].time
+        delays = {id(row): self._row_delay(row, slot) for row, slot in zip(frame.rows_data, tracks.slots)}
+        result = []
+        for lane, rows in separate_row_by_lane(frame.rows_data, self.lanes).items():
+            start = get_queue_start(rows)
+            end = get_queue_end(rows)
+            moving = [row.obj_speed for row in rows if row.obj_speed > 0]
+            if start:
+                self.queue_since.setdefault(lane, frame_time)
+            else:
+                self.queue_since.pop(lane, None)
+            result.append({
+                'laneId': lane,
+                'carStartId': start.obj_id if start else None,
+                'carEndId': end.obj_id if end else None,
+                'queueStart': start.point_x if start else None,
+                'queueEnd': end.point_x if end else None,
+                'queueLength': abs(end.point_x - start.point_x) if start and end else 0,
+                'queueDuration': (frame_time - self.queue_since[lane]) / MICROS if start else 0,
+                # obj_speed в км/ч, скорость потока отдаем в м/с
+                'flowSpeed': sum(moving) / len(moving) / 3.6 if moving else 0,
+                'delay': sum(delays[id(row)] for row in rows) / len(rows) if rows else 0,
+                'carCount': len(rows),
+            })
+        return result
+
 
-cars = dict()
-def calculate_queue_meters(objects: list[Objects]):
+def calculate_queue_meters(objects: list[Objects] | FrameStore):
     result = {lane: {'starts': [], 'ends': [], 'ts': []} for lane in LANES}
+    if isinstance(objects, FrameStore):
+        boundaries = calculate_lane_metrics(objects)
+        frame_times = objects.frame_times
+        for lane in LANES:
+            data = boundaries[lane]
+            for i in np.flatnonzero(data['has_rows']):
+                start_row, end_row = data['start_row'][i], data['end_row'][i]
+                result[lane]['starts'].append(objects.row(start_row) if start_row >= 0 else None)
+                result[lane]['ends'].append(objects.row(end_row) if end_row >= 0 else None)
+                result[lane]['ts'].append(int(frame_times[i]))
+        return result
     for obj in objects:
         rows_by_lane = separate_row_by_lane(obj.rows_data)
         for lane, rows in rows_by_lane.items():
@@ -0,0 +1,385 @@
+import threading
+from collections import deque
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from algorithm.timestamps import MICROS
+
+# Разрешения агрегатов в секундах, каждое кратно предыдущему
+RESOLUTIONS = {'1s': 1, '10s': 10, '1min': 60, '5min': 300, '1h': 3600}
+# Сколько корзин каждого разрешения держат RollupAccumulator и compact
+RETENTION = {'1s': 3600, '10s': 2160, '1min': 1440, '5min': 2016, '1h': 720}
+AGGREGATES = ('count', 'sum', 'min', 'max', 'last')
+
+# Метрика агрегатов -> (массив индекса, в каких кадрах она наблюдается):
+# queue - только кадры с очередью на полосе, rows - кадры с машинами на полосе
+LANE_METRICS = {
+    'queueLength': ('length', 'queue'),
+    'queueDuration': ('duration', 'queue'),
+    'flowSpeed': ('flow_speed', 'rows'),
+    'delay': ('delay', 'rows'),
+}
+# Метрики, которые наблюдаются в каждом кадре, -> массив индекса. frameQueueLength - длина
+# очереди с нулем в кадрах без очереди: count по ней - число кадров, last - очередь на последнем кадре
+FRAME_METRICS = {'frameQueueLength': 'length'}
+
+
+class RollupLevel:
+    """
+    Агрегаты одного разрешения.
+
+    bucket - начала корзин в микросекундах от эпохи (по возрастанию), stats -
+    для каждого ряда массивы count/sum/min/max/last той же длины. Корзины без
+    наблюдений не хранятся, пропуски в рядах обозначаются NaN. since - с какого
+    момента в микросекундах корзины полные, если более старые были вытеснены,
+    None - с начала данных.
+    """
+
+    def __init__(self, step: int, bucket: np.ndarray, stats: Dict[Hashable, Dict[str, np.ndarray]],
+                 since: Optional[int] = None):
+        self.step = step
+        self.bucket = bucket
+        self.stats = stats
+        self.since = since
+
+    def __len__(self) -> int:
+        return len(self.bucket)
+
+    def range(self, start_us: int, stop_us: int) -> Tuple[int, int]:
+        """Полуинтервал индексов корзин, начала которых лежат в [start_us, stop_us)"""
+        return (int(np.searchsorted(self.bucket, start_us, side='left')),
+                int(np.searchsorted(self.bucket, stop_us, side='left')))
+
+    def slice(self, lo: int, hi: int) -> 'RollupLevel':
+        return RollupLevel(self.step, self.bucket[lo:hi],
+                           {key: {agg: values[lo:hi] for agg, values in stats.items()}
+                            for key, stats in self.stats.items()}, self.since)
+
+    def covers(self, start_us: Optional[int]) -> bool:
+        """Есть ли в уровне все корзины начиная с start_us, None - с начала данных"""
+        return self.since is None or (start_us is not None and self.since <= start_us)
+
+
+def _raw_stats(values: np.ndarray) -> Dict[str, np.ndarray]:
+    values = np.asarray(values, dtype=np.float64)
+    observed = ~np.isnan(values)
+    return {'count': observed.astype(np.int64), 'sum': np.where(observed, values, 0.0),
+            'min': values, 'max': values, 'last': values}
+
+
+def _merge(starts: np.ndarray, stats: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    # Слияние соседних корзин (или сырых значений) в более крупные сегментными редукциями
+    last = stats['last']
+    has_last = ~np.isnan(last)
+    last_pos = np.maximum.reduceat(np.where(has_last, np.arange(len(last)), -1), starts)
+    return {
+        'count': np.add.reduceat(stats['count'], starts),
+        'sum': np.add.reduceat(stats['sum'], starts),
+        # fmin/fmax пропускают NaN, результат NaN только у корзин без наблюдений
+        'min': np.fmin.reduceat(stats['min'], starts),
+        'max': np.fmax.reduceat(stats['max'], starts),
+        'last': np.where(last_pos >= 0, last[np.maximum(last_pos, 0)], np.nan),
+    }
+
+
+def build_rollups(ts: np.ndarray, series: Dict[Hashable, np.ndarray],
+                  resolutions: Dict[str, int] = RESOLUTIONS) -> Dict[str, RollupLevel]:
+    """
+    Строит агрегаты всех разрешений по временным рядам.
+    Самое мелкое разрешение считается по сырым значениям, каждое следующее -
+    по корзинам предыдущего, поэтому сырые данные читаются один раз
+
+    Args:
+        ts (np.ndarray): Время кадров в микросекундах, по возрастанию
+        series (Dict[Hashable, np.ndarray]): Ряды значений той же длины, NaN - нет наблюдения
+        resolutions (Dict[str, int]): Имя разрешения -> шаг в секундах
+
+    Returns:
+        Dict[str, RollupLevel]: Агрегаты по разрешениям
+    """
+    levels = {}
+    bucket = np.asarray(ts, dtype=np.int64)
+    stats = {key: _raw_stats(values) for key, values in series.items()}
+    for name, step in sorted(resolutions.items(), key=lambda item: item[1]):
+        step_us = step * MICROS
+        keys = bucket // step_us
+        if len(keys):
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            stats = {key: _merge(starts, key_stats) for key, key_stats in stats.items()}
+        else:
+            starts = np.zeros(0, dtype=np.int64)
+        bucket = keys[starts] * step_us
+        levels[name] = RollupLevel(step, bucket, stats)
+    return levels
+
+
+def compact(levels: Dict[str, RollupLevel], retention: Dict[str, int] = RETENTION) -> Dict[str, RollupLevel]:
+    """
+    Оставляет в каждом разрешении только последние retention корзин. Мелкие
+    разрешения покрывают последние часы, крупные - недели, и за старые периоды
+    summarize и choose_resolution берут корзины крупных разрешений
+
+    Args:
+        levels (Dict[str, RollupLevel]): Агрегаты по разрешениям
+        retention (Dict[str, int]): Имя разрешения -> число корзин, нет имени - без ограничения
+
+    Returns:
+        Dict[str, RollupLevel]: Агрегаты с вытесненными старыми корзинами
+    """
+    compacted = {}
+    for name, level in levels.items():
+        keep = retention.get(name)
+        if keep is not None and len(level) > keep:
+            level = level.slice(len(level) - keep, len(level))
+            level.since = int(level.bucket[0])
+        compacted[name] = level
+    return compacted
+
+
+def merge_levels(older: Dict[str, RollupLevel], newer: Dict[str, RollupLevel]) -> Dict[str, RollupLevel]:
+    """
+    Сливает агрегаты двух последовательных отрезков данных: корзины newer не
+    раньше корзин older, общая корзина на стыке объединяется. Так агрегаты
+    вытесненных кадров складываются с агрегатами кадров, которые еще хранятся
+
+    Args:
+        older (Dict[str, RollupLevel]): Агрегаты более раннего отрезка
+        newer (Dict[str, RollupLevel]): Агрегаты более позднего отрезка с теми же разрешениями
+
+    Returns:
+        Dict[str, RollupLevel]: Агрегаты по обоим отрезкам, since - от older
+    """
+    merged = {}
+    for name, new in newer.items():
+        old = older.get(name)
+        if old is None or not len(old):
+            merged[name] = RollupLevel(new.step, new.bucket, new.stats, old.since if old is not None else new.since)
+            continue
+        if not len(new):
+            merged[name] = old
+            continue
+        bucket = np.concatenate([old.bucket, new.bucket])
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        stats = {}
+        for key in {**old.stats, **new.stats}:
+            parts = [level.stats.get(key) or _raw_stats(np.full(len(level), np.nan)) for level in (old, new)]
+            stats[key] = _merge(starts, {agg: np.concatenate([part[agg] for part in parts]) for agg in AGGREGATES})
+        merged[name] = RollupLevel(new.step, bucket[starts], stats, old.since)
+    return merged
+
+
+def lane_series(lanes: Dict[int, Dict[str, np.ndarray]]) -> Dict[Tuple[int, str], np.ndarray]:
+    """Ряды метрик полос из массивов calculate_lane_metrics, ключ - (полоса, метрика)"""
+    series = {}
+    for lane, data in lanes.items():
+        observed = {'queue': data['start_row'] >= 0, 'rows': data['has_rows']}
+        for name, (key, when) in LANE_METRICS.items():
+            series[(lane, name)] = np.where(observed[when], data[key], np.nan)
+        for name, key in FRAME_METRICS.items():
+            series[(lane, name)] = np.where(observed['queue'], data[key], 0.0)
+    return series
+
+
+def snapshot_series(snapshot: dict) -> Dict[Tuple[int, str], float]:
+    """Значения метрик полос из снимка LiveMetrics, ключ - (полоса, метрика)"""
+    values = {}
+    for lane in snapshot['lanes']:
+        observed = {'queue': lane['carStartId'] is not None, 'rows': lane['carCount'] > 0}
+        for name, (_, when) in LANE_METRICS.items():
+            values[(lane['laneId'], name)] = lane[name] if observed[when] else np.nan
+        for name in FRAME_METRICS:
+            values[(lane['laneId'], name)] = lane['queueLength'] if observed['queue'] else 0.0
+    return values
+
+
+def _cover(start_us: int, stop_us: int, steps: List[int]) -> List[Tuple[int, int, int]]:
+    # Разбивает [start_us, stop_us) на куски из самых крупных корзин, которые в него помещаются
+    step_us = steps[0] * MICROS
+    lo = -(-start_us // step_us) * step_us
+    hi = stop_us // step_us * step_us
+    if lo >= hi or len(steps) == 1:
+        return _cover(start_us, stop_us, steps[1:]) if len(steps) > 1 else [(steps[0], start_us, stop_us)]
+    return _cover(start_us, lo, steps[1:]) + [(steps[0], lo, hi)] + _cover(hi, stop_us, steps[1:])
+
+
+def _summary_levels(levels: Dict[str, RollupLevel], start_us: Optional[int]) -> Dict[int, RollupLevel]:
+    # Разрешения, корзины которых не вытеснены с начала периода, по шагу
+    covering = [level for level in levels.values() if level.covers(start_us)] or \
+        [min(levels.values(), key=lambda level: level.since)]
+    return {level.step: level for level in covering}
+
+
+def summary_range(levels: Dict[str, RollupLevel], start_us: Optional[int] = None,
+                  stop_us: Optional[int] = None) -> Optional[Tuple[int, int]]:
+    """
+    Период, за который summarize на самом деле собирает агрегаты: границы
+    округлены до шага самого мелкого участвующего разрешения и обрезаны по
+    данным, stop не включается. None - за период нет корзин
+    """
+    by_step = _summary_levels(levels, start_us)
+    finest = by_step[min(by_step)]
+    if not len(finest):
+        return None
+    step_us = finest.step * MICROS
+    start_us = finest.bucket[0] if start_us is None else max(start_us // step_us * step_us, finest.bucket[0])
+    stop_us = finest.bucket[-1] + step_us if stop_us is None else \
+        min((stop_us // step_us + 1) * step_us, finest.bucket[-1] + step_us)
+    return (int(start_us), int(stop_us)) if start_us < stop_us else None
+
+
+def summarize(levels: Dict[str, RollupLevel], start_us: Optional[int] = None,
+              stop_us: Optional[int] = None) -> Dict[Hashable, Dict[str, float]]:
+    """
+    Агрегаты рядов за период, собранные из корзин: середина периода читается из
+    самых крупных корзин, края - из все более мелких. Границы периода
+    округляются до шага самого мелкого разрешения, stop включается. Участвуют
+    только разрешения, корзины которых не вытеснены с начала периода, поэтому
+    края старых периодов считаются с точностью до корзин крупных разрешений.
+    Округленный период возвращает summary_range
+
+    Args:
+        levels (Dict[str, RollupLevel]): Результат build_rollups или RollupAccumulator.levels
+        start_us (Optional[int]): Начало периода в микросекундах, None - с начала данных
+        stop_us (Optional[int]): Конец периода в микросекундах, None - до конца данных
+
+    Returns:
+        Dict[Hashable, Dict[str, float]]: Для каждого ряда count/sum/min/max/last и mean
+    """
+    by_step = _summary_levels(levels, start_us)
+    steps = sorted(by_step, reverse=True)
+    result = {key: {'count': 0, 'sum': 0.0, 'min': np.nan, 'max': np.nan, 'last': np.nan}
+              for key in by_step[steps[-1]].stats}
+    period = summary_range(levels, start_us, stop_us)
+    if period is not None:
+        for step, lo_us, hi_us in _cover(*period, steps):
+            level = by_step[step]
+            lo, hi = level.range(lo_us, hi_us)
+            if lo == hi:
+                continue
+            for key, stats in level.stats.items():
+                total = result[key]
+                total['count'] += int(stats['count'][lo:hi].sum())
+                total['sum'] += float(stats['sum'][lo:hi].sum())
+                total['min'] = float(np.fmin(total['min'], np.fmin.reduce(stats['min'][lo:hi])))
+                total['max'] = float(np.fmax(total['max'], np.fmax.reduce(stats['max'][lo:hi])))
+                last = stats['last'][lo:hi]
+                last = last[~np.isnan(last)]
+                if len(last):
+                    total['last'] = float(last[-1])
+    for total in result.values():
+        total['mean'] = total['sum'] / total['count'] if total['count'] else np.nan
+    return result
+
+
+def choose_resolution(levels: Dict[str, RollupLevel], start_us: Optional[int], stop_us: Optional[int],
+                      max_points: int) -> str:
+    """
+    Самое мелкое разрешение, при котором за период получается не больше max_points
+    корзин и корзины с начала периода еще не вытеснены
+    """
+    names = sorted(levels, key=lambda name: levels[name].step)
+    for name in names:
+        if not levels[name].covers(start_us):
+            continue
+        lo, hi = levels[name].range(np.iinfo(np.int64).min if start_us is None else start_us,
+                                    np.iinfo(np.int64).max if stop_us is None else stop_us)
+        if hi - lo <= max_points:
+            return name
+    return names[-1]
+
+
+class RollupAccumulator:
+    """
+    Агрегаты, которые обновляются по мере прихода значений.
+
+    Значение попадает только в открытую корзину самого мелкого разрешения.
+    Когда корзина закрывается, ее агрегаты вливаются в открытую корзину
+    следующего разрешения, поэтому работа на одно значение не зависит от
+    числа разрешений. Закрытые корзины каждого разрешения хранятся в
+    кольцевом буфере длиной RETENTION, и у заполненного буфера since -
+    начало самой старой оставшейся корзины.
+    """
+
+    def __init__(self, resolutions: Dict[str, int] = RESOLUTIONS, retention: Dict[str, int] = RETENTION):
+        self.names = sorted(resolutions, key=lambda name: resolutions[name])
+        self.steps = [resolutions[name] * MICROS for name in self.names]
+        self.closed = [deque(maxlen=retention.get(name)) for name in self.names]
+        self.open: List[Optional[Tuple[int, dict]]] = [None] * len(self.names)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _combine(into: dict, key: Hashable, stats: dict) -> None:
+        total = into.get(key)
+        if total is None:
+            into[key] = dict(stats)
+            return
+        total['count'] += stats['count']
+        total['sum'] += stats['sum']
+        total['min'] = float(np.fmin(total['min'], stats['min']))
+        total['max'] = float(np.fmax(total['max'], stats['max']))
+        if not np.isnan(stats['last']):
+            total['last'] = stats['last']
+
+    def _push(self, closed: list, open: list, level: int, bucket: int, values: Dict[Hashable, dict]) -> None:
+        current = open[level]
+        if current is not None and current[0] != bucket:
+            closed[level].append(current)
+            if level + 1 < len(self.names):
+                step = self.steps[level + 1]
+                self._push(closed, open, level + 1, current[0] // step * step, current[1])
+            current = None
+        if current is None:
+            current = open[level] = (bucket, {})
+        for key, stats in values.items():
+            self._combine(current[1], key, stats)
+
+    def add(self, ts_us: int, values: Dict[Hashable, float]) -> None:
+        """
+        Добавляет значения рядов в момент времени ts_us
+
+        Args:
+            ts_us (int): Время в микросекундах от эпохи, не убывает между вызовами
+            values (Dict[Hashable, float]): Значения рядов, NaN - нет наблюдения
+        """
+        stats = {}
+        for key, value in values.items():
+            observed = not np.isnan(value)
+            stats[key] = {'count': int(observed), 'sum': value if observed else 0.0,
+                          'min': value, 'max': value, 'last': value}
+        with self.lock:
+            self._push(self.closed, self.open, 0, ts_us // self.steps[0] * self.steps[0], stats)
+
+    def levels(self) -> Dict[str, RollupLevel]:
+        """
+        Снимок агрегатов в виде RollupLevel. Открытые корзины закрываются в копии
+        состояния, чтобы крупные разрешения учитывали еще не влитые значения
+        """
+        with self.lock:
+            closed = [list(buckets) for buckets in self.closed]
+            full = [buckets.maxlen is not None and len(buckets) == buckets.maxlen for buckets in self.closed]
+            open = [None if current is None else (current[0], {key: dict(stats) for key, stats in current[1].items()})
+                    for current in self.open]
+        for level in range(len(self.names)):
+            if open[level] is not None:
+                current, open[level] = open[level], None
+                closed[level].append(current)
+                if level + 1 < len(self.names):
+                    step = self.steps[level + 1]
+                    self._push(closed, open, level + 1, current[0] // step * step, current[1])
+
+        levels = {}
+        for level, name in enumerate(self.names):
+            buckets = closed[level]
+            keys = {key for _, values in buckets for key in values}
+            stats = {key: {agg: np.array([values[key][agg] if key in values else (0 if agg == 'count' else np.nan)
+                                          for _, values in buckets],
+                                         dtype=np.int64 if agg == 'count' else np.float64)
+                           for agg in AGGREGATES}
+                     for key in keys}
+            for key_stats in stats.values():
+                key_stats['sum'] = np.nan_to_num(key_stats['sum'])
+            levels[name] = RollupLevel(self.steps[level] // MICROS,
+                                       np.array([bucket for bucket, _ in buckets], dtype=np.int64), stats,
+                                       buckets[0][0] if full[level] else None)
+        return levels
@@ -0,0 +1,259 @@
+import math
+from typing import List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from algorithm.models import SensorConfig, Zone
+
+# Шаг сетки растра, м
+CELL_SIZE = 0.25
+# Предел числа ячеек растра, при большем охвате шаг увеличивается
+MAX_CELLS = 4_000_000
+# Допуск направления движения относительно направления полосы, градусы
+HEADING_TOLERANCE = 20
+# Полосы и курс по умолчанию, если конфигурации нет: как в is_traffic_lane и check_heading
+DEFAULT_TRAFFIC_LANES = (0, 1, 2)
+APPROACH_HEADING = 180
+
+
+class RowClasses(NamedTuple):
+    """Результат SpatialIndex.classify, по элементу на строку кадра"""
+    lane: List[int]  # полоса по геометрии, вне полос - полоса из строки
+    zone: List[int]  # номер зоны в SpatialIndex.zones или -1
+    stop_dist: List[float]  # расстояние до стоп-линии полосы вдоль полосы, м
+    traffic: List[bool]  # строка на полосе, по которой машины едут к стоп-линии
+    heading_ok: List[bool]  # курс совпадает с направлением движения к стоп-линии
+
+
+def _heading_ok(heading: np.ndarray, expected: np.ndarray) -> np.ndarray:
+    diff = np.abs((heading - expected + 180) % 360 - 180)
+    return diff <= HEADING_TOLERANCE
+
+
+def _lane_centerline(lane) -> np.ndarray:
+    # splines задают осевую линию точками [x, y], иначе полоса прямая вдоль оси align
+    points = [point[:2] for point in lane.splines if len(point) >= 2]
+    if len(points) >= 2:
+        return np.asarray(points, dtype=np.float64)
+    start, end = lane.range_offset, lane.range_offset + lane.length
+    if lane.align == 'vertical':
+        return np.array([[lane.center, start], [lane.center, end]], dtype=np.float64)
+    return np.array([[start, lane.center], [end, lane.center]], dtype=np.float64)
+
+
+def _zone_polygon(zone: Zone) -> np.ndarray:
+    # Зона - прямоугольник от точки сегмента: length вдоль полосы, width поперек вниз,
+    # повернутый на rotation градусов вокруг этой точки. Три и больше сегментов - многоугольник
+    points = sorted(zone.segments, key=lambda segment: segment.index)
+    if len(points) >= 3:
+        return np.array([[point.x, point.y] for point in points], dtype=np.float64)
+    x, y = points[0].x, points[0].y
+    corners = np.array([[0, 0], [zone.length, 0], [zone.length, -zone.width], [0, -zone.width]], dtype=np.float64)
+    angle = math.radians(zone.rotation)
+    rotation = np.array([[math.cos(angle), -math.sin(angle)], [math.sin(angle), math.cos(angle)]])
+    return corners @ rotation.T + [x, y]
+
+
+def _inside_polygon(x: np.ndarray, y: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    # Правило четности пересечений, векторно по всем точкам
+    inside = np.zeros(x.shape, dtype=bool)
+    x1, y1 = polygon[-1]
+    for x2, y2 in polygon:
+        crosses = (y1 > y) != (y2 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= crosses & (x < x_cross)
+        x1, y1 = x2, y2
+    return inside
+
+
+def _distance_to_polyline(x: np.ndarray, y: np.ndarray, line: np.ndarray) -> np.ndarray:
+    dist = np.full(x.shape, np.inf)
+    for (x1, y1), (x2, y2) in zip(line[:-1], line[1:]):
+        dx, dy = x2 - x1, y2 - y1
+        length = dx * dx + dy * dy
+        t = np.clip(((x - x1) * dx + (y - y1) * dy) / length, 0, 1) if length else np.zeros(x.shape)
+        dist = np.minimum(dist, np.hypot(x - (x1 + t * dx), y - (y1 + t * dy)))
+    return dist
+
+
+class SpatialIndex:
+    """
+    Пространственный индекс полос и зон сенсора.
+
+    Полосы из road_sensor_lanes и зоны из road_sensor_zones (и зон полос)
+    растеризуются в сетку с шагом CELL_SIZE, поэтому полоса и зона точки
+    находятся одним обращением к массиву для всей пачки точек. Расстояние до
+    стоп-линии считается проекцией на ось полосы: стоп-линия стоит в конце
+    полосы по направлению движения (direction < 0 - к началу range_offset).
+
+    Без конфигурации (SpatialIndex.fallback) индекс повторяет прежние правила:
+    полосы 0-2, курс 160-200 и point_x как расстояние до стоп-линии.
+    """
+
+    def __init__(self, lanes: Optional[list] = None, zones: Optional[List[Zone]] = None,
+                 cell_size: float = CELL_SIZE):
+        self.lanes = lanes or []
+        self.zones = zones or []
+        self.zone_ids = [zone.road_sensor_zones_id for zone in self.zones]
+        self.cell_size = cell_size
+        self.lane_grid = None
+        self.zone_grid = None
+        # Полосы, по которым машины едут к сенсору и стоп-линии
+        self.traffic_lanes = set(DEFAULT_TRAFFIC_LANES) if not self.lanes else \
+            {lane.lane_index for lane in self.lanes if lane.direction < 0}
+        # Таблицы свойств по номеру полосы, последняя строка - для полос вне конфигурации:
+        # стоп-линия в x = 0 вдоль оси x и курс к сенсору, как в прежних правилах
+        size = max([lane.lane_index for lane in self.lanes] + list(DEFAULT_TRAFFIC_LANES)) + 2
+        self.lane_traffic = np.zeros(size, dtype=bool)
+        self.lane_traffic[list(self.traffic_lanes)] = True
+        self.lane_heading = np.full(size, float(APPROACH_HEADING))
+        self.stop_point = np.zeros((size, 2))
+        self.lane_axis = np.tile([1.0, 0.0], (size, 1))
+        for lane in self.lanes:
+            line = _lane_centerline(lane)
+            # Точки осевой линии идут по возрастанию координаты, при direction < 0 машины едут к началу
+            stop, upstream = (line[0], line[1]) if lane.direction < 0 else (line[-1], line[-2])
+            axis = upstream - stop
+            axis = axis / (np.hypot(*axis) or 1.0)
+            self.stop_point[lane.lane_index] = stop
+            self.lane_axis[lane.lane_index] = axis
+            self.lane_heading[lane.lane_index] = math.degrees(math.atan2(-axis[1], -axis[0])) % 360
+        if self.lanes or self.zones:
+            self._rasterize()
+
+    @classmethod
+    def from_config(cls, config: SensorConfig, cell_size: float = CELL_SIZE) -> 'SpatialIndex':
+        """
+        Строит индекс по конфигурации сенсора
+
+        Args:
+            config (SensorConfig): Конфигурация из файла с данными
+            cell_size (float): Шаг сетки растра, м
+
+        Returns:
+            SpatialIndex: Индекс полос и зон
+        """
+        zones = {}
+        for zone in [*config.road_sensor_zones, *(zone for lane in config.road_sensor_lanes for zone in lane.zones)]:
+            zones.setdefault(zone.road_sensor_zones_id, zone)
+        return cls(config.road_sensor_lanes, list(zones.values()), cell_size)
+
+    @classmethod
+    def fallback(cls) -> 'SpatialIndex':
+        """Индекс без геометрии, повторяющий прежние захардкоженные фильтры"""
+        return cls()
+
+    def _rasterize(self) -> None:
+        shapes = []
+        for lane in self.lanes:
+            line = _lane_centerline(lane)
+            shapes.append(np.vstack([line.min(axis=0) - lane.width / 2, line.max(axis=0) + lane.width / 2]))
+        polygons = [_zone_polygon(zone) for zone in self.zones]
+        shapes.extend(np.vstack([polygon.min(axis=0), polygon.max(axis=0)]) for polygon in polygons)
+        bounds = np.vstack(shapes)
+        self.origin = bounds.min(axis=0)
+        extent = bounds.max(axis=0) - self.origin
+        cells = np.prod(np.ceil(extent / self.cell_size) + 1)
+        if cells > MAX_CELLS:
+            self.cell_size *= math.sqrt(cells / MAX_CELLS)
+        self.shape = tuple(int(n) for n in np.ceil(extent / self.cell_size) + 1)
+
+        # Центры ячеек, ось 0 - x, ось 1 - y
+        xs = self.origin[0] + (np.arange(self.shape[0]) + 0.5) * self.cell_size
+        ys = self.origin[1] + (np.arange(self.shape[1]) + 0.5) * self.cell_size
+        x, y = np.meshgrid(xs, ys, indexing='ij')
+
+        self.lane_grid = np.full(self.shape, -1, dtype=np.int16)
+        best = np.full(self.shape, np.inf)
+        for lane in self.lanes:
+            dist = _distance_to_polyline(x, y, _lane_centerline(lane))
+            # Ячейка достается полосе с ближайшей осевой линией
+            closer = (dist <= lane.width / 2) & (dist < best)
+            self.lane_grid[closer] = lane.lane_index
+            best[closer] = dist[closer]
+
+        self.zone_grid = np.full(self.shape, -1, dtype=np.int16)
+        for i, polygon in enumerate(polygons):
+            inside = _inside_polygon(x, y, polygon) & (self.zone_grid < 0)
+            self.zone_grid[inside] = i
+
+    def lookup(self, x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Полоса и зона для пачки точек
+
+        Args:
+            x (np.ndarray): point_x точек
+            y (np.ndarray): point_y точек
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Номер полосы и номер зоны, -1 вне полос и зон
+        """
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        if self.lane_grid is None:
+            return np.full(x.shape, -1, dtype=np.int16), np.full(x.shape, -1, dtype=np.int16)
+        ix = np.floor((x - self.origin[0]) / self.cell_size).astype(np.int64)
+        iy = np.floor((y - self.origin[1]) / self.cell_size).astype(np.int64)
+        valid = (ix >= 0) & (ix < self.shape[0]) & (iy >= 0) & (iy < self.shape[1])
+        ix, iy = np.where(valid, ix, 0), np.where(valid, iy, 0)
+        return (np.where(valid, self.lane_grid[ix, iy], -1).astype(np.int16),
+                np.where(valid, self.zone_grid[ix, iy], -1).astype(np.int16))
+
+    def classify_arrays(self, lane: np.ndarray, x: np.ndarray, y: np.ndarray,
+                        heading: np.ndarray) -> dict:
+        """
+        Векторная классификация строк по колонкам, например колонкам FrameStore
+
+        Args:
+            lane (np.ndarray): Полоса из строк
+            x (np.ndarray): point_x
+            y (np.ndarray): point_y
+            heading (np.ndarray): Курс в градусах
+
+        Returns:
+            dict: Массивы lane, zone, stop_dist, traffic и heading_ok
+        """
+        lane = np.asarray(lane, dtype=np.int64)
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        heading = np.asarray(heading, dtype=np.float64)
+        geo_lane, zone = self.lookup(x, y)
+        lane = np.where(geo_lane >= 0, geo_lane, lane)
+        row = np.where((lane >= 0) & (lane < len(self.lane_traffic) - 1), lane, len(self.lane_traffic) - 1)
+        stop, axis = self.stop_point[row], self.lane_axis[row]
+        return {
+            'lane': lane,
+            'zone': zone,
+            'stop_dist': (x - stop[:, 0]) * axis[:, 0] + (y - stop[:, 1]) * axis[:, 1],
+            'traffic': self.lane_traffic[row],
+            'heading_ok': _heading_ok(heading, self.lane_heading[row]),
+        }
+
+    def classify(self, rows: Sequence) -> RowClasses:
+        """
+        Классифицирует строки одного кадра
+
+        Args:
+            rows (Sequence): rows_data кадра
+
+        Returns:
+            RowClasses: Полоса, зона, расстояние до стоп-линии и флаги фильтров по строкам
+        """
+        if not self.lanes and not self.zones:
+            # Без геометрии numpy на паре десятков строк только мешает
+            traffic_lanes = self.traffic_lanes
+            return RowClasses(
+                [row.lane for row in rows],
+                [-1] * len(rows),
+                [row.point_x for row in rows],
+                [row.lane in traffic_lanes for row in rows],
+                [APPROACH_HEADING - HEADING_TOLERANCE <= row.heading <= APPROACH_HEADING + HEADING_TOLERANCE
+                 for row in rows],
+            )
+        result = self.classify_arrays([row.lane for row in rows], [row.point_x for row in rows],
+                                      [row.point_y for row in rows], [row.heading for row in rows])
+        return RowClasses(*(result[key].tolist() for key in RowClasses._fields))
+
+    def zone_occupancy(self, zone: np.ndarray) -> np.ndarray:
+        """Число точек в каждой зоне по результату lookup/classify"""
+        zone = np.asarray(zone)
+        return np.bincount(zone[zone >= 0], minlength=len(self.zones))
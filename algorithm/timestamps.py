@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+# Время внутри алгоритмов - int микросекунд от эпохи. datetime появляется только
+# на границе API и в выводе, сравнения и разности времени идут в целых числах
+
+EPOCH = datetime(1970, 1, 1)
+MICROS = 1_000_000
+# Формат времени в дампах сенсора
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+# Сколько разных дат помнит parse_micros, данные обычно укладываются в несколько дней
+DAY_CACHE_SIZE = 1024
+
+_EPOCH_ORDINAL = EPOCH.toordinal()
+_days = {}
+
+
+def to_micros(dt: datetime) -> int:
+    """Переводит datetime в микросекунды от эпохи"""
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(us: int) -> datetime:
+    """Переводит микросекунды от эпохи обратно в datetime"""
+    return EPOCH + timedelta(microseconds=int(us))
+
+
+def seconds(us: int) -> float:
+    """Интервал в микросекундах в секундах"""
+    return us / MICROS
+
+
+def micros(secs: float) -> int:
+    """Интервал в секундах в микросекундах"""
+    return round(secs * MICROS)
+
+
+def _day_micros(date: str) -> int:
+    day = _days.get(date)
+    if day is None:
+        if len(_days) >= DAY_CACHE_SIZE:
+            _days.clear()
+        ordinal = datetime(int(date[:4]), int(date[5:7]), int(date[8:10])).toordinal()
+        day = _days[date] = (ordinal - _EPOCH_ORDINAL) * 86400 * MICROS
+    return day
+
+
+def parse_micros(value: str) -> int:
+    """
+    Разбирает время сенсора 'YYYY-MM-DD HH:MM:SS.ffffff' в микросекунды от эпохи.
+
+    Формат фиксированный, поэтому поля режутся по позициям, а полночь даты
+    берется из кэша, и strptime не вызывается. Быстрый путь принимает только
+    ASCII-цифры без знаков и поля в допустимых пределах, все остальное
+    разбирается через datetime.fromisoformat с его ошибками
+
+    Args:
+        value (str): Время в формате дампа
+
+    Returns:
+        int: Микросекунды от эпохи
+    """
+    if 21 <= len(value) <= 26 and value[4] == '-' and value[7] == '-' and value[10] == ' ' \
+            and value[13] == ':' and value[16] == ':' and value[19] == '.':
+        digits = value[:4] + value[5:7] + value[8:10] + value[11:13] + value[14:16] + value[17:19] + value[20:]
+        if digits.isascii() and digits.isdigit():
+            month, day = int(value[5:7]), int(value[8:10])
+            hour, minute, second = int(value[11:13]), int(value[14:16]), int(value[17:19])
+            if 1 <= month <= 12 and 1 <= day <= 31 and hour < 24 and minute < 60 and second < 60:
+                fraction = value[20:]
+                return _day_micros(value[:10]) + ((hour * 60 + minute) * 60 + second) * MICROS \
+                    + int(fraction) * 10 ** (6 - len(fraction))
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is not None:
+        raise ValueError(f"Время сенсора без часового пояса, получено {value!r}")
+    return to_micros(dt)
+
+
+def format_micros(us: int) -> str:
+    """Время в микросекундах в формате дампа сенсора"""
+    return from_micros(us).strftime(TIME_FORMAT)
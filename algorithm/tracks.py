@@ -0,0 +1,143 @@
+import heapq
+from typing import List, NamedTuple, Optional
+
+from algorithm.timestamps import MICROS, micros
+
+# Перерыв, после которого машина считается уехавшей, как в has_left
+TRACK_GAP_SECS = 10.0
+TRACK_GAP_US = micros(TRACK_GAP_SECS)
+# Предельная скорость машины, м/с, и допуск на шум координат радара, м.
+# Скачок point_x больше допустимого за прошедшее время - это уже другая машина с тем же obj_id
+MAX_SPEED = 40.0
+POSITION_MARGIN = 20.0
+# Машина не может перестроиться больше чем на одну полосу между соседними появлениями
+MAX_LANE_JUMP = 1
+
+
+class FrameTracks(NamedTuple):
+    """Результат TrackStore.update для одного кадра"""
+    keys: List[int]  # ключ трека для каждой строки кадра
+    slots: List[int]  # слот трека для каждой строки кадра
+    ended: List[int]  # ключи треков, закончившихся на этом кадре, по возрастанию
+
+
+class TrackStore:
+    """
+    Общее хранилище треков машин.
+
+    Радар переиспользует obj_id, поэтому метрики работают не с obj_id, а с ключом
+    трека. Новый трек начинается, если obj_id не встречался дольше TRACK_GAP_SECS,
+    его point_x прыгнул дальше, чем машина может проехать за прошедшее время,
+    или полоса сменилась больше чем на MAX_LANE_JUMP. Ключи треков растут в
+    порядке появления машин.
+
+    Состояние треков лежит в параллельных списках-слотах, освободившиеся слоты
+    переиспользуются через free list. Треки истекают через кучу по времени
+    последнего появления. При новом появлении машины запись в куче не
+    обновляется: когда запись доходит до вершины, трек закрывается, только если
+    машину с тех пор не видели, иначе запись возвращается в кучу с временем
+    последнего появления.
+    Слоты, закрытые на кадре, возвращаются в free list только в конце update,
+    поэтому до следующего update по FrameTracks.slots можно читать начало
+    трека даже у машин, трек которых закончился на этом же кадре.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.key: List[int] = []
+        self.obj_id: List[int] = []
+        self.first_time: List[Optional[int]] = []
+        self.first_x: List[float] = []
+        self.last_time: List[Optional[int]] = []
+        self.last_x: List[float] = []
+        self.last_lane: List[int] = []
+        self.free: List[int] = []
+        self.closed: List[int] = []  # слоты, закрытые на текущем кадре
+        self.by_obj = dict()  # obj_id -> слот текущего трека
+        self.expiry = []  # (last_time, key, slot)
+        self.next_key = 0
+        self._grow(capacity)
+
+    def _grow(self, size: int) -> None:
+        start = len(self.key)
+        self.key.extend([-1] * size)
+        self.obj_id.extend([0] * size)
+        self.first_time.extend([None] * size)
+        self.first_x.extend([0.0] * size)
+        self.last_time.extend([None] * size)
+        self.last_x.extend([0.0] * size)
+        self.last_lane.extend([0] * size)
+        # Слоты выдаются с начала списков
+        self.free.extend(range(start + size - 1, start - 1, -1))
+
+    def __len__(self) -> int:
+        """Число активных треков"""
+        return len(self.by_obj)
+
+    def _continues(self, slot: int, row) -> bool:
+        elapsed = row.time - self.last_time[slot]
+        return elapsed < TRACK_GAP_US \
+            and abs(row.point_x - self.last_x[slot]) <= POSITION_MARGIN + MAX_SPEED * elapsed / MICROS \
+            and abs(row.lane - self.last_lane[slot]) <= MAX_LANE_JUMP
+
+    def _open(self, row) -> int:
+        if not self.free:
+            self._grow(len(self.key))
+        slot = self.free.pop()
+        self.key[slot] = self.next_key
+        self.next_key += 1
+        self.obj_id[slot] = row.obj_id
+        self.first_time[slot] = self.last_time[slot] = row.time
+        self.first_x[slot] = self.last_x[slot] = row.point_x
+        self.last_lane[slot] = row.lane
+        self.by_obj[row.obj_id] = slot
+        heapq.heappush(self.expiry, (row.time, self.key[slot], slot))
+        return slot
+
+    def _close(self, slot: int) -> int:
+        key = self.key[slot]
+        if self.by_obj.get(self.obj_id[slot]) == slot:
+            del self.by_obj[self.obj_id[slot]]
+        self.key[slot] = -1
+        self.closed.append(slot)
+        return key
+
+    def update(self, frame) -> FrameTracks:
+        """
+        Сопоставляет строки кадра трекам и закрывает треки уехавших машин
+
+        Args:
+            frame (Objects): Кадр с сенсора
+
+        Returns:
+            FrameTracks: Ключи и слоты треков по строкам кадра и закончившиеся треки
+        """
+        curr_ts = frame.rows_data[0].time
+        keys, slots, ended = [], [], []
+        for row in frame.rows_data:
+            slot = self.by_obj.get(row.obj_id)
+            if slot is not None and not self._continues(slot, row):
+                ended.append(self._close(slot))
+                slot = None
+            if slot is None:
+                slot = self._open(row)
+            else:
+                self.last_time[slot] = row.time
+                self.last_x[slot] = row.point_x
+                self.last_lane[slot] = row.lane
+            keys.append(self.key[slot])
+            slots.append(slot)
+
+        expiry = self.expiry
+        while expiry and curr_ts - expiry[0][0] >= TRACK_GAP_US:
+            _, key, slot = heapq.heappop(expiry)
+            if self.key[slot] != key:
+                continue
+            if curr_ts - self.last_time[slot] >= TRACK_GAP_US:
+                ended.append(self._close(slot))
+            else:
+                heapq.heappush(expiry, (self.last_time[slot], key, slot))
+        # Данные трека остаются в слоте до его переиспользования
+        self.free.extend(self.closed)
+        self.closed.clear()
+        ended.sort()
+        return FrameTracks(keys, slots, ended)
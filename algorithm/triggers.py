@@ -0,0 +1,176 @@
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+from algorithm.frames import FrameStore
+from algorithm.spatial import SpatialIndex
+from algorithm.timestamps import MICROS
+
+
+class TriggerEvent(NamedTuple):
+    """Смена состояния присутствия в зоне"""
+    time: int  # микросекунды от эпохи
+    zone_id: str
+    trigger_id: Optional[str]
+    relay_id: Optional[str]
+    present: bool  # True - присутствие включилось, False - выключилось
+    occupancy: int  # число подходящих под триггер машин в зоне на этом кадре
+
+
+def _limit(value, default: float) -> float:
+    return default if value is None else float(value)
+
+
+class TriggerEngine:
+    """
+    Эмуляция детекторов по зонам сенсора.
+
+    Каждая зона SpatialIndex вычисляется по своему Zone.trigger. Машина
+    учитывается в зоне, если ее скорость лежит в min_speed..max_speed, дальность
+    от сенсора в min_range..max_range, а класс входит в битовую маску classes
+    (бит obj_class - 1, неизвестный класс 0 проходит всегда, нулевая маска
+    пропускает все классы). Присутствие
+    включается, когда зона непрерывно занята min_time секунд, и принудительно
+    выключается через max_time секунд присутствия, после чего ждет, пока зона
+    освободится, как max presence у индукционных петель.
+
+    Занятость зон считается векторно сразу для всех строк кадра или всего
+    хранилища, а события включения и выключения - по отрезкам занятости.
+    """
+
+    def __init__(self, spatial: SpatialIndex):
+        self.spatial = spatial
+        zones = spatial.zones
+        triggers = [zone.trigger for zone in zones]
+        self.zone_ids = spatial.zone_ids
+        self.trigger_ids = [trigger.road_sensor_triggers_id for trigger in triggers]
+        self.relay_ids = [trigger.relay_id for trigger in triggers]
+        self.min_speed = np.array([_limit(t.min_speed, -np.inf) for t in triggers])
+        self.max_speed = np.array([_limit(t.max_speed, np.inf) for t in triggers])
+        self.min_range = np.array([_limit(t.min_range, -np.inf) for t in triggers])
+        self.max_range = np.array([_limit(t.max_range, np.inf) for t in triggers])
+        # Нулевая маска - все классы, то есть все биты
+        self.classes = np.array([t.classes or -1 for t in triggers], dtype=np.int64)
+        # Пороги времени в микросекундах, как время в FrameStore
+        self.min_time = np.array([_limit(t.min_time, 0) * MICROS for t in triggers])
+        self.max_time = np.array([_limit(t.max_time, np.inf) * MICROS for t in triggers])
+
+        # Состояние для потоковой обработки
+        n = len(zones)
+        self.occupied_since: List[Optional[int]] = [None] * n
+        self.present_since: List[Optional[int]] = [None] * n
+        self.blocked = [False] * n
+        self.occupancy = np.zeros(n, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.zone_ids)
+
+    def _counts(self, frame: np.ndarray, n_frames: int, x: np.ndarray, y: np.ndarray,
+                speed: np.ndarray, obj_class: np.ndarray) -> np.ndarray:
+        _, zone = self.spatial.lookup(x, y)
+        inside = zone >= 0
+        zone, frame = zone[inside].astype(np.int64), frame[inside]
+        speed, obj_class = speed[inside], obj_class[inside].astype(np.int64)
+        distance = np.hypot(x[inside], y[inside])
+        class_bit = np.where(obj_class > 0, np.left_shift(1, np.maximum(obj_class - 1, 0)), -1)
+        match = (speed >= self.min_speed[zone]) & (speed <= self.max_speed[zone]) \
+            & (distance >= self.min_range[zone]) & (distance <= self.max_range[zone]) \
+            & ((self.classes[zone] & class_bit) != 0)
+        counts = np.bincount(frame[match] * len(self) + zone[match], minlength=n_frames * len(self))
+        return counts.reshape(n_frames, len(self))
+
+    def _event(self, ts: int, zone: int, present: bool, occupancy: int) -> TriggerEvent:
+        return TriggerEvent(int(ts), self.zone_ids[zone], self.trigger_ids[zone], self.relay_ids[zone],
+                            present, int(occupancy))
+
+    def update(self, frame) -> List[TriggerEvent]:
+        """
+        Обрабатывает один кадр
+
+        Args:
+            frame (Objects): Кадр с сенсора
+
+        Returns:
+            List[TriggerEvent]: События включения и выключения присутствия на этом кадре
+        """
+        if not len(self):
+            return []
+        rows = frame.rows_data
+        ts = rows[0].time
+        counts = self._counts(np.zeros(len(rows), dtype=np.int64), 1,
+                              np.array([row.point_x for row in rows], dtype=np.float64),
+                              np.array([row.point_y for row in rows], dtype=np.float64),
+                              np.array([row.obj_speed for row in rows], dtype=np.float64),
+                              np.array([row.obj_class for row in rows], dtype=np.int64))[0]
+        self.occupancy = counts
+
+        events = []
+        for zone, count in enumerate(counts.tolist()):
+            if not count:
+                if self.present_since[zone] is not None:
+                    events.append(self._event(ts, zone, False, count))
+                self.occupied_since[zone] = self.present_since[zone] = None
+                self.blocked[zone] = False
+                continue
+            if self.occupied_since[zone] is None:
+                self.occupied_since[zone] = ts
+            if self.present_since[zone] is None:
+                if not self.blocked[zone] and ts - self.occupied_since[zone] >= self.min_time[zone]:
+                    self.present_since[zone] = ts
+                    events.append(self._event(ts, zone, True, count))
+            elif ts - self.present_since[zone] >= self.max_time[zone]:
+                self.present_since[zone] = None
+                self.blocked[zone] = True
+                events.append(self._event(ts, zone, False, count))
+        return events
+
+    def evaluate(self, store: FrameStore) -> tuple[np.ndarray, np.ndarray, List[TriggerEvent]]:
+        """
+        Вычисляет триггеры по всему хранилищу, результат совпадает с покадровым update
+
+        Args:
+            store (FrameStore): Кадры сенсора в порядке времени
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, List[TriggerEvent]]: Время кадров в микросекундах,
+            занятость зон (кадры x зоны) и события по времени
+        """
+        ts = np.asarray(store.frame_times, dtype=np.int64)
+        n = len(ts)
+        if not len(self) or not n:
+            return ts, np.zeros((n, len(self)), dtype=np.int64), []
+        c = store.columns
+        counts = self._counts(store.frame_index, n, np.asarray(c['point_x']), np.asarray(c['point_y']),
+                              np.asarray(c['obj_speed']), np.asarray(c['obj_class']))
+
+        zones, present, indices = [], [], []
+        for zone in range(len(self)):
+            occupied = counts[:, zone] > 0
+            edges = np.diff(occupied.astype(np.int8), prepend=0, append=0)
+            run_starts, run_ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+            # Присутствие включается на первом кадре отрезка, к которому прошло min_time
+            on = np.searchsorted(ts, ts[run_starts] + self.min_time[zone])
+            on = np.maximum(on, run_starts)
+            started = on < run_ends
+            on, run_ends = on[started], run_ends[started]
+            if np.isfinite(self.max_time[zone]):
+                off = np.searchsorted(ts, ts[on] + self.max_time[zone])
+                off = np.minimum(np.maximum(off, on + 1), run_ends)
+            else:
+                off = run_ends
+            closed = off < n
+            indices.extend([on, off[closed]])
+            zones.append(np.full(len(on) + closed.sum(), zone))
+            present.extend([np.ones(len(on), dtype=bool), np.zeros(closed.sum(), dtype=bool)])
+
+        indices, zones, present = np.concatenate(indices), np.concatenate(zones), np.concatenate(present)
+        # Порядок как у покадровой обработки: по кадру, затем по зоне
+        order = np.lexsort((zones, indices))
+        events = [self._event(ts[i], zone, flag, counts[i, zone])
+                  for i, zone, flag in zip(indices[order].tolist(), zones[order].tolist(), present[order].tolist())]
+        return ts, counts, events
+
+    def state(self) -> List[dict]:
+        """Текущая занятость и присутствие по зонам после последнего update"""
+        return [{'zoneId': zone_id, 'occupancy': int(count), 'present': since is not None}
+                for zone_id, count, since in zip(self.zone_ids, self.occupancy.tolist(), self.present_since)]
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import threading
+from collections import deque
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from algorithm.timestamps import from_micros
+from backend.instrumentation import STAGE_SECONDS
+
+# Сколько последних дельт держим в общем буфере
+BUFFER_SIZE = 256
+# Поля полосы, которые уходят клиентам
+LANE_FIELDS = ('queueStart', 'queueEnd', 'carStartId', 'carEndId', 'queueLength', 'queueDuration', 'flowSpeed', 'delay')
+
+
+def _round(value):
+    # Округляем до сантиметров и сотых секунды, чтобы дрожание не порождало лишних дельт
+    return round(value, 2) if isinstance(value, float) else value
+
+
+def _encode(message: dict) -> str:
+    with STAGE_SECONDS.time('serialize'):
+        return json.dumps(message, separators=(',', ':'), ensure_ascii=False)
+
+
+class LaneStateBroadcaster:
+    """
+    Раздача состояния очередей по полосам множеству подписчиков.
+
+    Снимки LiveMetrics превращаются в дельты: в сообщение попадают только
+    изменившиеся полосы. Каждая дельта сериализуется один раз и кладется в общий
+    кольцевой буфер, из которого читают все клиенты. Клиент, который отстал
+    больше чем на один кадр, вместо пропущенных дельт получает одно сообщение
+    с полным текущим состоянием, оно тоже сериализуется один раз на кадр.
+    """
+
+    def __init__(self, buffer_size: int = BUFFER_SIZE):
+        self.buffer = deque(maxlen=buffer_size)
+        self.lanes: Dict[int, dict] = {}
+        self.seq = 0
+        self.time: Optional[int] = None  # микросекунды от эпохи
+        self.avg_stops = 0.0
+        self.clients = 0
+        self.lock = threading.Lock()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._event: Optional[asyncio.Event] = None
+        self._snapshot = (0, _encode({'type': 'snapshot', 'seq': 0, 'time': None, 'lanes': [], 'avgStops': 0.0}))
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Привязывает рассылку к event loop, в котором работают клиенты"""
+        self.loop = loop
+        self._event = asyncio.Event()
+
+    def publish(self, snapshot: dict) -> None:
+        """
+        Принимает снимок метрик. Может вызываться из потока обработки кадров
+
+        Args:
+            snapshot (dict): Снимок из LiveMetrics.process
+        """
+        changed = []
+        with self.lock:
+            for lane in snapshot['lanes']:
+                state = {field: _round(lane.get(field)) for field in LANE_FIELDS}
+                if self.lanes.get(lane['laneId']) != state:
+                    self.lanes[lane['laneId']] = state
+                    changed.append({'laneId': lane['laneId'], **state})
+            avg_stops = _round(snapshot['avgStops'])
+            if not changed and avg_stops == self.avg_stops:
+                return
+            self.seq += 1
+            self.time = snapshot['time']
+            self.avg_stops = avg_stops
+            self.buffer.append((self.seq, _encode({
+                'type': 'delta',
+                'seq': self.seq,
+                'time': from_micros(self.time).isoformat(),
+                'lanes': changed,
+                'avgStops': avg_stops,
+            })))
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._notify)
+
+    def _notify(self) -> None:
+        # Будим всех ожидающих клиентов и заводим новое событие для следующего кадра
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    def snapshot(self) -> Tuple[int, str]:
+        """Полное текущее состояние, сериализованное не больше одного раза на кадр"""
+        with self.lock:
+            if self._snapshot[0] != self.seq:
+                self._snapshot = (self.seq, _encode({
+                    'type': 'snapshot',
+                    'seq': self.seq,
+                    'time': from_micros(self.time).isoformat() if self.time is not None else None,
+                    'lanes': [{'laneId': lane, **state} for lane, state in self.lanes.items()],
+                    'avgStops': self.avg_stops,
+                }))
+            return self._snapshot
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """
+        Поток сообщений для одного клиента: сначала полное состояние, затем дельты.
+        Медленный клиент не копит очередь, а при следующем чтении получает одно
+        свежее состояние вместо всех пропущенных кадров. Если attach еще не
+        вызывался, рассылка привязывается к event loop первого подписчика
+        """
+        if self.loop is None:
+            self.attach(asyncio.get_running_loop())
+        self.clients += 1
+        try:
+            seq, message = self.snapshot()
+            yield message
+            while True:
+                event = self._event
+                with self.lock:
+                    latest = self.buffer[-1] if self.buffer else None
+                if latest is None or latest[0] == seq:
+                    await event.wait()
+                    continue
+                seq, message = latest if latest[0] == seq + 1 else self.snapshot()
+                yield message
+        finally:
+            self.clients -= 1
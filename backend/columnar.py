@@ -0,0 +1,137 @@
+import gzip
+import json
+import struct
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Сигнатура и версия формата
+MAGIC = b'BKLB'
+VERSION = 1
+# Поле ответа -> (ключ массива в индексе, тип на проводе)
+EXPORT_FIELDS = {
+    'carStartId': ('start_id', '<i4'),
+    'carEndId': ('end_id', '<i4'),
+    'queueStart': ('start_x', '<f4'),
+    'queueEnd': ('end_x', '<f4'),
+    'queueLength': ('length', '<f4'),
+    'queueDuration': ('duration', '<f4'),
+    'flowSpeed': ('flow_speed', '<f4'),
+    'delay': ('delay', '<f4'),
+}
+MEDIA_TYPE = 'application/vnd.baikal.boundaries'
+COMPRESSIONS = ('none', 'gzip', 'zstd')
+
+
+def _time_deltas(ts: np.ndarray) -> np.ndarray:
+    # Кадры идут с шагом ~100 мс, в int32 микросекунд помещаются разрывы до ~35 минут
+    deltas = np.diff(ts)
+    if len(deltas) and (deltas.max() > np.iinfo(np.int32).max or deltas.min() < np.iinfo(np.int32).min):
+        return deltas.astype('<i8')
+    return deltas.astype('<i4')
+
+
+def encode_boundaries(ts: np.ndarray, lanes: Dict[int, Dict[str, np.ndarray]],
+                      compression: str = 'none') -> bytes:
+    """
+    Упаковывает временные ряды границ пробок в колоночный бинарный формат.
+
+    Формат: MAGIC, версия (uint8), длина заголовка (uint32 LE), JSON заголовок,
+    затем буферы колонок подряд. Время хранится как первый кадр в заголовке
+    (микросекунды от эпохи) и разности между соседними кадрами. Идентификаторы
+    машин - int32 (-1, если очереди нет), координаты, длины и метрики полос -
+    float32 (координаты NaN, если очереди нет). Сжимается весь пакет целиком.
+
+    Args:
+        ts (np.ndarray): Время кадров, int64 микросекунд от эпохи
+        lanes (Dict[int, Dict[str, np.ndarray]]): Массивы индекса по полосам за тот же период
+        compression (str): none, gzip или zstd
+
+    Returns:
+        bytes: Упакованные данные
+    """
+    columns = []
+    buffers = []
+    offset = 0
+
+    def add(name: str, values: np.ndarray, lane: Optional[int] = None):
+        nonlocal offset
+        data = np.ascontiguousarray(values).tobytes()
+        columns.append({'name': name, 'lane': lane, 'dtype': values.dtype.str, 'offset': offset, 'size': len(data)})
+        buffers.append(data)
+        offset += len(data)
+
+    add('timeDelta', _time_deltas(ts))
+    for lane, data in lanes.items():
+        for name, (key, dtype) in EXPORT_FIELDS.items():
+            if key in data:
+                add(name, data[key].astype(dtype), lane)
+
+    header = json.dumps({
+        'frames': len(ts),
+        't0': int(ts[0]) if len(ts) else None,
+        'lanes': list(lanes),
+        'columns': columns,
+    }, separators=(',', ':')).encode()
+    payload = b''.join([MAGIC, struct.pack('<BI', VERSION, len(header)), header, *buffers])
+    return compress(payload, compression)
+
+
+def decode_boundaries(payload: bytes, compression: str = 'none') -> Tuple[np.ndarray, Dict[int, Dict[str, np.ndarray]]]:
+    """
+    Обратное преобразование encode_boundaries
+
+    Args:
+        payload (bytes): Упакованные данные
+        compression (str): Каким способом они сжаты
+
+    Returns:
+        Tuple[np.ndarray, Dict[int, Dict[str, np.ndarray]]]: Время кадров в микросекундах
+        и колонки по полосам с именами полей ответа
+    """
+    payload = decompress(payload, compression)
+    if payload[:4] != MAGIC:
+        raise ValueError("Неизвестный формат данных")
+    version, header_size = struct.unpack_from('<BI', payload, 4)
+    if version != VERSION:
+        raise ValueError(f"Неподдерживаемая версия формата: {version}")
+    body = 4 + struct.calcsize('<BI') + header_size
+    header = json.loads(payload[body - header_size:body])
+
+    ts = np.empty(header['frames'], dtype=np.int64)
+    lanes = {lane: {} for lane in header['lanes']}
+    for column in header['columns']:
+        start = body + column['offset']
+        values = np.frombuffer(payload[start:start + column['size']], dtype=column['dtype'])
+        if column['name'] == 'timeDelta':
+            if len(ts):
+                ts[0] = header['t0']
+                ts[1:] = header['t0'] + np.cumsum(values, dtype=np.int64)
+        else:
+            lanes[column['lane']][column['name']] = values
+    return ts, lanes
+
+
+def compress(data: bytes, compression: str) -> bytes:
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=6)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError("Для сжатия zstd нужен пакет zstandard")
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return data
+
+
+def decompress(data: bytes, compression: str) -> bytes:
+    if compression == 'gzip':
+        return gzip.decompress(data)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError("Для сжатия zstd нужен пакет zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
@@ -1,8 +1,25 @@
 import os
+import re
+import time
+import numpy as np
+from concurrent.futures import Executor, ProcessPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Tuple
+from zoneinfo import ZoneInfo
+from typing import List, Dict, Tuple, Iterator, Optional
 from algorithm.models import Objects
-from algorithm.json_to_models import process_json_file
+from algorithm.json_to_models import iter_objects, read_sensor_config
+from algorithm.q import LANES, calculate_lane_metrics
+from algorithm.frames import FrameStore, Row
+from algorithm.timestamps import to_micros, from_micros
+from algorithm.rollups import build_rollups, compact, lane_series, merge_levels
+from algorithm.spatial import SpatialIndex
+from algorithm.triggers import TriggerEngine
+from backend.frame_cache import PARSE_WORKERS, get_frame_cache
+from backend.instrumentation import STAGE_SECONDS
+from backend.retention import (
+    RETENTION_HORIZON, history_path, load_history, load_segment, save_history, segment_path, spill_index, trim_index,
+    window_store,
+)
 import logging
 
 # Настраиваем логирование
@@ -15,109 +32,261 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Кэш для хранения данных
+# Путь к директории с данными
+DATA_DIR = os.getenv('DATA_DIR', '/home/ilinivan/baikal/algorithm/data')
+# Часовой пояс, в котором сенсор пишет время в дампы, по умолчанию пояс сервера
+DATA_TZ = os.getenv('DATA_TZ')
+# Имя файла: <префикс сенсора>DD_MM_YYYY_HH_MM.json
+FILENAME_RE = re.compile(r'^(?P<prefix>.*?)(?P<date>\d{2}_\d{2}_\d{4}_\d{2}_\d{2})\.json$')
+
+# Кэш для хранения данных: индекс очередей по каждому сенсору
 queue_data_cache = None
+# Описание сенсоров: sensor_id -> {'name', 'files', 'lanes'}
+sensors_cache = None
 
-def get_all_objects() -> List[Objects]:
-    # Путь к директории с данными
-    data_dir = '/home/ilinivan/baikal/algorithm/data'
+def list_data_files(data_dir: str = DATA_DIR) -> List[Tuple[str, datetime, str]]:
+    """
+    Возвращает файлы с данными в виде (префикс сенсора, время, путь),
+    отсортированные по префиксу и времени из имени файла
+    """
     logger.info(f"Чтение данных из директории: {data_dir}")
     
     # Получаем список всех файлов и сортируем их по времени
     files = []
     for filename in os.listdir(data_dir):
         if filename.endswith('.json'):
-            # Извлекаем дату и время из имени файла
-            # Формат: YYYY-MM-DD_HH-MM-SS.json
+            # Извлекаем префикс, дату и время из имени файла
+            match = FILENAME_RE.match(filename)
             try:
-                date_str = filename.replace('.json', '')
-                timestamp = datetime.strptime(date_str[len('Олимпийский'):], '%d_%m_%Y_%H_%M')
-                files.append((timestamp, filename))
-                logger.info(f"Найден файл с данными: {filename}")
+                if match is None:
+                    raise ValueError(filename)
+                timestamp = datetime.strptime(match.group('date'), '%d_%m_%Y_%H_%M')
+                files.append((match.group('prefix'), timestamp, os.path.join(data_dir, filename)))
+                logger.debug(f"Найден файл с данными: {filename}")
             except ValueError:
                 logger.exception(f"Не удалось распарсить дату из имени файла: {filename}")
                 continue
     
-    # Сортируем файлы по времени
-    files.sort(key=lambda x: x[0])
+    # Сортируем файлы по сенсору и времени
+    files.sort(key=lambda x: (x[0], x[1]))
     logger.info(f"Найдено {len(files)} файлов с данными")
-    
-    # Объединяем все objects
-    all_objects = []
-    for _, filename in files:
-        file_path = os.path.join(data_dir, filename)
-        sc = process_json_file(file_path)[0]
-        all_objects.extend(sc.objects)
-        logger.info(f"Загружено {len(sc.objects)} объектов из файла {filename}")
-    
+    return files
+
+def discover_sensors(data_dir: str = DATA_DIR) -> Dict[str, dict]:
+    """
+    Группирует файлы по сенсорам. Идентификатор сенсора и номера полос берутся
+    из конфигурации (SensorConfig.sensor_id и road_sensor_lanes) первого файла
+    каждой группы с одинаковым префиксом имени
+    """
+    groups = {}
+    for prefix, _, file_path in list_data_files(data_dir):
+        groups.setdefault(prefix, []).append(file_path)
+
+    sensors = {}
+    for prefix, file_paths in groups.items():
+        try:
+            config = read_sensor_config(file_paths[0])
+            sensor_id, lanes = config.sensor_id, config.lane_indexes or LANES
+            spatial = SpatialIndex.from_config(config)
+        except Exception:
+            logger.exception(f"Не удалось прочитать конфигурацию сенсора из {file_paths[0]}")
+            config, sensor_id, lanes, spatial = None, prefix, LANES, SpatialIndex.fallback()
+        sensor = sensors.setdefault(sensor_id, {'name': prefix, 'files': [], 'lanes': lanes, 'spatial': spatial,
+                                                'config': config})
+        sensor['files'].extend(file_paths)
+        logger.info(f"Сенсор {sensor_id} ({prefix}): {len(file_paths)} файлов, полосы {lanes}")
+    return sensors
+
+def get_sensors() -> Dict[str, dict]:
+    global sensors_cache
+    if sensors_cache is None:
+        sensors_cache = discover_sensors()
+    return sensors_cache
+
+def default_sensor_id() -> str:
+    return next(iter(get_sensors()))
+
+def iter_all_objects(sensor_id: Optional[str] = None) -> Iterator[Objects]:
+    """
+    Потоково отдает кадры сенсора из всех файлов по порядку, не загружая их целиком в память
+    """
+    sensor = get_sensors()[sensor_id or default_sensor_id()]
+    for file_path in sensor['files']:
+        count = 0
+        for obj in iter_objects(file_path):
+            count += 1
+            yield obj
+        logger.debug(f"Загружено {count} объектов из файла {os.path.basename(file_path)}")
+
+def get_all_objects(sensor_id: Optional[str] = None) -> List[Objects]:
+    """
+    Все кадры сенсора моделями Objects. Для расчетов лучше get_frame_store: файлы там
+    разбираются параллельно в колоночный кэш и сливаются по времени без повторов на стыках
+    """
+    all_objects = list(iter_all_objects(sensor_id))
     logger.info(f"Всего загружено {len(all_objects)} объектов")
     return all_objects
 
-def calculate_metrics(rows: List[dict], start_time: datetime, end_time: datetime) -> Tuple[float, float, float]:
+def _sensor_cache_name(sensor_id: str) -> str:
+    return re.sub(r'[^\w.-]', '_', sensor_id)
+
+def load_sensor_store(sensor_id: str, file_paths: List[str], parse_workers: Optional[int] = PARSE_WORKERS) -> FrameStore:
     """
-    Рассчитывает метрики для пробки:
-    - queue_length: длина пробки в метрах
-    - flow_speed: скорость потока в м/с
-    - delay: задержка в секундах
+    Загружает кадры сенсора в колоночное хранилище, минуя список моделей RowData.
+    Разобранные файлы берутся из дискового кэша, заново читаются только новые и измененные,
+    параллельно в parse_workers процессах
     """
-    if not rows:
-        return 0.0, 0.0, 0.0
-    
-    # Находим первую и последнюю машину в пробке
-    start_car = None
-    end_car = None
-    
-    for row in rows:
-        if start_time <= row['time'] <= end_time:
-            if row['obj_speed'] == 0:  # Машина в пробке
-                if start_car is None:
-                    start_car = row
-                end_car = row
-    
-    if start_car is None or end_car is None:
-        return 0.0, 0.0, 0.0
-    
-    # Рассчитываем длину пробки
-    queue_length = abs(end_car['point_x'] - start_car['point_x'])
-    
-    # Рассчитываем среднюю скорость потока
-    total_speed = sum(row['obj_speed'] for row in rows if row['obj_speed'] > 0)
-    moving_cars = sum(1 for row in rows if row['obj_speed'] > 0)
-    flow_speed = total_speed / moving_cars if moving_cars > 0 else 0
-    
-    # Рассчитываем задержку
-    delay = (end_time - start_time).total_seconds()
-    
-    return queue_length, flow_speed, delay
+    store = get_frame_cache(_sensor_cache_name(sensor_id)).get_all(file_paths, parse_workers)
+    logger.info(f"Сенсор {sensor_id}: загружено {len(store)} объектов ({store.n_rows} строк, {store.nbytes} байт)")
+    return store
 
-def get_queue_boundaries(start: datetime, stop: datetime) -> Dict[int, List[Tuple[datetime, ]]]:
+def get_frame_store(sensor_id: Optional[str] = None) -> FrameStore:
+    sensor_id = sensor_id or default_sensor_id()
+    return load_sensor_store(sensor_id, get_sensors()[sensor_id]['files'])
+
+def build_queue_index(store: FrameStore, lanes: List[int] = LANES, spatial: Optional[SpatialIndex] = None,
+                      horizon: float = RETENTION_HORIZON, history: Optional[dict] = None) -> dict:
+    """
+    Считает границы очередей и метрики полос по хранилищу, упорядоченному по
+    времени кадров, чтобы диапазонные запросы шли бинарным поиском.
+    Сразу же строятся агрегаты метрик по корзинам времени для запросов за длинные периоды
+    и события присутствия в зонах сенсора, если в конфигурации есть зоны.
+    Покадрово, вместе с хранилищем, остаются только последние horizon секунд, более
+    старые кадры вливаются в агрегаты истории history, см. trim_index. Новая история
+    возвращается в поле history, время стадий сборки в секундах - в поле timings
+    """
+    started = time.perf_counter()
+    ts = np.asarray(store.frame_times)
+    if len(ts) > 1 and np.any(ts[1:] < ts[:-1]):
+        store = store.take(np.argsort(ts, kind='stable'))
+        ts = np.asarray(store.frame_times)
+    boundaries = calculate_lane_metrics(store, lanes)
+    queued = time.perf_counter()
+    _, _, zone_events = TriggerEngine(spatial or SpatialIndex.fallback()).evaluate(store)
+    zone_events.sort(key=lambda event: event.time)
+    zoned = time.perf_counter()
+    index = {'store': store, 'ts': ts, 'lanes': boundaries, 'zone_events': zone_events}
+    index['history'] = trim_index(index, horizon, history)
+    index['rollups'] = compact(merge_levels(index['history']['rollups'],
+                                            build_rollups(index['ts'], lane_series(index['lanes']))))
+    index['timings'] = {'index_queue': queued - started, 'index_zones': zoned - queued,
+                        'index_rollups': time.perf_counter() - zoned}
+    return index
+
+def _build_sensor_shard(sensor_id: str, file_paths: List[str], lanes: List[int],
+                        spatial: Optional[SpatialIndex] = None, parse_workers: Optional[int] = PARSE_WORKERS) -> dict:
+    """
+    Обработка одного сенсора в отдельном процессе. Хранилище остается в дисковом
+    кэше, покадровые массивы индекса сбрасываются в сегмент рядом с ним, и обратно
+    передаются только агрегаты, события зон и путь к сегменту.
+    Агрегаты вытесненных кадров сохраняются в кэш до того, как из него удаляются
+    сами кадры, поэтому прерванная сборка ничего не теряет
+    """
+    started = time.perf_counter()
+    cache = get_frame_cache(_sensor_cache_name(sensor_id))
+    store = load_sensor_store(sensor_id, file_paths, parse_workers)
+    load_seconds = time.perf_counter() - started
+    index = build_queue_index(store, lanes, spatial, RETENTION_HORIZON, load_history(history_path(cache.cache_dir)))
+    index['timings']['load'] = load_seconds
+    history = index.pop('history')
+    if history['until'] is not None:
+        save_history(history, history_path(cache.cache_dir))
+        cache.retain(file_paths, history['until'])
+    del index['store']
+    return spill_index(index, segment_path(cache.cache_dir))
+
+def build_sensor_indexes(sensors: Dict[str, dict], max_workers: Optional[int] = None,
+                         pool: Optional[Executor] = None) -> Dict[str, dict]:
     """
-    Возвращает список границ пробок для каждой полосы в заданном временном промежутке.
-    Каждая граница - это кортеж (время начала, время окончания, длина пробки, скорость потока, задержка).
+    Строит индексы очередей для всех сенсоров, по одному процессу на сенсор,
+    и собирает их в одно хранилище sensor_id -> индекс.
+    Если передан pool, шарды считаются в нем, иначе один сенсор считается
+    в текущем процессе, а несколько - в новом пуле процессов
     """
+    indexes = {}
+    # Шарды сенсоров делят ядра для разбора файлов между собой
+    parse_workers = max(1, PARSE_WORKERS // max(len(sensors), 1))
+    if pool is None and (len(sensors) == 1 or max_workers == 1):
+        for sensor_id, sensor in sensors.items():
+            indexes[sensor_id] = _build_sensor_shard(sensor_id, sensor['files'], sensor['lanes'],
+                                                     sensor.get('spatial'), parse_workers)
+    else:
+        own_pool = pool is None
+        if own_pool:
+            pool = ProcessPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {
+                sensor_id: pool.submit(_build_sensor_shard, sensor_id, sensor['files'], sensor['lanes'],
+                                       sensor.get('spatial'), parse_workers)
+                for sensor_id, sensor in sensors.items()
+            }
+            for sensor_id, future in futures.items():
+                indexes[sensor_id] = future.result()
+        finally:
+            if own_pool:
+                pool.shutdown()
+    # Хранилища и сегменты индексов открываем в основном процессе через mmap из кэша, который
+    # заполнили шарды. Время стадий шарды меряют сами: метрики процессов пула в основной процесс не попадают
+    for sensor_id, sensor in sensors.items():
+        load_segment(indexes[sensor_id])
+        indexes[sensor_id]['store'] = window_store(load_sensor_store(sensor_id, sensor['files']),
+                                                   indexes[sensor_id]['ts'])
+        for name, seconds in indexes[sensor_id].pop('timings', {}).items():
+            STAGE_SECONDS.observe(seconds, name)
+    return indexes
+
+def set_queue_index(sensors: Dict[str, dict], indexes: Dict[str, dict]) -> None:
+    """Подменяет кэш сенсоров и индексов целиком, например после пересборки в фоне"""
+    global queue_data_cache, sensors_cache
+    sensors_cache, queue_data_cache = sensors, indexes
+
+def get_queue_index(sensor_id: Optional[str] = None) -> dict:
     global queue_data_cache
-    
-    logger.info(f"Запрос границ пробок для периода: {start} - {stop}")
-    
     # Если кэш пуст, загружаем данные
     if queue_data_cache is None:
         logger.info("Кэш пуст, загружаем данные...")
-        from algorithm.q import calculate_queue_meters
-        all_objects = get_all_objects()
-        queue_data_cache = calculate_queue_meters(all_objects)
+        queue_data_cache = build_sensor_indexes(get_sensors())
         logger.info("Данные загружены в кэш")
-    
-    
-    boundaries = {lane: [] for lane in range(3)}
-    for lane in range(3):  # 0, 1, 2
-        starts = queue_data_cache[lane]['starts']
-        ends = queue_data_cache[lane]['ends']
-        
-        for i in range(len(starts)):
-            if starts[i] and ends[i] and starts[i].time >= start and starts[i].time <= stop:
-                boundaries[lane].append((starts[i], ends[i], queue_data_cache[lane]['ts'][i]))
-            elif starts[i] is None or ends[i] is None:
-                boundaries[lane].append((None, None, queue_data_cache[lane]['ts'][i]))
-       
-    
-    return boundaries
\ No newline at end of file
+    return queue_data_cache[sensor_id or default_sensor_id()]
+
+def data_time(dt: datetime) -> datetime:
+    """
+    Приводит время запроса к времени дампов: в дампах локальное время DATA_TZ без
+    часового пояса, поэтому время с поясом (...Z, +03:00) переводится в DATA_TZ,
+    а наивное считается уже локальным
+    """
+    if dt.tzinfo is None or dt.utcoffset() is None:
+        return dt
+    return dt.astimezone(ZoneInfo(DATA_TZ) if DATA_TZ else None).replace(tzinfo=None)
+
+def find_time_range(ts: np.ndarray, start: datetime, stop: datetime) -> Tuple[int, int]:
+    """Возвращает полуинтервал индексов [lo, hi) кадров со временем в [start, stop]"""
+    lo = int(np.searchsorted(ts, to_micros(data_time(start)), side='left'))
+    hi = int(np.searchsorted(ts, to_micros(data_time(stop)), side='right'))
+    return lo, hi
+
+def boundaries_from_index(index: dict, start: datetime, stop: datetime) -> Dict[int, List[Tuple[Row, Row, datetime]]]:
+    """Границы пробок по всем полосам из готового индекса, см. get_queue_boundaries"""
+    store = index['store']
+    lo, hi = find_time_range(index['ts'], start, stop)
+    times = [from_micros(ts) for ts in index['ts'][lo:hi].tolist()]
+
+    boundaries = {}
+    for lane, data in index['lanes'].items():
+        start_rows = data['start_row'][lo:hi].tolist()
+        end_rows = data['end_row'][lo:hi].tolist()
+        boundaries[lane] = [
+            (store.row(start_row), store.row(end_row), ts) if start_row >= 0 else (None, None, ts)
+            for start_row, end_row, ts in zip(start_rows, end_rows, times)
+        ]
+    return boundaries
+
+def get_queue_boundaries(start: datetime, stop: datetime,
+                         sensor_id: Optional[str] = None) -> Dict[int, List[Tuple[Row, Row, datetime]]]:
+    """
+    Возвращает список границ пробок для каждой полосы сенсора в заданном временном промежутке.
+    Каждая граница - это кортеж (машина начала, машина конца, время кадра), для кадров
+    без очереди на полосе машины равны None. Списки всех полос выровнены по кадрам.
+    """
+    logger.info(f"Запрос границ пробок для периода: {start} - {stop}")
+    return boundaries_from_index(get_queue_index(sensor_id), start, stop)
@@ -0,0 +1,245 @@
+import json
+import os
+import shutil
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from algorithm.frames import FrameStore, COLUMNS
+from algorithm.json_to_models import iter_objects
+from backend.instrumentation import FILES, STAGE_SECONDS, stage
+
+logger = logging.getLogger(__name__)
+
+# Директория кэша разобранных данных
+CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(os.path.dirname(__file__), '.cache'))
+MANIFEST_NAME = 'manifest.json'
+CONSOLIDATED_NAME = '_merged'
+# Число процессов для разбора файлов, по умолчанию по числу ядер
+PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', '0')) or os.cpu_count() or 1
+
+
+def _fingerprint(file_path: str) -> Dict[str, int]:
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def save_store(store: FrameStore, path: str) -> None:
+    """
+    Сохраняет хранилище в директорию: по одному .npy файлу на колонку и offsets.
+    Запись идет во временную директорию, которая затем атомарно переименовывается
+    """
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name in COLUMNS:
+        np.save(os.path.join(tmp_path, f'{name}.npy'), np.ascontiguousarray(store.columns[name]))
+    np.save(os.path.join(tmp_path, 'offsets.npy'), np.ascontiguousarray(store.offsets))
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+def parse_file(file_path: str, store_path: str) -> float:
+    """
+    Разбирает JSON файл в колоночное хранилище на диске. Выполняется в процессах
+    пула: обратно передается только время разбора, сами колонки родитель
+    открывает через mmap
+
+    Returns:
+        float: Время разбора в секундах
+    """
+    started = time.perf_counter()
+    save_store(FrameStore.from_objects(iter_objects(file_path)), store_path)
+    return time.perf_counter() - started
+
+
+def load_store(path: str) -> FrameStore:
+    """Открывает сохраненное хранилище через mmap без чтения в память"""
+    columns = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in COLUMNS}
+    offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+    return FrameStore(columns, offsets)
+
+
+class FrameCache:
+    """
+    Кэш разобранных файлов с данными.
+
+    Для каждого исходного файла хранится колоночная копия, манифест содержит
+    имя, размер и mtime файла. Заново разбираются только новые и измененные
+    файлы, а склеенное хранилище пересобирается только при изменении набора
+    файлов.
+
+    Копии файлов - сегменты кольцевого буфера по времени: retain удаляет
+    копии файлов, все кадры которых старше горизонта хранения, и запоминает
+    их в манифесте как вытесненные. Вытесненные файлы больше не разбираются
+    и не попадают в склеенное хранилище, поэтому оно с точностью до файла
+    покрывает только горизонт хранения, и новый файл сливается с ним, а не
+    со всей историей.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+        os.makedirs(cache_dir, exist_ok=True)
+        self.manifest = self._read_manifest()
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            manifest = {}
+        # Кэш со старым набором колонок разбирается заново
+        if manifest.get('columns') != list(COLUMNS):
+            return {'columns': list(COLUMNS), 'files': {}, 'consolidated': None, 'evicted': {}}
+        manifest.setdefault('evicted', {})
+        return manifest
+
+    def _write_manifest(self) -> None:
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _store_path(self, filename: str) -> str:
+        return os.path.join(self.cache_dir, filename + '.frames')
+
+    def get(self, file_path: str) -> FrameStore:
+        """
+        Возвращает хранилище для одного файла, разбирая его только при изменении
+
+        Args:
+            file_path (str): Путь к JSON файлу
+
+        Returns:
+            FrameStore: Хранилище, открытое через mmap
+        """
+        filename = os.path.basename(file_path)
+        fingerprint = _fingerprint(file_path)
+        store_path = self._store_path(filename)
+        if self.manifest['files'].get(filename) == fingerprint and os.path.isdir(store_path):
+            return load_store(store_path)
+
+        logger.debug(f"Разбор файла {filename} в кэш")
+        STAGE_SECONDS.observe(parse_file(file_path, store_path), 'parse')
+        FILES.inc('cache')
+        self.manifest['files'][filename] = fingerprint
+        self._write_manifest()
+        return load_store(store_path)
+
+    def _is_cached(self, file_path: str) -> bool:
+        filename = os.path.basename(file_path)
+        return self.manifest['files'].get(filename) == _fingerprint(file_path) and \
+            os.path.isdir(self._store_path(filename))
+
+    def parse_missing(self, file_paths: List[str], max_workers: Optional[int] = PARSE_WORKERS) -> None:
+        """
+        Разбирает в кэш новые и измененные файлы параллельно в пуле процессов.
+        Декодирование JSON и валидация моделей упираются в процессор, поэтому
+        файлы расходятся по ядрам, а манифест пишет только текущий процесс
+
+        Args:
+            file_paths (List[str]): Пути к JSON файлам
+            max_workers (Optional[int]): Число процессов, 1 - разбор в текущем процессе, None - PARSE_WORKERS
+        """
+        max_workers = max_workers or PARSE_WORKERS
+        missing = [path for path in file_paths if not self._is_cached(path)]
+        if len(missing) < 2 or max_workers == 1:
+            for path in missing:
+                self.get(path)
+            return
+
+        logger.info(f"Разбор {len(missing)} файлов в кэш, процессов: {min(max_workers, len(missing))}")
+        # Отпечаток снимается до разбора: файл, измененный во время разбора, разберется заново
+        fingerprints = {path: _fingerprint(path) for path in missing}
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(missing))) as pool:
+            futures = {path: pool.submit(parse_file, path, self._store_path(os.path.basename(path)))
+                       for path in missing}
+            for path, future in futures.items():
+                STAGE_SECONDS.observe(future.result(), 'parse')
+                FILES.inc('cache')
+                self.manifest['files'][os.path.basename(path)] = fingerprints[path]
+        self._write_manifest()
+
+    def retained(self, file_paths: List[str]) -> List[str]:
+        """Файлы, которые еще не вытеснены из кэша, см. retain"""
+        return [path for path in file_paths if os.path.basename(path) not in self.manifest['evicted']]
+
+    def get_all(self, file_paths: List[str], max_workers: Optional[int] = PARSE_WORKERS) -> FrameStore:
+        """
+        Возвращает хранилище по всем невытесненным файлам с кадрами по возрастанию
+        времени и без повторов на стыках файлов, см. FrameStore.merge
+
+        Args:
+            file_paths (List[str]): Пути к JSON файлам, отсортированные по времени
+            max_workers (Optional[int]): Число процессов для разбора новых файлов, None - PARSE_WORKERS
+
+        Returns:
+            FrameStore: Хранилище, открытое через mmap
+        """
+        # Манифест мог обновить другой процесс, например воркер пересборки индекса
+        self.manifest = self._read_manifest()
+        filenames = {os.path.basename(path) for path in file_paths}
+        file_paths = self.retained(file_paths)
+        key = [[os.path.basename(path), _fingerprint(path)] for path in file_paths]
+        consolidated_path = os.path.join(self.cache_dir, CONSOLIDATED_NAME)
+        if self.manifest.get('consolidated') == key and os.path.isdir(consolidated_path):
+            logger.info("Данные загружены из кэша")
+            return load_store(consolidated_path)
+
+        self.parse_missing(file_paths, max_workers)
+        stores = [self.get(path) for path in file_paths]
+        with stage('merge'):
+            store = FrameStore.merge(stores)
+            save_store(store, consolidated_path)
+        self.manifest['consolidated'] = key
+        self._drop_stale(filenames)
+        self._write_manifest()
+        return load_store(consolidated_path)
+
+    def retain(self, file_paths: List[str], cutoff: int) -> None:
+        """
+        Вытесняет из кэша копии файлов, все кадры которых раньше cutoff, и
+        пересобирает склеенное хранилище по оставшимся файлам. Перед вызовом
+        кадры до cutoff должны быть учтены в агрегатах, из кэша они пропадают
+
+        Args:
+            file_paths (List[str]): Пути к JSON файлам, отсортированные по времени
+            cutoff (int): Начало горизонта хранения в микросекундах
+        """
+        evicted = []
+        for path in self.retained(file_paths):
+            times = self.get(path).frame_times
+            if not len(times) or int(np.max(times)) < cutoff:
+                evicted.append(os.path.basename(path))
+        if not evicted:
+            return
+        for filename in evicted:
+            shutil.rmtree(self._store_path(filename), ignore_errors=True)
+            self.manifest['evicted'][filename] = self.manifest['files'].pop(filename)
+        self._write_manifest()
+        logger.info(f"Из кэша вытеснено {len(evicted)} файлов с кадрами до горизонта хранения")
+        self.get_all(file_paths)
+
+    def _drop_stale(self, filenames: set) -> None:
+        for filename in list(self.manifest['files']):
+            if filename not in filenames:
+                shutil.rmtree(self._store_path(filename), ignore_errors=True)
+                del self.manifest['files'][filename]
+        # Исходные файлы удалены из директории данных, помнить их вытесненными больше незачем
+        for filename in list(self.manifest['evicted']):
+            if filename not in filenames:
+                del self.manifest['evicted'][filename]
+
+
+_frame_caches: Dict[str, FrameCache] = {}
+
+
+def get_frame_cache(name: str = '') -> FrameCache:
+    """Возвращает кэш в поддиректории name, у каждого сенсора он свой"""
+    if name not in _frame_caches:
+        _frame_caches[name] = FrameCache(os.path.join(CACHE_DIR, name) if name else CACHE_DIR)
+    return _frame_caches[name]
@@ -0,0 +1,287 @@
+import argparse
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from algorithm.json_to_models import frame_to_model, iter_frame_dicts, iter_objects, read_sensor_config
+from algorithm.metrics.avg_stops_count import StopsTracker
+from algorithm.metrics.delay_time import DelayTracker
+from algorithm.models import Objects
+from algorithm.q import LANES, LaneMetricsTracker
+from algorithm.spatial import SpatialIndex
+from algorithm.triggers import TriggerEngine
+from algorithm.timestamps import MICROS, format_micros, from_micros
+from algorithm.tracks import TrackStore
+from backend.instrumentation import FILES, FRAMES, STAGE_ERRORS, Gauge, stage, timed_iter
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних снимков метрик держим в памяти
+HISTORY_SIZE = 3000
+# Максимальный размер UDP датаграммы
+MAX_DATAGRAM = 65507
+
+WATCH_BACKLOG = Gauge('watch_backlog_files', "Файлы в директории live-источника, которые еще не обработаны")
+
+
+class LiveMetrics:
+    """
+    Метрики перекрестка, которые обновляются по мере прихода кадров.
+
+    Для каждого кадра метрики полос считаются через LaneMetricsTracker,
+    а среднее число остановок и задержка по перекрестку обновляются через
+    StopsTracker и DelayTracker, а зоны сенсора - через TriggerEngine.
+    Состояние ограничено: трекеры забывают
+    уехавшие машины, а история снимков хранится в кольцевом буфере.
+    """
+
+    def __init__(self, history_size: int = HISTORY_SIZE, spatial: Optional[SpatialIndex] = None):
+        # Геометрия полос сенсора для фильтров метрик, без нее прежние правила по полосам и point_x
+        self.spatial = spatial or SpatialIndex.fallback()
+        self.stops = StopsTracker(keep_history=False, spatial=self.spatial)
+        self.delay = DelayTracker(self.spatial)
+        self.triggers = TriggerEngine(self.spatial)
+        self.history = deque(maxlen=history_size)
+        self.last_delay = 0.0
+        # Трекинг машин общий для всех метрик и делается один раз на кадр
+        self.tracks = TrackStore()
+        lanes = sorted({lane.lane_index for lane in self.spatial.lanes}) or LANES
+        self.lanes = LaneMetricsTracker(lanes, track_store=self.tracks)
+        self.lock = threading.Lock()
+        self.listeners: List[Callable[[dict], None]] = []
+
+    def subscribe(self, listener: Callable[[dict], None]) -> None:
+        self.listeners.append(listener)
+
+    def process(self, frame: Objects) -> dict:
+        """
+        Обрабатывает один кадр и возвращает снимок метрик
+
+        Args:
+            frame (Objects): Кадр с сенсора
+
+        Returns:
+            dict: Время кадра в микросекундах от эпохи, состояние очереди по полосам, среднее число остановок, задержка,
+            занятость зон и события присутствия
+        """
+        frame_time = frame.rows_data[0].time
+        with stage('track'):
+            tracks = self.tracks.update(frame)
+        with stage('queue'):
+            lanes = self.lanes.update(frame, tracks)
+        with stage('zones'):
+            zone_events = self.triggers.update(frame)
+
+        with self.lock, stage('metrics'):
+            avg_stops = self.stops.update(frame, tracks)
+            delays = self.delay.update(frame, tracks)
+            if delays:
+                self.last_delay = delays[1]
+            snapshot = {
+                'time': frame_time,
+                'lanes': lanes,
+                'avgStops': avg_stops,
+                'delay': self.last_delay,
+                'zones': self.triggers.state(),
+                'zoneEvents': [event._asdict() for event in zone_events],
+            }
+            self.history.append(snapshot)
+        FRAMES.inc('live')
+
+        for listener in self.listeners:
+            try:
+                listener(snapshot)
+            except Exception:
+                logger.exception("Ошибка в обработчике снимка метрик")
+        return snapshot
+
+    @property
+    def last(self) -> Optional[dict]:
+        with self.lock:
+            return self.history[-1] if self.history else None
+
+    def run(self, frames: Iterable[Objects]) -> None:
+        for frame in frames:
+            if frame.rows_data:
+                self.process(frame)
+
+    def start(self, frames: Iterable[Objects]) -> threading.Thread:
+        """Запускает обработку источника кадров в фоновом потоке"""
+        thread = threading.Thread(target=self.run, args=(frames,), daemon=True)
+        thread.start()
+        return thread
+
+
+def _frames_from_json(data: dict) -> Iterator[Objects]:
+    # Датаграмма содержит либо один кадр, либо дамп целиком с полем objects
+    frames = data['objects'] if 'objects' in data else [data]
+    for frame in frames:
+        if frame.get('rows_data'):
+            with stage('validate'):
+                model = frame_to_model(frame)
+            yield model
+
+
+def udp_frames(host: str, port: int) -> Iterator[Objects]:
+    """
+    Принимает кадры по UDP, одна JSON датаграмма - один кадр
+
+    Args:
+        host (str): Адрес для прослушивания
+        port (int): Порт
+
+    Returns:
+        Iterator[Objects]: Кадры по мере поступления
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+    logger.info(f"Ожидание кадров на udp://{host}:{port}")
+    try:
+        while True:
+            payload, _ = sock.recvfrom(MAX_DATAGRAM)
+            try:
+                with stage('decode'):
+                    data = json.loads(payload)
+                yield from _frames_from_json(data)
+            except Exception:
+                STAGE_ERRORS.inc('decode')
+                logger.exception("Не удалось разобрать датаграмму")
+    finally:
+        sock.close()
+
+
+def watch_directory(data_dir: str, poll_interval: float = 1.0) -> Iterator[Objects]:
+    """
+    Следит за директорией и потоково отдает кадры из новых JSON файлов.
+    Файл берется в обработку, когда его размер перестает меняться между опросами
+
+    Args:
+        data_dir (str): Директория с файлами дампов
+        poll_interval (float): Интервал опроса в секундах
+
+    Returns:
+        Iterator[Objects]: Кадры по мере появления файлов
+    """
+    seen = set()
+    sizes = {}
+    logger.info(f"Слежение за директорией {data_dir}")
+    while True:
+        filenames = [filename for filename in sorted(os.listdir(data_dir))
+                     if filename.endswith('.json') and filename not in seen]
+        for filename in filenames:
+            size = os.path.getsize(os.path.join(data_dir, filename))
+            if sizes.get(filename) != size:
+                sizes[filename] = size
+                continue
+            seen.add(filename)
+            del sizes[filename]
+            WATCH_BACKLOG.set(len(filenames) - filenames.index(filename))
+            logger.info(f"Новый файл с данными: {filename}")
+            try:
+                for frame in timed_iter(iter_frame_dicts(os.path.join(data_dir, filename)), 'decode'):
+                    with stage('validate'):
+                        model = frame_to_model(frame)
+                    yield model
+            except Exception:
+                STAGE_ERRORS.inc('decode')
+                logger.exception(f"Ошибка при обработке файла {filename}")
+            FILES.inc('watch')
+        WATCH_BACKLOG.set(0)
+        time.sleep(poll_interval)
+
+
+def _frame_to_json(frame: Objects) -> str:
+    # Время отдаем в формате сенсора, как в исходных дампах
+    data = frame.model_dump()
+    for row in data['rows_data']:
+        row['time'] = format_micros(row['time'])
+    return json.dumps(data)
+
+
+def replay(file_path: str, host: str, port: int, speed: float = 1.0) -> None:
+    """
+    Проигрывает дамп по UDP с исходными интервалами между кадрами.
+    Используется для локальной проверки приема кадров
+
+    Args:
+        file_path (str): Путь к JSON файлу
+        host (str): Адрес получателя
+        port (int): Порт получателя
+        speed (float): Ускорение воспроизведения, 0 - без пауз
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    prev_time: Optional[int] = None
+    sent = 0
+    for frame in iter_objects(file_path):
+        curr_time = frame.rows_data[0].time
+        if prev_time is not None and speed > 0:
+            time.sleep(max(0.0, (curr_time - prev_time) / MICROS / speed))
+        prev_time = curr_time
+        sock.sendto(_frame_to_json(frame).encode(), (host, port))
+        sent += 1
+    sock.close()
+    logger.info(f"Отправлено {sent} кадров из {file_path}")
+
+
+def load_spatial(file_path: Optional[str]) -> SpatialIndex:
+    """
+    Строит индекс полос и зон по конфигурации из файла с данными сенсора
+
+    Args:
+        file_path (Optional[str]): Путь к JSON файлу, None - индекс с прежними правилами
+
+    Returns:
+        SpatialIndex: Индекс полос и зон сенсора
+    """
+    if not file_path:
+        return SpatialIndex.fallback()
+    try:
+        return SpatialIndex.from_config(read_sensor_config(file_path))
+    except Exception:
+        logger.exception(f"Не удалось построить индекс полос по {file_path}, используются правила по умолчанию")
+        return SpatialIndex.fallback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Прием кадров с сенсора и расчет метрик в реальном времени")
+    parser.add_argument('--config', help="файл с данными сенсора, из которого берется геометрия полос и зон")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    listen_parser = subparsers.add_parser('listen', help="принимать кадры по UDP")
+    listen_parser.add_argument('--host', default='0.0.0.0')
+    listen_parser.add_argument('--port', type=int, default=9000)
+
+    watch_parser = subparsers.add_parser('watch', help="следить за директорией с дампами")
+    watch_parser.add_argument('data_dir')
+    watch_parser.add_argument('--interval', type=float, default=1.0)
+
+    replay_parser = subparsers.add_parser('replay', help="проиграть дамп по UDP")
+    replay_parser.add_argument('file_path')
+    replay_parser.add_argument('--host', default='127.0.0.1')
+    replay_parser.add_argument('--port', type=int, default=9000)
+    replay_parser.add_argument('--speed', type=float, default=1.0)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == 'replay':
+        replay(args.file_path, args.host, args.port, args.speed)
+        return
+
+    frames = udp_frames(args.host, args.port) if args.command == 'listen' else \
+        watch_directory(args.data_dir, args.interval)
+    metrics = LiveMetrics(spatial=load_spatial(args.config))
+    metrics.subscribe(lambda snapshot: logger.info(
+        f"{from_micros(snapshot['time'])}: " + ', '.join(
+            f"lane {lane['laneId']} {lane['queueLength']:.1f} м" for lane in snapshot['lanes'])
+        + f", avgStops {snapshot['avgStops']:.2f}, delay {snapshot['delay']:.1f} с"))
+    metrics.run(frames)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Префикс имен метрик
+NAMESPACE = 'baikal'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Границы корзин гистограмм времени стадий, секунды: от 50 мкс на кадр до минут на пересборку индекса
+STAGE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+# Интервал сэмплирования профайлера при старте, секунды, 0 - выключен
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0'))
+# Глубина стека, которая сохраняется в профиле
+PROFILE_DEPTH = 64
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = f"{NAMESPACE}_{name}"
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """Строки метрики: (имя, метки в формате Prometheus, значение)"""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонный счетчик, по значению на набор меток"""
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        for labels, value in items:
+            yield self.name, _format_labels(self.labels, labels), value
+
+
+class Gauge(_Metric):
+    """
+    Текущее значение. Либо выставляется через set, либо читается при выдаче
+    из функции, которая возвращает число или словарь метки -> число
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 read: Optional[Callable[[], object]] = None):
+        super().__init__(name, help, labels)
+        self.values: Dict[tuple, float] = {}
+        self.read = read
+
+    def set(self, value: float, *labels: str) -> None:
+        with self.lock:
+            self.values[labels] = value
+
+    def samples(self):
+        if self.read is not None:
+            value = self.read()
+            items = value.items() if isinstance(value, dict) else [((), value)]
+            items = [(labels if isinstance(labels, tuple) else (labels,), v) for labels, v in items]
+        else:
+            with self.lock:
+                items = list(self.values.items())
+        for labels, value in items:
+            yield self.name, _format_labels(self.labels, labels), value
+
+
+class Histogram(_Metric):
+    """
+    Гистограмма с фиксированными корзинами. Наблюдение - бинарный поиск корзины
+    и три сложения под блокировкой, накопительные суммы считаются только при выдаче
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = STAGE_BUCKETS):
+        super().__init__(name, help, labels)
+        self.bounds = tuple(buckets)
+        # Метки -> [счетчики корзин (последняя - +Inf), сумма, число]
+        self.values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [[0] * (len(self.bounds) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self):
+        with self.lock:
+            items = [(labels, (list(counts), total, count)) for labels, (counts, total, count) in self.values.items()]
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.bounds + (float('inf'),), counts):
+                cumulative += n
+                yield (f"{self.name}_bucket",
+                       _format_labels(self.labels, labels, f'le="{_format_value(float(bound))}"'), cumulative)
+            yield f"{self.name}_sum", _format_labels(self.labels, labels), total
+            yield f"{self.name}_count", _format_labels(self.labels, labels), count
+
+
+REGISTRY: List[_Metric] = []
+
+# Стадии конвейера: decode, validate, track, queue, metrics, zones, serialize, а для индекса
+# parse (разбор файла в кэш), index (метрики по хранилищу) и rebuild (пересборка целиком)
+STAGE_SECONDS = Histogram('stage_seconds', "Время стадии конвейера обработки кадров", ('stage',))
+STAGE_ERRORS = Counter('stage_errors_total', "Ошибки по стадиям", ('stage',))
+FRAMES = Counter('frames_total', "Обработанные кадры по источникам", ('source',))
+FILES = Counter('files_total', "Файлы с данными, прочитанные по источникам", ('source',))
+HTTP_SECONDS = Histogram('http_request_seconds', "Время ответа API до отправки заголовков",
+                         ('method', 'route', 'status'))
+
+
+def stage(name: str):
+    """Контекстный менеджер, который записывает время стадии в STAGE_SECONDS"""
+    return STAGE_SECONDS.time(name)
+
+
+def timed_iter(items: Iterator, name: str) -> Iterator:
+    """Отдает элементы итератора, записывая время получения каждого как время стадии name"""
+    items = iter(items)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(items)
+        except StopIteration:
+            return
+        STAGE_SECONDS.observe(time.perf_counter() - started, name)
+        yield item
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профайлер всех потоков процесса.
+
+    Фоновый поток раз в interval секунд снимает стеки через sys._current_frames
+    и считает одинаковые стеки. Замедление работающего кода - только на время
+    снятия стеков под GIL, поэтому профайлер можно включать под live-нагрузкой.
+    Результат - свернутые стеки (folded), которые понимают flamegraph.pl и speedscope
+    """
+
+    def __init__(self):
+        self.stacks: StackCounter = StackCounter()
+        self.samples = 0
+        self.interval = 0.0
+        self.started_at: Optional[float] = None
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.01) -> None:
+        """Запускает сэмплирование заново, прежний профиль сбрасывается"""
+        self.stop()
+        with self.lock:
+            self.stacks = StackCounter()
+            self.samples = 0
+        self.interval = interval
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            if len(names) != threading.active_count():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            sampled = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < PROFILE_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                sampled.append(';'.join(reversed(stack)))
+            with self.lock:
+                self.stacks.update(sampled)
+                self.samples += 1
+
+    def folded(self) -> str:
+        """Свернутые стеки: строка 'поток;функция;...;функция число_сэмплов' на стек"""
+        with self.lock:
+            items = self.stacks.most_common()
+        return ''.join(f"{stack} {count}\n" for stack, count in items)
+
+
+profiler = SamplingProfiler()
+PROFILER_SAMPLES = Gauge('profiler_samples', "Сэмплов в текущем профиле, 0 - профайлер не запускался",
+                         read=lambda: profiler.samples)
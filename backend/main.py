@@ -1,10 +1,19 @@
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional, List
+from typing import Callable, Dict, Optional, List, Tuple
 from pydantic import BaseModel
+import asyncio
+import bisect
+import numpy as np
 import sys
 import os
+import time
 import logging
 
 import json
@@ -20,12 +29,217 @@ logger = logging.getLogger(__name__)
 
 # Добавляем путь к корневой директории
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from backend.data_loader import get_queue_boundaries
+from backend.data_loader import (
+    discover_sensors, build_sensor_indexes, set_queue_index, get_queue_index, find_time_range, data_time,
+)
+from backend.broadcast import LaneStateBroadcaster
+from backend.columnar import COMPRESSIONS, MEDIA_TYPE, compress, encode_boundaries
+from backend.ingest import LiveMetrics, load_spatial, udp_frames, watch_directory
+from backend.predict import PredictionService
+from backend.retention import segment_cache
+from backend.instrumentation import (
+    CONTENT_TYPE, HTTP_SECONDS, PROFILE_INTERVAL, STAGE_SECONDS, Gauge, profiler, render, stage,
+)
+from algorithm.phases import PhaseOptimizer
+from algorithm.timestamps import from_micros, to_micros
+from algorithm.rollups import (
+    RESOLUTIONS, RollupAccumulator, choose_resolution, lane_series, snapshot_series, summarize, summary_range,
+)
+
+# Интервал фоновой пересборки индекса в секундах, 0 - только при старте и по /refresh
+REFRESH_INTERVAL = float(os.getenv('REFRESH_INTERVAL', '0'))
+# Число процессов для пересборки индекса, по умолчанию по числу ядер
+INDEX_WORKERS = int(os.getenv('INDEX_WORKERS', '0')) or None
+# Источник кадров для live-обновлений: UDP порт или директория с дампами, по умолчанию выключен
+LIVE_UDP_HOST = os.getenv('LIVE_UDP_HOST', '0.0.0.0')
+LIVE_UDP_PORT = int(os.getenv('LIVE_UDP_PORT', '0'))
+LIVE_WATCH_DIR = os.getenv('LIVE_WATCH_DIR')
+# Файл с данными сенсора, из конфигурации которого берется геометрия полос для live-метрик
+LIVE_CONFIG_FILE = os.getenv('LIVE_CONFIG_FILE')
+# Сенсор, с которого идут live-кадры, по умолчанию первый найденный
+LIVE_SENSOR_ID = os.getenv('LIVE_SENSOR_ID')
+# Предел числа корзин в ответе /rollups при resolution=auto
+MAX_ROLLUP_POINTS = 1000
+
+
+class QueueIndexService:
+    """
+    Держит готовый индекс очередей для запросов API.
+
+    Пересборка идет в пуле процессов, а event loop только ждет ее результат,
+    поэтому запросы во время обновления данных обслуживаются из предыдущего
+    снимка. Новый снимок подменяется целиком одной операцией присваивания.
+    """
+
+    def __init__(self, max_workers: Optional[int] = INDEX_WORKERS):
+        self.max_workers = max_workers
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.sensors: Optional[dict] = None
+        self.indexes: Optional[dict] = None
+        self.updated_at: Optional[datetime] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._periodic_task: Optional[asyncio.Task] = None
+        self.listeners: List[Callable[[dict], None]] = []
+
+    def subscribe(self, listener: Callable[[dict], None]) -> None:
+        """listener вызывается с новым снимком индексов после каждой пересборки"""
+        self.listeners.append(listener)
+
+    def _rebuild(self) -> Tuple[dict, dict]:
+        sensors = discover_sensors()
+        return sensors, build_sensor_indexes(sensors, pool=self.pool)
+
+    async def _refresh(self) -> None:
+        started = datetime.now()
+        loop = asyncio.get_running_loop()
+        sensors, indexes = await loop.run_in_executor(None, self._rebuild)
+        self.sensors, self.indexes = sensors, indexes
+        self.updated_at = datetime.now()
+        STAGE_SECONDS.observe((self.updated_at - started).total_seconds(), 'rebuild')
+        set_queue_index(sensors, indexes)
+        logger.info(f"Индекс очередей обновлен за {(self.updated_at - started).total_seconds():.2f} с")
+        for listener in self.listeners:
+            try:
+                listener(indexes)
+            except Exception:
+                logger.exception("Ошибка в обработчике обновления индекса")
+
+    def refresh(self) -> asyncio.Task:
+        """Запускает пересборку индекса, если она еще не идет, и возвращает ее задачу"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+            self._refresh_task.add_done_callback(self._log_failure)
+        return self._refresh_task
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Не удалось пересобрать индекс очередей", exc_info=task.exception())
+
+    async def _refresh_periodically(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.gather(self.refresh(), return_exceptions=True)
+
+    @property
+    def refreshing(self) -> bool:
+        return self._refresh_task is not None and not self._refresh_task.done()
+
+    def start(self) -> None:
+        self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        self.refresh()
+        if REFRESH_INTERVAL > 0:
+            self._periodic_task = asyncio.create_task(self._refresh_periodically(REFRESH_INTERVAL))
+
+    async def stop(self) -> None:
+        for task in (self._periodic_task, self._refresh_task):
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*(t for t in (self._periodic_task, self._refresh_task) if t), return_exceptions=True)
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    def get(self, sensor_id: Optional[str] = None) -> Tuple[str, dict]:
+        """
+        Возвращает индекс сенсора из текущего снимка, по умолчанию первого сенсора.
+        Покадровые массивы берутся из памяти, если индекс влезает в бюджет segment_cache
+        """
+        indexes = self.indexes
+        if indexes is None:
+            raise HTTPException(status_code=503, detail="Индекс очередей еще строится")
+        sensor_id = sensor_id or next(iter(indexes))
+        if sensor_id not in indexes:
+            raise HTTPException(status_code=404, detail=f"Неизвестный сенсор {sensor_id}")
+        return sensor_id, segment_cache.get(sensor_id, indexes[sensor_id])
+
+
+index_service = QueueIndexService()
+live_metrics = LiveMetrics(spatial=load_spatial(LIVE_CONFIG_FILE))
+broadcaster = LaneStateBroadcaster()
+live_rollups = RollupAccumulator()
+live_metrics.subscribe(broadcaster.publish)
+live_metrics.subscribe(lambda snapshot: live_rollups.add(snapshot['time'], snapshot_series(snapshot)))
+# Прогноз по каждому сенсору со своим набором полос: sensor_id -> сервис
+predictions: Dict[str, PredictionService] = {}
+
+
+def live_sensor_id() -> Optional[str]:
+    return LIVE_SENSOR_ID or next(iter(index_service.sensors or {}), None)
+
+
+def observe_live_prediction(snapshot: dict) -> None:
+    service = predictions.get(live_sensor_id())
+    if service is not None:
+        service.observe(snapshot)
+
+
+def rebuild_predictions(indexes: dict) -> None:
+    # Сервис пересоздается, только если у сенсора изменился набор полос, иначе окна признаков сохраняются.
+    # Без источника live-кадров прогноз каждого сенсора строится по концу его данных
+    sensors = index_service.sensors or {}
+    for sensor_id in list(predictions):
+        if sensor_id not in sensors or predictions[sensor_id].windows.lanes != list(sensors[sensor_id]['lanes']):
+            predictions.pop(sensor_id).shutdown()
+    for sensor_id, sensor in sensors.items():
+        if sensor_id not in predictions:
+            predictions[sensor_id] = PredictionService(sensor['lanes'])
+        service, index = predictions[sensor_id], indexes.get(sensor_id)
+        if not (LIVE_UDP_PORT or LIVE_WATCH_DIR) and service.get() is None and index is not None:
+            service.seed(index['ts'], lane_series(index['lanes']))
+
+
+live_metrics.subscribe(observe_live_prediction)
+index_service.subscribe(rebuild_predictions)
+phase_optimizer = PhaseOptimizer([])
+
+
+def rebuild_phase_optimizer(indexes: dict) -> None:
+    # Сенсоры перекрестка - его подходы, граф направлений строится по их конфигурациям
+    global phase_optimizer
+    configs = [sensor['config'] for sensor in (index_service.sensors or {}).values() if sensor.get('config')]
+    phase_optimizer = PhaseOptimizer.from_configs(configs)
+
+
+index_service.subscribe(rebuild_phase_optimizer)
+
+# Глубина очередей и буферов, читается при каждом запросе /metrics
+Gauge('live_history_snapshots', "Снимки live-метрик в кольцевом буфере", read=lambda: len(live_metrics.history))
+Gauge('broadcast_buffer_messages', "Дельты в буфере рассылки", read=lambda: len(broadcaster.buffer))
+Gauge('broadcast_clients', "Подписчики /live и /ws/live", read=lambda: broadcaster.clients)
+Gauge('prediction_backlog_batches', "Батчи признаков в оценке и в ожидании", ('sensor',),
+      read=lambda: {sensor_id: service.backlog for sensor_id, service in list(predictions.items())})
+Gauge('index_refreshing', "Идет ли пересборка индекса очередей", read=lambda: int(index_service.refreshing))
+Gauge('index_frames', "Кадры в индексе очередей по сенсорам", ('sensor',),
+      read=lambda: {sensor_id: len(index['ts']) for sensor_id, index in (index_service.indexes or {}).items()})
+
+
+def start_live_ingest() -> None:
+    if LIVE_UDP_PORT:
+        live_metrics.start(udp_frames(LIVE_UDP_HOST, LIVE_UDP_PORT))
+    elif LIVE_WATCH_DIR:
+        live_metrics.start(watch_directory(LIVE_WATCH_DIR))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Индекс строится в фоне, сервер начинает принимать запросы сразу
+    index_service.start()
+    broadcaster.attach(asyncio.get_running_loop())
+    start_live_ingest()
+    if PROFILE_INTERVAL > 0:
+        profiler.start(PROFILE_INTERVAL)
+    yield
+    profiler.stop()
+    await index_service.stop()
+    for service in predictions.values():
+        service.shutdown()
+
 
 app = FastAPI(
     title="Traffic Jam API",
     description="API для получения информации о пробках",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Настройка CORS
@@ -37,6 +251,16 @@ app.add_middleware(
     allow_headers=["*"],  # Разрешаем все заголовки
 )
 
+@app.middleware("http")
+async def observe_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Шаблон пути, а не сам путь, чтобы число рядов метрики не росло с параметрами
+    route = request.scope.get('route')
+    HTTP_SECONDS.observe(time.perf_counter() - started, request.method,
+                         getattr(route, 'path', 'unmatched'), str(response.status_code))
+    return response
+
 class Lane(BaseModel):
     laneId: int
     carStartId: int | None = None
@@ -56,89 +280,440 @@ class Boundary(BaseModel):
         }
     }
 
+class LaneBoundary(BaseModel):
+    time: datetime
+    carStartId: int | None = None
+    carEndId: int | None = None
+    queueStart: float | None = None  # point_x первой стоящей машины
+    queueEnd: float | None = None  # point_x конца очереди
+    queueLength: float  # длина пробки в метрах
+    queueDuration: float  # длительность пробки в секундах
+    flowSpeed: float  # скорость потока в м/с
+    delay: float  # задержка в секундах
+
+class LaneSummary(BaseModel):
+    laneId: int
+    frames: int  # кадров с машинами на полосе
+    queueFrames: int  # кадров с очередью
+    avgQueueLength: float  # средняя длина очереди по кадрам с очередью, м
+    maxQueueLength: float
+    lastQueueLength: float  # на последнем кадре периода, 0 - очереди нет
+    maxQueueDuration: float  # самая долгая очередь за период, с
+    avgFlowSpeed: float  # по кадрам с машинами на полосе, м/с
+    avgDelay: float  # по кадрам с машинами на полосе, с
+
+class MetricsSummary(BaseModel):
+    sensorId: str
+    start: datetime | None = None  # период, за который собраны агрегаты, округленный до корзин
+    stop: datetime | None = None  # не включается
+    frames: int
+    updatedAt: datetime | None = None
+    lanes: List[LaneSummary]
+
+class RollupStats(BaseModel):
+    count: List[int]
+    sum: List[float | None]
+    min: List[float | None]
+    max: List[float | None]
+    last: List[float | None]
+    mean: List[float | None]
+
+class LaneRollup(BaseModel):
+    laneId: int
+    metrics: Dict[str, RollupStats]  # queueLength, queueDuration, flowSpeed, delay
+
+class RollupSeries(BaseModel):
+    resolution: str
+    time: List[datetime]  # начала корзин
+    lanes: List[LaneRollup]
+
+class ZoneEvent(BaseModel):
+    time: datetime
+    zoneId: str
+    triggerId: Optional[str]
+    relayId: Optional[str]
+    present: bool
+    occupancy: int
+
+class LanePrediction(BaseModel):
+    laneId: int
+    delay: float
+    congested: bool
+
+class Prediction(BaseModel):
+    time: datetime
+    scoredAt: datetime
+    lanes: List[LanePrediction]
+
+class PhaseMovement(BaseModel):
+    sensorId: str
+    laneId: int
+    approach: int
+    turn: str
+
+class Phase(BaseModel):
+    movements: List[PhaseMovement]
+    weight: float
+    green: float
+
+class PhasePlan(BaseModel):
+    time: Optional[datetime]
+    phases: List[Phase]
+
+class Sensor(BaseModel):
+    sensorId: str
+    name: str
+    lanes: List[int]
+    files: int
+
 class DateTimeEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, datetime):
             return obj.isoformat()
         return super().default(obj)
 
-def get_jam():
+# Массивы индекса в порядке полей LaneBoundary
+LANE_COLUMNS = ('start_id', 'end_id', 'start_x', 'end_x', 'length', 'duration', 'flow_speed', 'delay')
+
+def _micros(dt: Optional[datetime]) -> Optional[int]:
+    # Время запроса в микросекундах времени дампов, с часовым поясом или без
+    return None if dt is None else to_micros(data_time(dt))
+
+def _time_range(index: dict, start: Optional[datetime], stop: Optional[datetime]) -> Tuple[int, int]:
+    return find_time_range(index['ts'], start or datetime.min, stop or datetime.max)
+
+def _optional_id(value: int) -> Optional[int]:
+    return value if value >= 0 else None
+
+def _optional_x(value: float) -> Optional[float]:
+    return None if np.isnan(value) else value
+
+def lane_boundaries(index: dict, lane: int, start: Optional[datetime] = None,
+                    stop: Optional[datetime] = None) -> List[LaneBoundary]:
+    """Границы пробки на одной полосе, собранные напрямую из массивов индекса"""
+    lo, hi = _time_range(index, start, stop)
+    data = index['lanes'][lane]
+    return [
+        LaneBoundary(time=from_micros(ts), carStartId=_optional_id(start_id), carEndId=_optional_id(end_id),
+                     queueStart=_optional_x(start_x), queueEnd=_optional_x(end_x), queueLength=length,
+                     queueDuration=duration, flowSpeed=flow_speed, delay=delay)
+        for ts, start_id, end_id, start_x, end_x, length, duration, flow_speed, delay in zip(
+            index['ts'][lo:hi].tolist(), *(data[key][lo:hi].tolist() for key in LANE_COLUMNS))
+    ]
+
+def get_jam(index: Optional[dict] = None, start: Optional[datetime] = None,
+            stop: Optional[datetime] = None) -> List[Boundary]:
     """
     Возвращает список границ пробок для каждой полосы в заданном временном промежутке.
     Каждая граница содержит время и список полос с информацией о пробках.
     """
-    # logger.info(f"Получен запрос на получение данных о пробках за период: {start} - {stop}")
-    data = get_queue_boundaries(datetime(year=1970, month=1, day=1), datetime(year=2100, month=1, day=1))
+    index = index or get_queue_index()
+    lo, hi = _time_range(index, start, stop)
+    lanes = {
+        lane: zip(*(data[key][lo:hi].tolist() for key in
+                    ('start_id', 'end_id', 'length', 'duration', 'flow_speed', 'delay')))
+        for lane, data in index['lanes'].items()
+    }
     boundaries = []
-    for i in range(len(data[0])):
-        lanes = []
-        boundaries.append(
-                Boundary(
-                    time=data[0][i][2],
-                    lanes=[])
-            )
-        for lane in range(3):
-            lanes.append(Lane(
+    for ts in index['ts'][lo:hi].tolist():
+        boundaries.append(Boundary(time=from_micros(ts), lanes=[]))
+        for lane, values in lanes.items():
+            start_id, end_id, length, duration, flow_speed, delay = next(values)
+            boundaries[-1].lanes.append(Lane(
                 laneId=lane,
-                carStartId=data[lane][i][0].obj_id if data[lane][i][0] else None,
-                carEndId=data[lane][i][1].obj_id if data[lane][i][1] else None,
-                queueLength=abs(data[lane][i][1].point_x - data[lane][i][0].point_x) if data[lane][i][1] and data[lane][i][0] else 0,
-                queueDuration=0,
-                flowSpeed=0,
-                delay=0))
-        boundaries[-1].lanes = lanes
-    with open('boundaries.json', 'w') as f:
-        json.dump([t.model_dump() for t in boundaries], f, cls=DateTimeEncoder)
-
-
-def drow_front_back():
-    start_time = datetime(2025, 3, 20, 14, 20, 0)
-    end_time = datetime(2025, 3, 20, 14, 25, 0)
-    
-    data = get_queue_boundaries(start_time, end_time)
-    
-    import matplotlib.pyplot as plt
-    import matplotlib.dates as mdates
-    
-    # Создаем график для каждого lane
-    for lane_id in range(len(data)):
-        # Подготовка данных
-        timestamps = []
-        start_points = []
-        end_points = []
-        
-        for start, end, ts in data[lane_id]:
-            if start and end:
-                print(start.point_x, end.point_x, ts)
-            timestamps.append(ts)
-            start_points.append(start.point_x if start else 0)
-            end_points.append(end.point_x if end else 0)
-        
-        # Создание графика
-        plt.figure(figsize=(12, 6))
-        
-        # Добавление линий без маркеров
-        plt.plot(timestamps, start_points, 'b-', label=f'Lane {lane_id} Start', linewidth=2)
-        plt.plot(timestamps, end_points, 'r-', label=f'Lane {lane_id} End', linewidth=2)
-        
-        # Настройка графика
-        plt.title(f'Lane {lane_id} Data (14:20-14:25)', fontsize=14)
-        plt.xlabel('Time', fontsize=12)
-        plt.ylabel('Point X', fontsize=12)
-        plt.grid(True, linestyle='--', alpha=0.7)
-        plt.legend(fontsize=10)
-        
-        # Установка границ по оси X
-        plt.xlim(start_time, end_time)
-        
-        # Форматирование оси времени
-        plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
-        plt.gcf().autofmt_xdate()  # Автоматический поворот меток времени
-        
-        # Сохранение графика
-        plt.savefig(f'static/lane_{lane_id}_plot.png', dpi=300, bbox_inches='tight')
-        plt.close()  # Закрываем график для освобождения памяти
-        
-        # Логируем создание графика
-        logger.info(f"Created plot for lane {lane_id}")
-drow_front_back()
\ No newline at end of file
+                carStartId=_optional_id(start_id),
+                carEndId=_optional_id(end_id),
+                queueLength=length,
+                queueDuration=duration,
+                flowSpeed=flow_speed,
+                delay=delay))
+    return boundaries
+
+def columnar_jam(index: dict, start: Optional[datetime] = None, stop: Optional[datetime] = None,
+                 lanes: Optional[List[int]] = None, compression: str = 'none') -> bytes:
+    """Границы пробок в колоночном бинарном формате, см. backend.columnar"""
+    lo, hi = _time_range(index, start, stop)
+    lanes = index['lanes'] if lanes is None else lanes
+    with stage('serialize'):
+        return encode_boundaries(
+            index['ts'][lo:hi],
+            {lane: {key: values[lo:hi] for key, values in index['lanes'][lane].items()} for lane in lanes},
+            compression)
+
+def export_jam(path: str = 'boundaries.json', format: str = 'json', compression: str = 'none') -> None:
+    """
+    Сохраняет границы пробок за весь период для статической версии фронтенда
+
+    Args:
+        path (str): Путь к файлу
+        format (str): json - совместимый с фронтендом список Boundary, columnar - колоночный формат
+        compression (str): none, gzip или zstd
+    """
+    if format == 'columnar':
+        payload = columnar_jam(get_queue_index(), compression=compression)
+    else:
+        payload = compress(json.dumps([t.model_dump() for t in get_jam()], cls=DateTimeEncoder).encode(), compression)
+    with open(path, 'wb') as f:
+        f.write(payload)
+
+def encoded_response(payload: bytes, media_type: str, compression: str) -> Response:
+    headers = {} if compression == 'none' else {'Content-Encoding': compression}
+    return Response(content=payload, media_type=media_type, headers=headers)
+
+def json_response(result, compression: str) -> Response:
+    with stage('serialize'):
+        payload = compress(json.dumps(jsonable_encoder(result)).encode(), compression)
+    return encoded_response(payload, 'application/json', compression)
+
+def _finite(value: float, default: Optional[float] = 0.0) -> Optional[float]:
+    return default if np.isnan(value) else float(value)
+
+def metrics_summary(sensor_id: str, index: dict, start: Optional[datetime] = None,
+                    stop: Optional[datetime] = None) -> MetricsSummary:
+    """
+    Сводка по полосам за период. Все числа читаются из корзин index['rollups'],
+    поэтому время ответа не зависит от длины периода. Границы периода
+    округляются до секунды, в ответе - округленный период, за который
+    собраны агрегаты
+    """
+    levels = index['rollups']
+    totals = summarize(levels, _micros(start), _micros(stop))
+    period = summary_range(levels, _micros(start), _micros(stop))
+    lanes, frames = [], 0
+    for lane in index['lanes']:
+        length, duration = totals[(lane, 'queueLength')], totals[(lane, 'queueDuration')]
+        flow_speed, delay = totals[(lane, 'flowSpeed')], totals[(lane, 'delay')]
+        frame_length = totals[(lane, 'frameQueueLength')]
+        frames = frame_length['count']
+        lanes.append(LaneSummary(
+            laneId=lane,
+            frames=flow_speed['count'],
+            queueFrames=length['count'],
+            avgQueueLength=_finite(length['mean']),
+            maxQueueLength=_finite(length['max']),
+            lastQueueLength=_finite(frame_length['last']),
+            maxQueueDuration=_finite(duration['max']),
+            avgFlowSpeed=_finite(flow_speed['mean']),
+            avgDelay=_finite(delay['mean'])))
+    start, stop = (from_micros(period[0]), from_micros(period[1])) if period else (start, stop)
+    return MetricsSummary(sensorId=sensor_id, start=start, stop=stop, frames=frames,
+                          updatedAt=index_service.updated_at, lanes=lanes)
+
+def zone_events(index: dict, start: Optional[datetime] = None, stop: Optional[datetime] = None,
+                zone_id: Optional[str] = None) -> List[ZoneEvent]:
+    events = index['zone_events']
+    lo = bisect.bisect_left(events, _micros(start), key=lambda event: event.time) if start else 0
+    hi = bisect.bisect_right(events, _micros(stop), key=lambda event: event.time) if stop else len(events)
+    return [ZoneEvent(time=from_micros(event.time), zoneId=event.zone_id, triggerId=event.trigger_id,
+                      relayId=event.relay_id, present=event.present, occupancy=event.occupancy)
+            for event in events[lo:hi] if zone_id is None or event.zone_id == zone_id]
+
+def index_lane_state(indexes: dict, at: Optional[datetime] = None) -> Tuple[Optional[datetime], dict]:
+    """Очередь и задержка по полосам всех сенсоров на последнем кадре не позже at"""
+    lanes, time = {}, None
+    for sensor_id, index in indexes.items():
+        ts = index['ts']
+        i = int(np.searchsorted(ts, _micros(at), side='right')) - 1 if at else len(ts) - 1
+        if i < 0:
+            continue
+        time = max(time, from_micros(ts[i])) if time else from_micros(ts[i])
+        for lane, data in index['lanes'].items():
+            lanes[(sensor_id, lane)] = {
+                'queueLength': float(data['length'][i]) if data['start_row'][i] >= 0 else 0.0,
+                'delay': _finite(float(data['delay'][i])),
+            }
+    return time, lanes
+
+def phase_plan(time: Optional[datetime], lanes: dict) -> PhasePlan:
+    return PhasePlan(time=time, phases=[
+        Phase(movements=[PhaseMovement(sensorId=m.sensor_id, laneId=m.lane, approach=m.approach, turn=m.turn)
+                         for m in phase['movements']],
+              weight=phase['weight'], green=phase['green'])
+        for phase in phase_optimizer.recommend(lanes)])
+
+def rollup_series(levels: dict, resolution: str, start: Optional[datetime] = None,
+                  stop: Optional[datetime] = None, max_points: int = MAX_ROLLUP_POINTS) -> RollupSeries:
+    """Корзины метрик полос за период; resolution=auto выбирает самое мелкое разрешение, влезающее в max_points"""
+    start_us, stop_us = _micros(start), _micros(stop)
+    if resolution == 'auto':
+        resolution = choose_resolution(levels, start_us, stop_us, max_points)
+    level = levels[resolution]
+    level = level.slice(*level.range(np.iinfo(np.int64).min if start_us is None else start_us,
+                                     np.iinfo(np.int64).max if stop_us is None else stop_us + 1))
+    lanes = {}
+    for (lane, metric), stats in sorted(level.stats.items()):
+        values = {agg: [_finite(value, None) for value in stats[agg].tolist()] for agg in ('sum', 'min', 'max', 'last')}
+        mean = np.divide(stats['sum'], stats['count'], out=np.full(len(level), np.nan), where=stats['count'] > 0)
+        lanes.setdefault(lane, {})[metric] = RollupStats(
+            count=stats['count'].tolist(), mean=[_finite(value, None) for value in mean.tolist()], **values)
+    return RollupSeries(resolution=resolution, time=[from_micros(ts) for ts in level.bucket.tolist()],
+                        lanes=[LaneRollup(laneId=lane, metrics=metrics) for lane, metrics in lanes.items()])
+
+@app.get("/sensors", response_model=List[Sensor])
+async def sensors():
+    if index_service.sensors is None:
+        raise HTTPException(status_code=503, detail="Индекс очередей еще строится")
+    return [Sensor(sensorId=sensor_id, name=sensor['name'], lanes=sensor['lanes'], files=len(sensor['files']))
+            for sensor_id, sensor in index_service.sensors.items()]
+
+FORMAT_QUERY = Query('json', pattern='^(json|columnar)$',
+                     description="json - список объектов, columnar - колоночный бинарный формат")
+COMPRESSION_QUERY = Query('none', pattern=f"^({'|'.join(COMPRESSIONS)})$", description="Сжатие ответа")
+
+@app.get("/lanes/{lane_id}/boundaries", response_model=List[LaneBoundary])
+async def lane_boundaries_endpoint(
+        lane_id: int,
+        start: Optional[datetime] = Query(None, description="Начало периода"),
+        stop: Optional[datetime] = Query(None, description="Конец периода"),
+        sensor_id: Optional[str] = Query(None, description="Идентификатор сенсора"),
+        format: str = FORMAT_QUERY,
+        compression: str = COMPRESSION_QUERY):
+    sensor_id, index = index_service.get(sensor_id)
+    if lane_id not in index['lanes']:
+        raise HTTPException(status_code=404, detail=f"Нет полосы {lane_id} у сенсора {sensor_id}")
+    # Сборка ответа на больших периодах занимает время, поэтому уходит из event loop
+    try:
+        if format == 'columnar':
+            return encoded_response(
+                await run_in_threadpool(columnar_jam, index, start, stop, [lane_id], compression),
+                MEDIA_TYPE, compression)
+        result = await run_in_threadpool(lane_boundaries, index, lane_id, start, stop)
+        return result if compression == 'none' else await run_in_threadpool(json_response, result, compression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/boundaries", response_model=List[Boundary])
+async def boundaries(
+        start: Optional[datetime] = Query(None, description="Начало периода"),
+        stop: Optional[datetime] = Query(None, description="Конец периода"),
+        sensor_id: Optional[str] = Query(None, description="Идентификатор сенсора"),
+        format: str = FORMAT_QUERY,
+        compression: str = COMPRESSION_QUERY):
+    _, index = index_service.get(sensor_id)
+    try:
+        if format == 'columnar':
+            return encoded_response(
+                await run_in_threadpool(columnar_jam, index, start, stop, None, compression),
+                MEDIA_TYPE, compression)
+        result = await run_in_threadpool(get_jam, index, start, stop)
+        return result if compression == 'none' else await run_in_threadpool(json_response, result, compression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/metrics/summary", response_model=MetricsSummary)
+async def summary(
+        start: Optional[datetime] = Query(None, description="Начало периода"),
+        stop: Optional[datetime] = Query(None, description="Конец периода"),
+        sensor_id: Optional[str] = Query(None, description="Идентификатор сенсора")):
+    sensor_id, index = index_service.get(sensor_id)
+    return await run_in_threadpool(metrics_summary, sensor_id, index, start, stop)
+
+@app.get("/rollups", response_model=RollupSeries)
+async def rollups(
+        resolution: str = Query('auto', pattern=f"^(auto|{'|'.join(RESOLUTIONS)})$", description="Размер корзины"),
+        start: Optional[datetime] = Query(None, description="Начало периода"),
+        stop: Optional[datetime] = Query(None, description="Конец периода"),
+        sensor_id: Optional[str] = Query(None, description="Идентификатор сенсора"),
+        source: str = Query('index', pattern='^(index|live)$', description="index - дампы, live - принятые кадры"),
+        max_points: int = Query(MAX_ROLLUP_POINTS, gt=0, le=100000)):
+    levels = await run_in_threadpool(live_rollups.levels) if source == 'live' else \
+        index_service.get(sensor_id)[1]['rollups']
+    return await run_in_threadpool(rollup_series, levels, resolution, start, stop, max_points)
+
+@app.get("/zones/events", response_model=List[ZoneEvent])
+async def zone_events_endpoint(
+        start: Optional[datetime] = Query(None, description="Начало периода"),
+        stop: Optional[datetime] = Query(None, description="Конец периода"),
+        sensor_id: Optional[str] = Query(None, description="Идентификатор сенсора"),
+        zone_id: Optional[str] = Query(None, description="Идентификатор зоны")):
+    """События включения и выключения присутствия по триггерам зон сенсора"""
+    _, index = index_service.get(sensor_id)
+    return await run_in_threadpool(zone_events, index, start, stop, zone_id)
+
+@app.get("/predict", response_model=Prediction)
+async def predict(lane_id: Optional[int] = Query(None, description="Номер полосы, по умолчанию все полосы"),
+                  sensor_id: Optional[str] = Query(None, description="Сенсор, по умолчанию источник live-кадров")):
+    """
+    Последний прогноз задержки следующей поездки по полосам сенсора. time - момент, на который
+    посчитаны признаки, scoredAt - когда модель его оценила
+    """
+    sensor_id = sensor_id or live_sensor_id()
+    if sensor_id is not None and index_service.sensors is not None and sensor_id not in index_service.sensors:
+        raise HTTPException(status_code=404, detail=f"Неизвестный сенсор {sensor_id}")
+    service = predictions.get(sensor_id)
+    result = service.get() if service is not None else None
+    if result is None:
+        raise HTTPException(status_code=503, detail="Прогноз еще не готов")
+    if lane_id is not None:
+        lanes = [lane for lane in result['lanes'] if lane['laneId'] == lane_id]
+        if not lanes:
+            raise HTTPException(status_code=404, detail=f"Нет прогноза для полосы {lane_id}")
+        result = {**result, 'lanes': lanes}
+    return result
+
+@app.get("/phases", response_model=PhasePlan)
+async def phases(
+        at: Optional[datetime] = Query(None, description="Момент, по умолчанию последний кадр"),
+        source: str = Query('index', pattern='^(index|live)$', description="index - дампы, live - принятые кадры"),
+        sensor_id: Optional[str] = Query(None, description="Сенсор, к которому относятся live-кадры")):
+    """Рекомендуемые фазы светофора на следующий цикл по текущим очередям и задержкам"""
+    if source == 'live':
+        snapshot = live_metrics.last
+        if snapshot is None:
+            raise HTTPException(status_code=503, detail="Live-данных еще нет")
+        sensor_id = sensor_id or index_service.get()[0]
+        return phase_plan(from_micros(snapshot['time']), {(sensor_id, lane['laneId']): lane for lane in snapshot['lanes']})
+    if index_service.indexes is None:
+        raise HTTPException(status_code=503, detail="Индекс очередей еще строится")
+    time, lanes = index_lane_state(index_service.indexes, at)
+    return phase_plan(time, lanes)
+
+@app.post("/refresh", status_code=202)
+async def refresh():
+    """Запускает пересборку индекса в фоне, текущие данные продолжают отдаваться"""
+    index_service.refresh()
+    return {'refreshing': index_service.refreshing, 'updatedAt': index_service.updated_at}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Счетчики и гистограммы стадий, глубина очередей и время ответов API в формате Prometheus"""
+    return PlainTextResponse(render(), media_type=CONTENT_TYPE)
+
+@app.post("/profile/start", status_code=202)
+async def profile_start(interval: float = Query(0.01, ge=0.001, le=1.0, description="Интервал сэмплов, с")):
+    """Запускает сэмплирующий профайлер, прежний профиль сбрасывается"""
+    await run_in_threadpool(profiler.start, interval)
+    return {'running': True, 'interval': interval}
+
+@app.post("/profile/stop")
+async def profile_stop():
+    """Останавливает профайлер, собранный профиль остается доступен в /profile"""
+    await run_in_threadpool(profiler.stop)
+    return {'running': False, 'samples': profiler.samples}
+
+@app.get("/profile", response_class=PlainTextResponse)
+async def profile():
+    """Свернутые стеки профайлера для flamegraph.pl или speedscope"""
+    return PlainTextResponse(profiler.folded())
+
+@app.get("/live")
+async def live_events():
+    """Server-Sent Events с дельтами состояния очередей по полосам"""
+    async def events():
+        async for message in broadcaster.subscribe():
+            yield f"data: {message}\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.websocket("/ws/live")
+async def live_websocket(websocket: WebSocket):
+    """Те же дельты, что и /live, по WebSocket"""
+    await websocket.accept()
+    try:
+        async for message in broadcaster.subscribe():
+            await websocket.send_text(message)
+    except WebSocketDisconnect:
+        pass
+
+if __name__ == "__main__":
+    export_jam()
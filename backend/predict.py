@@ -0,0 +1,156 @@
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+from algorithm.features import FeatureWindows
+from algorithm.timestamps import from_micros, micros
+from algorithm.rollups import snapshot_series
+
+try:
+    from catboost import CatBoostRegressor
+except ImportError:
+    CatBoostRegressor = None
+
+logger = logging.getLogger(__name__)
+
+# Файл обученной модели CatBoost, без него работает базовая модель
+MODEL_PATH = os.getenv('MODEL_PATH')
+# Задержка следующей поездки, с которой полоса считается в заторе, секунды
+CONGESTION_DELAY = float(os.getenv('CONGESTION_DELAY', '30'))
+# Сколько последних прогнозов держим для истории
+PREDICTION_HISTORY = 600
+
+
+class BaselineModel:
+    """
+    Модель без обучения: задержка следующей поездки - средняя задержка за
+    последнюю минуту с поправкой на ее изменение относительно предпоследней
+    """
+
+    def __init__(self, feature_names: List[str]):
+        self.last = feature_names.index('delay_0_1m')
+        self.previous = feature_names.index('delay_1_2m')
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        last, previous = features[:, self.last], features[:, self.previous]
+        trend = np.where(np.isnan(previous), 0.0, last - previous)
+        return np.maximum(np.nan_to_num(last + trend), 0.0)
+
+
+def load_model(feature_names: List[str], model_path: Optional[str] = MODEL_PATH):
+    """
+    Загружает модель CatBoost, если она есть и пакет catboost установлен, иначе базовую модель
+
+    Args:
+        feature_names (List[str]): Порядок признаков FeatureWindows
+        model_path (Optional[str]): Путь к файлу модели
+
+    Returns:
+        Модель с методом predict(features) -> задержка по строкам признаков
+    """
+    if model_path:
+        if CatBoostRegressor is None:
+            logger.warning("Пакет catboost не установлен, используется базовая модель прогноза")
+        else:
+            model = CatBoostRegressor()
+            model.load_model(model_path)
+            logger.info(f"Загружена модель прогноза {model_path}")
+            return model
+    return BaselineModel(feature_names)
+
+
+class PredictionService:
+    """
+    Прогноз заторов по потоку снимков LiveMetrics.
+
+    Признаки обновляются в потоке приема кадров за O(1) на кадр, а когда
+    закрывается секунда, матрица признаков всех полос отправляется на оценку
+    одним батчем в пул. Пока батч считается, новые признаки не ставятся в
+    очередь, а запоминаются, и после завершения оценивается только последний
+    их вариант. Забрать ожидающие признаки и решить, нужна ли еще оценка, можно
+    только под одной блокировкой, поэтому батч, пришедший во время оценки, не
+    теряется. Готовый прогноз с временем признаков и временем оценки лежит
+    в кэше и отдается без пересчета.
+    """
+
+    def __init__(self, lanes: Sequence[int], model=None, pool: Optional[Executor] = None):
+        self.windows = FeatureWindows(lanes)
+        self.model = model or load_model(self.windows.feature_names)
+        # CatBoost отпускает GIL при предсказании, поэтому хватает пула потоков
+        self.pool = pool or ThreadPoolExecutor(max_workers=1, thread_name_prefix='predict')
+        self.lock = threading.Lock()
+        self.running = False  # оценка в пуле и ее цикл по ожидающим признакам
+        self.scoring = False
+        self.pending: Optional[tuple] = None
+        self.latest: Optional[dict] = None
+        self.history = deque(maxlen=PREDICTION_HISTORY)
+
+    def observe(self, snapshot: dict) -> None:
+        """Обработчик снимков LiveMetrics"""
+        self.add(snapshot['time'], snapshot_series(snapshot))
+
+    def add(self, time_us: int, values: Dict[Hashable, float]) -> None:
+        if self.windows.add(time_us, values):
+            self._submit(self.windows.time, self.windows.features())
+
+    def seed(self, ts: np.ndarray, series: Dict[Hashable, np.ndarray]) -> None:
+        """Заполняет окна рядами индекса очередей, когда live-данных еще нет, и считает прогноз"""
+        horizon = micros(self.windows.horizon)
+        if not len(ts):
+            return
+        lo = int(np.searchsorted(ts, ts[-1] - horizon))
+        self.windows.add_series(ts[lo:], {key: values[lo:] for key, values in series.items()})
+        self._submit(self.windows.time, self.windows.features())
+
+    def _submit(self, time_us: int, features: np.ndarray) -> None:
+        with self.lock:
+            self.pending = (time_us, features)
+            if self.running:
+                return
+            self.running = True
+        self.pool.submit(self._drain)
+
+    def _drain(self) -> None:
+        # Оцениваем последние признаки, пока за время оценки приходят новые
+        while True:
+            with self.lock:
+                pending, self.pending = self.pending, None
+                self.scoring = pending is not None
+                if pending is None:
+                    self.running = False
+                    return
+            self._score(*pending)
+
+    def _score(self, time_us: int, features: np.ndarray) -> None:
+        try:
+            delay = np.asarray(self.model.predict(features), dtype=np.float64)
+            result = {
+                'time': from_micros(time_us),
+                'scoredAt': datetime.now(),
+                'lanes': [{'laneId': lane, 'delay': float(value), 'congested': bool(value >= CONGESTION_DELAY)}
+                          for lane, value in zip(self.windows.lanes, delay.tolist())],
+            }
+            with self.lock:
+                self.latest = result
+                self.history.append(result)
+        except Exception:
+            logger.exception("Ошибка оценки модели прогноза")
+
+    @property
+    def backlog(self) -> int:
+        """Батчи признаков в работе: оцениваемый и ожидающий"""
+        with self.lock:
+            return int(self.scoring) + int(self.pending is not None)
+
+    def get(self) -> Optional[dict]:
+        with self.lock:
+            return self.latest
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
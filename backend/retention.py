@@ -0,0 +1,247 @@
+import bisect
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from algorithm.frames import FrameStore
+from algorithm.rollups import AGGREGATES, RollupLevel, build_rollups, compact, lane_series, merge_levels
+from algorithm.timestamps import micros
+from backend.instrumentation import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних секунд данных хранится покадрово, 0 - без ограничения. Более старые
+# кадры вытесняются из индекса и кэша кадров и остаются только в агрегатах index['rollups']
+RETENTION_HORIZON = float(os.getenv('RETENTION_HORIZON', str(24 * 3600)))
+# Сколько мегабайт покадровых массивов индексов держится в памяти, остальные читаются через mmap
+MEMORY_BUDGET_MB = float(os.getenv('MEMORY_BUDGET_MB', '256'))
+SEGMENT_DIR = '_index'
+SEGMENT_MANIFEST = 'segment.json'
+HISTORY_DIR = '_history'
+HISTORY_MANIFEST = 'history.json'
+
+
+def trim_index(index: dict, horizon: float = RETENTION_HORIZON, history: Optional[dict] = None) -> dict:
+    """
+    Оставляет в индексе кадры только за последние horizon секунд до последнего
+    кадра, а более старые вливает в агрегаты истории. Кадры до history['until']
+    в агрегатах истории уже есть и пропускаются. Хранилище режется вместе с
+    индексом, start_row и end_row сдвигаются в оставшийся кусок, см. window_store
+
+    Args:
+        index (dict): Индекс очередей без агрегатов: store, ts, lanes, zone_events
+        horizon (float): Глубина в секундах, 0 - без ограничения
+        history (Optional[dict]): Агрегаты вытесненных кадров из прошлой сборки, см. load_history
+
+    Returns:
+        dict: Новая история: until - время, до которого кадры вытеснены, rollups - их агрегаты
+    """
+    ts = index['ts']
+    until = history['until'] if history else None
+    rollups = history['rollups'] if history else {}
+    cutoff = int(ts[-1]) - micros(horizon) if horizon > 0 and len(ts) else None
+    if until is not None:
+        cutoff = until if cutoff is None else max(cutoff, until)
+    if cutoff is None:
+        return {'until': None, 'rollups': rollups}
+
+    start = int(np.searchsorted(ts, until, side='left')) if until is not None else 0
+    lo = int(np.searchsorted(ts, cutoff, side='left'))
+    if lo > start:
+        folded = {lane: {key: values[start:lo] for key, values in data.items()}
+                  for lane, data in index['lanes'].items()}
+        rollups = compact(merge_levels(rollups, build_rollups(ts[start:lo], lane_series(folded))))
+    if lo:
+        store = index['store']
+        shift = int(store.offsets[lo])
+        index['store'] = store.slice(lo)
+        index['ts'] = ts[lo:].copy()
+        index['lanes'] = {lane: {key: _shift_rows(key, values[lo:], shift) for key, values in data.items()}
+                          for lane, data in index['lanes'].items()}
+        logger.info(f"Из индекса вытеснено {lo} кадров старше {horizon:.0f} с, "
+                    f"в агрегаты истории влито {max(lo - start, 0)}")
+    events = index['zone_events']
+    index['zone_events'] = events[bisect.bisect_left(events, cutoff, key=lambda event: event.time):]
+    return {'until': cutoff, 'rollups': rollups}
+
+
+def window_store(store: FrameStore, ts: np.ndarray) -> FrameStore:
+    """
+    Кусок хранилища с кадрами индекса. Кэш кадров вытесняет файлы целиком, и
+    хранилище может начинаться раньше индекса, обрезанного по горизонту
+    """
+    return store.slice(int(np.searchsorted(store.frame_times, ts[0], side='left')) if len(ts) else len(store))
+
+
+def _shift_rows(key: str, values: np.ndarray, shift: int) -> np.ndarray:
+    if key in ('start_row', 'end_row'):
+        return np.where(values >= 0, values - shift, values)
+    return values.copy()
+
+
+def save_history(history: dict, path: str) -> None:
+    """
+    Сохраняет агрегаты вытесненных кадров в директорию: по .npy файлу на массив
+    и манифест с разрешениями и рядами. Запись идет во временную директорию,
+    которая затем атомарно переименовывается
+    """
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    levels = []
+    for name, level in history['rollups'].items():
+        keys = list(level.stats)
+        np.save(os.path.join(tmp_path, f'{name}.bucket.npy'), np.ascontiguousarray(level.bucket))
+        for i, key in enumerate(keys):
+            for agg, values in level.stats[key].items():
+                np.save(os.path.join(tmp_path, f'{name}.{i}.{agg}.npy'), np.ascontiguousarray(values))
+        levels.append({'name': name, 'step': level.step, 'since': level.since, 'keys': keys})
+    with open(os.path.join(tmp_path, HISTORY_MANIFEST), 'w') as f:
+        json.dump({'until': history['until'], 'levels': levels}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+def load_history(path: str) -> Optional[dict]:
+    """Читает агрегаты вытесненных кадров, сохраненные save_history, None - истории нет"""
+    try:
+        with open(os.path.join(path, HISTORY_MANIFEST)) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    rollups = {}
+    for level in manifest['levels']:
+        name = level['name']
+        stats = {tuple(key) if isinstance(key, list) else key:
+                 {agg: np.load(os.path.join(path, f'{name}.{i}.{agg}.npy')) for agg in AGGREGATES}
+                 for i, key in enumerate(level['keys'])}
+        rollups[name] = RollupLevel(level['step'], np.load(os.path.join(path, f'{name}.bucket.npy')), stats,
+                                    level['since'])
+    return {'until': manifest['until'], 'rollups': rollups}
+
+
+def spill_index(index: dict, path: str) -> dict:
+    """
+    Сбрасывает покадровые массивы индекса в директорию сегмента, по .npy файлу
+    на массив, и убирает их из индекса. Запись идет во временную директорию,
+    которая затем атомарно переименовывается, поэтому прежний сегмент, открытый
+    через mmap, остается целым, пока на него есть ссылки
+
+    Args:
+        index (dict): Индекс очередей
+        path (str): Директория сегмента
+
+    Returns:
+        dict: Индекс с путем к сегменту в поле segment вместо ts и lanes
+    """
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, 'ts.npy'), np.ascontiguousarray(index.pop('ts')))
+    lanes = {}
+    for lane, data in index.pop('lanes').items():
+        lanes[lane] = list(data)
+        for key, values in data.items():
+            np.save(os.path.join(tmp_path, f'{lane}.{key}.npy'), np.ascontiguousarray(values))
+    with open(os.path.join(tmp_path, SEGMENT_MANIFEST), 'w') as f:
+        json.dump({'lanes': [[lane, keys] for lane, keys in lanes.items()]}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    index['segment'] = path
+    return index
+
+
+def load_segment(index: dict) -> dict:
+    """Открывает покадровые массивы сброшенного индекса через mmap без чтения в память"""
+    path = index['segment']
+    with open(os.path.join(path, SEGMENT_MANIFEST)) as f:
+        manifest = json.load(f)
+    index['ts'] = np.load(os.path.join(path, 'ts.npy'), mmap_mode='r')
+    index['lanes'] = {lane: {key: np.load(os.path.join(path, f'{lane}.{key}.npy'), mmap_mode='r') for key in keys}
+                      for lane, keys in manifest['lanes']}
+    return index
+
+
+def index_nbytes(index: dict) -> int:
+    return index['ts'].nbytes + sum(values.nbytes for data in index['lanes'].values() for values in data.values())
+
+
+class SegmentCache:
+    """
+    Копии покадровых массивов индексов в памяти в пределах бюджета.
+
+    Сброшенный индекс читается через mmap, и его страницы ядро может выгрузить
+    в любой момент. Индексы сенсоров, к которым идут запросы, копируются в
+    память, а при превышении бюджета вытесняются давно не запрошенные -
+    запросы к ним снова идут через mmap. Индекс больше бюджета в память не
+    копируется никогда.
+    """
+
+    def __init__(self, budget: int = int(MEMORY_BUDGET_MB * 1024 * 1024)):
+        self.budget = budget
+        # sensor_id -> (индекс из снимка, копия в памяти, байты)
+        self.resident: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        with self.lock:
+            return sum(size for _, _, size in self.resident.values())
+
+    def get(self, sensor_id: str, index: dict) -> dict:
+        """
+        Индекс сенсора для запроса: копия в памяти, если она есть или влезает в
+        бюджет, иначе сам индекс на mmap
+
+        Args:
+            sensor_id (str): Идентификатор сенсора
+            index (dict): Индекс из текущего снимка, после пересборки - новый объект
+
+        Returns:
+            dict: Индекс с теми же полями
+        """
+        if 'segment' not in index:
+            return index
+        with self.lock:
+            entry = self.resident.get(sensor_id)
+            if entry is not None and entry[0] is index:
+                self.resident.move_to_end(sensor_id)
+                return entry[1]
+        size = index_nbytes(index)
+        if size > self.budget:
+            return index
+        resident = {**index, 'ts': np.array(index['ts']),
+                    'lanes': {lane: {key: np.array(values) for key, values in data.items()}
+                              for lane, data in index['lanes'].items()}}
+        with self.lock:
+            self.resident[sensor_id] = (index, resident, size)
+            self.resident.move_to_end(sensor_id)
+            total = sum(size for _, _, size in self.resident.values())
+            while total > self.budget:
+                evicted, (_, _, evicted_size) = self.resident.popitem(last=False)
+                total -= evicted_size
+                SEGMENT_EVICTIONS.inc()
+                logger.debug(f"Индекс сенсора {evicted} вытеснен из памяти ({evicted_size} байт)")
+        return resident
+
+
+def segment_path(cache_dir: str) -> str:
+    return os.path.join(cache_dir, SEGMENT_DIR)
+
+
+def history_path(cache_dir: str) -> str:
+    return os.path.join(cache_dir, HISTORY_DIR)
+
+
+segment_cache = SegmentCache()
+SEGMENT_EVICTIONS = Counter('index_segment_evictions_total', "Индексы сенсоров, вытесненные из памяти в mmap")
+Gauge('index_resident_bytes', "Байты покадровых массивов индексов, скопированных в память",
+      read=lambda: segment_cache.nbytes)
+Gauge('index_resident_sensors', "Сенсоры, индекс которых скопирован в память",
+      read=lambda: len(segment_cache.resident))
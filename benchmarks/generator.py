@@ -0,0 +1,168 @@
+import ast
+import copy
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, NamedTuple
+
+# Шаблон конфигурации сенсора, из которого собираются синтетические дампы
+TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), '..', 'algorithm', 'o.json')
+# Сколько минут данных в одном файле, как у дампов с сенсора
+FILE_MINUTES = 5
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+LANE_WIDTH = 3.8
+# Минимальный зазор между машинами в очереди, м
+MIN_GAP = 7.0
+# Длины машин по obj_class, как length_types в json_to_models
+CAR_CLASSES = ((1, 4.7), (3, 7.1), (4, 10.9))
+
+
+class Scenario(NamedTuple):
+    """Параметры синтетического потока"""
+    minutes: float = 1.0
+    frame_rate: float = 10.0  # кадров в секунду
+    lanes: int = 3  # полосы подхода, direction -1
+    exit_lanes: int = 1  # встречные полосы, direction 1
+    cars_per_minute: float = 30.0  # интенсивность прибытия на все полосы
+    cycle_secs: float = 90.0  # цикл светофора на стоп-линии
+    red_secs: float = 45.0
+    id_pool: int = 250  # радар переиспользует obj_id по кругу
+    lane_length: float = 250.0
+    stop_line: float = 30.0  # point_x стоп-линии
+    free_speed: float = 50.0  # км/ч
+    seed: int = 0
+    start: datetime = datetime(2025, 3, 20, 14, 20)
+    prefix: str = 'Синтетический'
+
+    @property
+    def frames(self) -> int:
+        return int(self.minutes * 60 * self.frame_rate)
+
+
+def _template() -> dict:
+    # o.json хранится как repr словаря, а не как JSON
+    with open(TEMPLATE_PATH, 'r', encoding='utf-8') as f:
+        return ast.literal_eval(f.read().strip())
+
+
+def sensor_config(scenario: Scenario) -> dict:
+    """Конфигурация сенсора в формате дампа без objects"""
+    config = _template()
+    lane_template = config['road_sensor_lanes'][0]
+    lanes = []
+    for i in range(scenario.lanes + scenario.exit_lanes):
+        lane = copy.deepcopy(lane_template)
+        lane.update(lane_index=i, index_number=i + 1, lane_draw_index=i, center=LANE_WIDTH / 2 + LANE_WIDTH * i,
+                    direction=-1 if i < scenario.lanes else 1, length=scenario.lane_length,
+                    ln=scenario.lane_length)
+        for zone in lane['zones']:
+            zone['lane_index'] = i
+        lanes.append(lane)
+    config['road_sensor_lanes'] = lanes
+    config['dividing_line_obj'].update(follow_index=scenario.lanes - 1, lane_index=scenario.lanes,
+                                       lane_draw_index=scenario.lanes)
+    config['objects'] = []
+    return config
+
+
+def iter_frames(scenario: Scenario) -> Iterator[List[dict]]:
+    """
+    Детерминированно моделирует поток и отдает строки rows_data по кадрам.
+
+    Машины приезжают с дальнего конца полосы подхода с интенсивностью
+    cars_per_minute, едут со скоростью free_speed, на красный встают у
+    стоп-линии, а следующие - с зазором MIN_GAP за передней машиной, так что
+    очереди растут и рассасываются с циклом светофора. Встречные полосы
+    едут от сенсора без остановок. Номера obj_id берутся по кругу из id_pool.
+    """
+    rnd = random.Random(scenario.seed)
+    dt = 1.0 / scenario.frame_rate
+    arrival = scenario.cars_per_minute / 60.0 * dt
+    free = scenario.free_speed / 3.6
+    n_lanes = scenario.lanes + scenario.exit_lanes
+    cars: Dict[int, list] = {}  # obj_id -> [полоса, x, скорость м/с, obj_class, длина]
+    next_id = 0
+    start = scenario.start
+    for frame in range(scenario.frames):
+        now = frame * dt
+        red = now % scenario.cycle_secs < scenario.red_secs
+        if rnd.random() < arrival and len(cars) < scenario.id_pool:
+            while True:
+                next_id = next_id % scenario.id_pool + 1
+                if next_id not in cars:
+                    break
+            lane = rnd.randrange(n_lanes)
+            obj_class, length = rnd.choice(CAR_CLASSES)
+            cars[next_id] = [lane, scenario.lane_length if lane < scenario.lanes else 0.0, free, obj_class, length]
+
+        by_lane: Dict[int, List[list]] = {}
+        for car in cars.values():
+            by_lane.setdefault(car[0], []).append(car)
+        for lane, lane_cars in by_lane.items():
+            if lane >= scenario.lanes:
+                for car in lane_cars:
+                    car[1] += free * dt
+                continue
+            # Ближайшая к стоп-линии машина первая
+            lane_cars.sort(key=lambda car: car[1])
+            behind = float('-inf')  # ближе этой точки машина не может подъехать к передней
+            for car in lane_cars:
+                limit = behind
+                if red and car[1] >= scenario.stop_line:
+                    limit = max(limit, scenario.stop_line)
+                target = car[1] - free * dt
+                if target < limit:
+                    car[1], car[2] = min(car[1], limit), 0.0
+                else:
+                    car[1], car[2] = target, free
+                behind = car[1] + car[4] + MIN_GAP
+
+        time = (start + timedelta(seconds=now)).strftime(TIME_FORMAT)
+        rows = []
+        for obj_id, (lane, x, speed, obj_class, length) in list(cars.items()):
+            if x < 0 or x > scenario.lane_length:
+                del cars[obj_id]
+                continue
+            rows.append({
+                'heading': 180.0 if lane < scenario.lanes else 0.5, 'lane': lane, 'obj_class': obj_class,
+                'obj_id': obj_id, 'obj_length': length, 'obj_speed': round(speed * 3.6, 2),
+                'obj_speed_mps': round(speed, 3), 'obj_width': 1.8, 'point_x': round(x, 2),
+                'point_y': LANE_WIDTH / 2 + LANE_WIDTH * lane, 'quality': 0,
+                'sensor_id': '17ee2a6e-e43a-48d8-8c29-c83ae5b984b7', 'time': time, 'uuid': 'x',
+            })
+        yield rows
+
+
+def write_dumps(scenario: Scenario, out_dir: str) -> List[str]:
+    """
+    Пишет поток в файлы по FILE_MINUTES минут с именами как у дампов сенсора
+
+    Args:
+        scenario (Scenario): Параметры потока
+        out_dir (str): Директория для файлов
+
+    Returns:
+        List[str]: Пути к файлам по порядку времени
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    config = sensor_config(scenario)
+    frames_per_file = int(FILE_MINUTES * 60 * scenario.frame_rate)
+    paths, objects = [], []
+    file_start = scenario.start
+
+    def flush():
+        path = os.path.join(out_dir, f"{scenario.prefix}{file_start.strftime('%d_%m_%Y_%H_%M')}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({**config, 'objects': objects}, f)
+        paths.append(path)
+
+    for frame, rows in enumerate(iter_frames(scenario)):
+        if frame and frame % frames_per_file == 0:
+            flush()
+            objects = []
+            file_start = scenario.start + timedelta(minutes=FILE_MINUTES * frame // frames_per_file)
+        if rows:
+            objects.append({'name': 'OBJECTS', 'protocol_version': '1.0', 'rows': len(rows), 'rows_data': rows})
+    flush()
+    return paths
@@ -0,0 +1,200 @@
+"""
+Бенчмарк конвейера метрик на синтетических данных.
+
+Для каждого масштаба генерируются дампы (benchmarks.generator), затем каждая
+стадия запускается в отдельном процессе, чтобы пиковое RSS относилось к ней
+одной. Результат - время, пропускная способность в кадрах в секунду и пиковое
+RSS по стадиям. Подготовка стадии из SETUP, например сборка индекса для
+запроса границ, идет в том же процессе до замера времени, но входит в
+пиковое RSS. С --save-baseline результат сохраняется как эталон, с
+--baseline сравнивается с эталоном, и замедление больше --tolerance считается
+регрессией (код возврата 1).
+
+    python -m benchmarks.run --scales 1m,10m,1h --baseline benchmarks/baseline.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from typing import Callable, Dict, List
+
+from benchmarks.generator import Scenario, write_dumps
+
+logger = logging.getLogger(__name__)
+
+# Масштабы в минутах данных
+SCALES = {'1m': 1, '10m': 10, '1h': 60, '6h': 360, '24h': 1440}
+WORK_DIR = os.getenv('BENCH_DIR', os.path.join(os.path.dirname(__file__), '.data'))
+DEFAULT = Scenario()
+
+
+def _load_store(paths: List[str]):
+    from backend.frame_cache import FrameCache
+    return FrameCache(os.path.join(os.path.dirname(paths[0]), '.cache')).get_all(paths)
+
+
+def stage_ingest(paths: List[str]) -> None:
+    from algorithm.json_to_models import process_json_file
+    for path in paths:
+        process_json_file(path)
+
+
+def stage_frame_store(paths: List[str]) -> None:
+    from algorithm.frames import FrameStore
+    from algorithm.json_to_models import iter_objects
+    for path in paths:
+        FrameStore.from_objects(iter_objects(path))
+
+
+def stage_queue_meters(paths: List[str]) -> None:
+    from algorithm.q import calculate_queue_meters
+    calculate_queue_meters(_load_store(paths))
+
+
+def stage_avg_stops(paths: List[str]) -> None:
+    from algorithm.metrics.avg_stops_count import avg_multiple_stops
+    avg_multiple_stops(_load_store(paths))
+
+
+def stage_delay(paths: List[str]) -> None:
+    from algorithm.metrics.delay_time import calc_time_diff
+    calc_time_diff(_load_store(paths))
+
+
+def stage_queue_index(paths: List[str]) -> None:
+    from backend.data_loader import build_queue_index
+    build_queue_index(_load_store(paths))
+
+
+def setup_queue_boundaries(paths: List[str]) -> tuple:
+    # Индекс строится до замера, стадия меряет только запрос за весь период
+    from algorithm.timestamps import from_micros
+    from backend.data_loader import build_queue_index, set_queue_index
+    store = _load_store(paths)
+    set_queue_index({'bench': {'name': 'bench', 'files': paths, 'lanes': [0, 1, 2]}},
+                    {'bench': build_queue_index(store)})
+    ts = store.frame_times
+    return from_micros(ts.min()), from_micros(ts.max())
+
+
+def stage_queue_boundaries(period: tuple) -> None:
+    from backend.data_loader import get_queue_boundaries
+    get_queue_boundaries(*period, 'bench')
+
+
+STAGES: Dict[str, Callable] = {
+    'process_json_file': stage_ingest,
+    'frame_store': stage_frame_store,
+    'calculate_queue_meters': stage_queue_meters,
+    'avg_multiple_stops': stage_avg_stops,
+    'calc_time_diff': stage_delay,
+    'build_queue_index': stage_queue_index,
+    'get_queue_boundaries': stage_queue_boundaries,
+}
+# Подготовка стадии вне замера времени: результат передается стадии вместо путей
+SETUP: Dict[str, Callable[[List[str]], object]] = {
+    'get_queue_boundaries': setup_queue_boundaries,
+}
+
+
+def _run_stage(name: str, paths: List[str], result: multiprocessing.Queue) -> None:
+    # print в метриках не должен попадать в отчет
+    sys.stdout = open(os.devnull, 'w')
+    logging.disable(logging.INFO)
+    arg = SETUP[name](paths) if name in SETUP else paths
+    started = time.perf_counter()
+    STAGES[name](arg)
+    seconds = time.perf_counter() - started
+    # ru_maxrss в Linux - килобайты
+    result.put((seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def run_stage(name: str, paths: List[str]) -> tuple[float, float]:
+    """Запускает стадию в новом процессе и возвращает время в секундах и пиковое RSS в МБ"""
+    context = multiprocessing.get_context('spawn')
+    result = context.Queue()
+    process = context.Process(target=_run_stage, args=(name, paths, result))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"Стадия {name} завершилась с кодом {process.exitcode}")
+    return result.get()
+
+
+def prepare(scale: str, scenario: Scenario) -> tuple[List[str], int]:
+    """Генерирует дампы масштаба один раз и прогревает кэш хранилища"""
+    scenario = scenario._replace(minutes=SCALES[scale])
+    out_dir = os.path.join(WORK_DIR, f"{scale}_{scenario.seed}")
+    marker = os.path.join(out_dir, 'scenario.json')
+    params = json.dumps({key: str(value) for key, value in scenario._asdict().items()}, sort_keys=True)
+    if os.path.exists(marker) and open(marker).read() == params:
+        paths = sorted(os.path.join(out_dir, name) for name in os.listdir(out_dir) if name.endswith('.json')
+                       and name != 'scenario.json')
+    else:
+        logger.info(f"Генерация {scale} данных")
+        paths = write_dumps(scenario, out_dir)
+        with open(marker, 'w') as f:
+            f.write(params)
+    return paths, len(_load_store(paths))
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Стадии, которые медленнее эталона больше чем на tolerance"""
+    regressions = []
+    for scale, stages in results.items():
+        for stage, stats in stages.items():
+            reference = baseline.get(scale, {}).get(stage)
+            if reference and stats['seconds'] > reference['seconds'] * (1 + tolerance):
+                regressions.append(f"{scale} {stage}: {stats['seconds']:.3f} с против {reference['seconds']:.3f} с")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк конвейера метрик на синтетических данных")
+    parser.add_argument('--scales', default='1m,10m,1h', help=f"через запятую из {', '.join(SCALES)}")
+    parser.add_argument('--stages', default=','.join(STAGES), help="стадии через запятую")
+    parser.add_argument('--cars-per-minute', type=float, default=DEFAULT.cars_per_minute)
+    parser.add_argument('--lanes', type=int, default=DEFAULT.lanes)
+    parser.add_argument('--frame-rate', type=float, default=DEFAULT.frame_rate)
+    parser.add_argument('--id-pool', type=int, default=DEFAULT.id_pool)
+    parser.add_argument('--red-secs', type=float, default=DEFAULT.red_secs)
+    parser.add_argument('--cycle-secs', type=float, default=DEFAULT.cycle_secs)
+    parser.add_argument('--seed', type=int, default=DEFAULT.seed)
+    parser.add_argument('--output', help="куда сохранить результаты в JSON")
+    parser.add_argument('--baseline', help="эталон для сравнения")
+    parser.add_argument('--save-baseline', help="сохранить результаты как эталон")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="допустимое замедление, доля")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    scenario = Scenario(cars_per_minute=args.cars_per_minute, lanes=args.lanes, frame_rate=args.frame_rate,
+                        id_pool=args.id_pool, red_secs=args.red_secs, cycle_secs=args.cycle_secs, seed=args.seed)
+    results = {}
+    for scale in args.scales.split(','):
+        paths, frames = prepare(scale, scenario)
+        results[scale] = {}
+        for stage in args.stages.split(','):
+            seconds, rss = run_stage(stage, paths)
+            rate = frames / seconds if seconds else None
+            results[scale][stage] = {'seconds': seconds, 'frames_per_s': rate, 'peak_rss_mb': rss, 'frames': frames}
+            print(f"{scale:>4} {stage:<24} {seconds:9.3f} с {rate or 0:12.0f} кадров/с {rss:8.1f} МБ")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"Регрессия: {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.generator import Scenario, write_dumps
+
+# Конфигурация backend читается из окружения при импорте, поэтому данные
+# генерируются до первого импорта backend.main
+_root = tempfile.mkdtemp(prefix='baikal-tests-')
+os.environ.update(DATA_DIR=os.path.join(_root, 'data'), CACHE_DIR=os.path.join(_root, 'cache'), DATA_TZ='UTC',
+                  PARSE_WORKERS='1', INDEX_WORKERS='1')
+write_dumps(Scenario(minutes=6), os.environ['DATA_DIR'])
+
+
+@pytest.fixture(scope='session')
+def client():
+    from fastapi.testclient import TestClient
+    from backend.main import app
+    with TestClient(app) as client:
+        for _ in range(600):
+            if client.get('/metrics/summary').status_code != 503:
+                break
+            time.sleep(0.1)
+        yield client
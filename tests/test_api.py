@@ -0,0 +1,122 @@
+import time
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+NAIVE = {'start': '2025-03-20T14:21:00', 'stop': '2025-03-20T14:22:30'}
+
+
+@pytest.mark.parametrize('start, stop', [
+    ('2025-03-20T14:21:00Z', '2025-03-20T14:22:30Z'),
+    ('2025-03-20T17:21:00+03:00', '2025-03-20T17:22:30+03:00'),
+])
+@pytest.mark.parametrize('path', ['/lanes/0/boundaries', '/boundaries', '/metrics/summary', '/zones/events'])
+def test_aware_query_time_is_data_time(client, path, start, stop):
+    # DATA_TZ=UTC в conftest: время с поясом переводится в локальное время дампов
+    expected = client.get(path, params=NAIVE)
+    response = client.get(path, params={'start': start, 'stop': stop})
+    assert expected.status_code == response.status_code == 200
+    naive, aware = expected.json(), response.json()
+    if path == '/metrics/summary':
+        naive, aware = naive['lanes'], aware['lanes']
+    assert aware == naive
+    assert path == '/zones/events' or aware
+
+
+def test_aware_phase_time(client):
+    expected = client.get('/phases', params={'at': '2025-03-20T14:22:00'})
+    for at in ('2025-03-20T14:22:00Z', '2025-03-20T17:22:00+03:00'):
+        response = client.get('/phases', params={'at': at})
+        assert response.status_code == 200
+        assert response.json() == expected.json()
+
+
+def test_aware_rollups(client):
+    expected = client.get('/rollups', params={**NAIVE, 'resolution': '10s'}).json()
+    response = client.get('/rollups', params={'start': '2025-03-20T14:21:00Z', 'stop': '2025-03-20T14:22:30Z',
+                                              'resolution': '10s'})
+    assert response.status_code == 200
+    assert response.json() == expected and expected['time']
+
+
+def test_summary_counts_one_period(client):
+    body = client.get('/metrics/summary', params={'start': '2025-03-20T14:21:00', 'stop': '2025-03-20T14:25:30'}).json()
+    # Период округляется до секунды, stop в ответе не включается
+    assert (body['start'], body['stop']) == ('2025-03-20T14:21:00', '2025-03-20T14:25:31')
+    frames = client.get('/boundaries', params={'start': body['start'], 'stop': '2025-03-20T14:25:30.999999'}).json()
+    assert body['frames'] == len(frames)
+    for lane in body['lanes']:
+        assert lane['queueFrames'] <= lane['frames'] <= body['frames']
+
+
+def test_predictions_use_sensor_lanes(client):
+    for sensor in client.get('/sensors').json():
+        for _ in range(500):
+            response = client.get('/predict', params={'sensor_id': sensor['sensorId']})
+            if response.status_code != 503:
+                break
+            time.sleep(0.01)
+        assert response.status_code == 200
+        assert [lane['laneId'] for lane in response.json()['lanes']] == sensor['lanes']
+    assert client.get('/predict', params={'sensor_id': 'unknown'}).status_code == 404
+
+
+def test_boundaries_match_data_loader(client):
+    from backend.data_loader import get_queue_boundaries
+    start, stop = datetime(2025, 3, 20, 14, 21), datetime(2025, 3, 20, 14, 22, 30)
+    expected = get_queue_boundaries(start, stop)
+    body = client.get('/boundaries', params=NAIVE).json()
+    lanes = sorted(expected)
+    assert [boundary['time'] for boundary in body] == [ts.isoformat() for _, _, ts in expected[lanes[0]]]
+    for i, boundary in enumerate(body):
+        assert [lane['laneId'] for lane in boundary['lanes']] == lanes
+        for lane in boundary['lanes']:
+            queue_start, queue_end, _ = expected[lane['laneId']][i]
+            assert lane['carStartId'] == (queue_start and queue_start.obj_id)
+            assert lane['carEndId'] == (queue_end and queue_end.obj_id)
+    for lane in lanes:
+        rows = client.get(f'/lanes/{lane}/boundaries', params=NAIVE).json()
+        assert [(row['time'], row['carStartId'], row['queueLength']) for row in rows] == \
+            [(boundary['time'], *[(item['carStartId'], item['queueLength'])
+                                  for item in boundary['lanes'] if item['laneId'] == lane][0]) for boundary in body]
+    assert client.get('/lanes/99/boundaries').status_code == 404
+
+
+def test_refresh_keeps_serving_previous_index(client):
+    from backend.main import index_service
+    updated_at = index_service.updated_at
+    response = client.post('/refresh')
+    assert response.status_code == 202 and response.json()['refreshing']
+    # Пока идет пересборка, запросы отвечают из прежнего снимка
+    assert client.get('/boundaries', params=NAIVE).status_code == 200
+    for _ in range(600):
+        if not index_service.refreshing:
+            break
+        time.sleep(0.1)
+    assert index_service.updated_at > updated_at
+    assert client.get('/boundaries', params=NAIVE).status_code == 200
+
+
+@pytest.mark.parametrize('compression', ['none', 'gzip'])
+def test_columnar_matches_json(client, compression):
+    from algorithm.timestamps import from_micros
+    from backend.columnar import MEDIA_TYPE, decode_boundaries
+    body = client.get('/boundaries', params=NAIVE).json()
+    response = client.get('/boundaries', params={**NAIVE, 'format': 'columnar', 'compression': compression})
+    assert response.status_code == 200 and response.headers['content-type'] == MEDIA_TYPE
+    # Тело уже распаковано клиентом по Content-Encoding
+    ts, lanes = decode_boundaries(response.content)
+    assert [from_micros(int(t)).isoformat() for t in ts] == [boundary['time'] for boundary in body]
+    for i, boundary in enumerate(body):
+        for lane in boundary['lanes']:
+            columns = lanes[lane['laneId']]
+            for name, value in lane.items():
+                if name == 'laneId':
+                    continue
+                if name in ('carStartId', 'carEndId'):
+                    assert columns[name][i] == (-1 if value is None else value)
+                elif value is None:
+                    assert np.isnan(columns[name][i])
+                else:
+                    assert columns[name][i] == pytest.approx(value, rel=1e-6, abs=1e-4)
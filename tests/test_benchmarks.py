@@ -0,0 +1,50 @@
+import pytest
+
+from algorithm.json_to_models import iter_objects, read_sensor_config
+from algorithm.tracks import TrackStore
+from benchmarks.generator import Scenario, write_dumps
+from benchmarks.run import compare, run_stage
+
+
+def _read(paths) -> list:
+    return [open(path, 'rb').read() for path in paths]
+
+
+def test_dumps_are_deterministic(tmp_path):
+    scenario = Scenario(minutes=0.5, seed=5)
+    first = write_dumps(scenario, str(tmp_path / 'a'))
+    assert _read(first) == _read(write_dumps(scenario, str(tmp_path / 'b')))
+    assert _read(first) != _read(write_dumps(scenario._replace(seed=6), str(tmp_path / 'c')))
+
+
+def test_dumps_follow_scenario(tmp_path):
+    scenario = Scenario(minutes=6, lanes=2, exit_lanes=1, frame_rate=5, id_pool=12, cars_per_minute=40)
+    paths = write_dumps(scenario, str(tmp_path))
+    # По файлу на FILE_MINUTES минут, конфигурация с заданными полосами
+    assert len(paths) == 2
+    config = read_sensor_config(paths[0])
+    assert [lane.direction for lane in config.road_sensor_lanes] == [-1, -1, 1]
+    frames = [obj for path in paths for obj in iter_objects(path)]
+    assert len(frames) <= scenario.frames
+    assert {row.lane for obj in frames for row in obj.rows_data} == {0, 1, 2}
+    # Маленький пул obj_id переиспользуется, треков больше, чем номеров
+    tracks = TrackStore()
+    for obj in frames:
+        if obj.rows_data:
+            tracks.update(obj)
+    assert max(row.obj_id for obj in frames for row in obj.rows_data) <= scenario.id_pool
+    assert tracks.next_key > scenario.id_pool
+
+
+def test_compare_flags_slower_stages():
+    baseline = {'1m': {'a': {'seconds': 1.0}, 'b': {'seconds': 2.0}}}
+    results = {'1m': {'a': {'seconds': 1.1}, 'b': {'seconds': 2.5}, 'c': {'seconds': 9.0}}}
+    regressions = compare(results, baseline, 0.2)
+    assert len(regressions) == 1 and regressions[0].startswith('1m b:')
+
+
+@pytest.mark.parametrize('stage', ['process_json_file', 'get_queue_boundaries'])
+def test_stage_runs_in_subprocess(tmp_path, stage):
+    paths = write_dumps(Scenario(minutes=0.2), str(tmp_path))
+    seconds, rss = run_stage(stage, paths)
+    assert seconds > 0 and rss > 0
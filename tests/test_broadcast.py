@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+from backend.broadcast import LaneStateBroadcaster
+
+
+def test_subscribe_without_attach():
+    async def read_two():
+        broadcaster = LaneStateBroadcaster()
+        messages = broadcaster.subscribe()
+        first = await messages.__anext__()
+        broadcaster.publish({'time': 1_742_480_460_000_000, 'avgStops': 0.5, 'lanes': [{'laneId': 0}]})
+        second = await asyncio.wait_for(messages.__anext__(), 1)
+        await messages.aclose()
+        return first, second
+
+    first, second = asyncio.run(read_two())
+    assert '"snapshot"' in first and '"delta"' in second
+
+
+def _frame(time, lanes, avg_stops=0.0):
+    return {'time': time, 'avgStops': avg_stops, 'lanes': [{'laneId': lane, **state} for lane, state in lanes.items()]}
+
+
+def test_deltas_rebuild_full_state():
+    # Состояние, собранное из дельт, совпадает с полным снимком после каждого кадра
+    broadcaster = LaneStateBroadcaster()
+    frames = [
+        {0: {'queueLength': 10.0, 'carStartId': 1}, 1: {'queueLength': 0.0}},
+        {0: {'queueLength': 10.001, 'carStartId': 1}, 1: {'queueLength': 0.0}},
+        {0: {'queueLength': 12.5, 'carStartId': 2}, 1: {'queueLength': 0.0}},
+        {0: {'queueLength': 12.5, 'carStartId': 2}, 1: {'queueLength': 4.0, 'delay': 1.5}},
+    ]
+    state = {}
+    seen = 0
+    for i, lanes in enumerate(frames):
+        broadcaster.publish(_frame(1_742_480_460_000_000 + i * 100_000, lanes))
+        for seq, message in list(broadcaster.buffer)[seen:]:
+            delta = json.loads(message)
+            assert delta['type'] == 'delta' and delta['seq'] == seq
+            for lane in delta['lanes']:
+                state[lane['laneId']] = lane
+            seen += 1
+        snapshot = json.loads(broadcaster.snapshot()[1])
+        assert {lane['laneId']: lane for lane in snapshot['lanes']} == state
+
+    # Дрожание меньше сантиметра не порождает дельту, неизменная полоса в дельту не попадает
+    assert [seq for seq, _ in broadcaster.buffer] == [1, 2, 3]
+    assert [lane['laneId'] for lane in json.loads(broadcaster.buffer[-1][1])['lanes']] == [1]
+
+
+def test_lagging_client_gets_snapshot():
+    async def read():
+        broadcaster = LaneStateBroadcaster()
+        messages = broadcaster.subscribe()
+        first = json.loads(await messages.__anext__())
+        # Клиент пропустил три кадра и вместо них получает одно полное состояние
+        for i in range(3):
+            broadcaster.publish(_frame(1_742_480_460_000_000 + i * 100_000, {0: {'queueLength': float(i + 1)}}))
+        second = json.loads(await asyncio.wait_for(messages.__anext__(), 1))
+        broadcaster.publish(_frame(1_742_480_460_300_000, {0: {'queueLength': 9.0}}))
+        third = json.loads(await asyncio.wait_for(messages.__anext__(), 1))
+        await messages.aclose()
+        return first, second, third
+
+    first, second, third = asyncio.run(read())
+    assert first['type'] == 'snapshot' and first['seq'] == 0
+    assert second['type'] == 'snapshot' and second['seq'] == 3
+    assert second['lanes'][0]['queueLength'] == 3.0
+    assert third['type'] == 'delta' and third['seq'] == 4
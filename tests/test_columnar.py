@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from algorithm.timestamps import MICROS
+from backend.columnar import decode_boundaries, encode_boundaries
+
+
+@pytest.mark.parametrize('compression', ['none', 'gzip'])
+def test_round_trip_with_long_gap(compression):
+    # Разрыв больше ~35 минут не помещается в int32 микросекунд
+    ts = np.array([0, 100_000, 200_000, 3 * 3600 * MICROS, 3 * 3600 * MICROS + 100_000], dtype=np.int64)
+    ts += 1_742_480_400_000_000
+    lanes = {1: {'start_id': np.array([-1, 5, 5, 7, -1]),
+                 'start_x': np.array([np.nan, 12.5, 12.25, 40.0, np.nan]),
+                 'length': np.array([0.0, 3.5, 3.75, 10.0, 0.0])}}
+    decoded_ts, decoded = decode_boundaries(encode_boundaries(ts, lanes, compression), compression)
+    assert np.array_equal(decoded_ts, ts)
+    assert np.array_equal(decoded[1]['carStartId'], lanes[1]['start_id'])
+    assert np.array_equal(decoded[1]['queueStart'], lanes[1]['start_x'].astype(np.float32), equal_nan=True)
+    assert np.array_equal(decoded[1]['queueLength'], lanes[1]['length'].astype(np.float32))
+
+
+def test_empty_period():
+    ts, lanes = decode_boundaries(encode_boundaries(np.empty(0, dtype=np.int64), {1: {}}))
+    assert len(ts) == 0 and lanes == {1: {}}
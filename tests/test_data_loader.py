@@ -0,0 +1,81 @@
+import glob
+import os
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from algorithm.frames import FrameStore
+from algorithm.json_to_models import iter_objects, read_sensor_config
+from algorithm.q import LANES, get_queue_end, get_queue_start, separate_row_by_lane
+from algorithm.timestamps import from_micros, to_micros
+from backend import frame_cache
+from backend.data_loader import boundaries_from_index, build_queue_index, build_sensor_indexes, discover_sensors
+from backend.frame_cache import FrameCache
+from benchmarks.generator import Scenario, write_dumps
+
+
+@pytest.fixture(scope='module')
+def objects() -> list:
+    path = sorted(glob.glob(os.path.join(os.environ['DATA_DIR'], '*.json')))[0]
+    return list(iter_objects(path))
+
+
+def _scan(objects: list, start: datetime, stop: datetime) -> dict:
+    # Линейный проход по всем кадрам, как до индекса по времени
+    boundaries = {lane: [] for lane in LANES}
+    for obj in objects:
+        ts = obj.rows_data[0].time
+        if not to_micros(start) <= ts <= to_micros(stop):
+            continue
+        for lane, rows in separate_row_by_lane(obj.rows_data).items():
+            queue_start, queue_end = get_queue_start(rows), get_queue_end(rows)
+            boundaries[lane].append((queue_start and queue_start.obj_id, queue_end and queue_end.obj_id,
+                                     from_micros(ts)))
+    return boundaries
+
+
+@pytest.mark.parametrize('start, stop', [
+    (datetime(2025, 3, 20, 14, 21), datetime(2025, 3, 20, 14, 22, 30)),
+    (datetime(2025, 3, 20, 14, 21, 0, 100000), datetime(2025, 3, 20, 14, 21, 0, 100000)),
+    (datetime(2025, 3, 20, 14, 0), datetime(2025, 3, 20, 15, 0)),
+    (datetime(2025, 3, 21), datetime(2025, 3, 22)),
+])
+def test_range_query_matches_linear_scan(objects, start, stop):
+    index = build_queue_index(FrameStore.from_objects(objects), LANES, horizon=0)
+    boundaries = boundaries_from_index(index, start, stop)
+    expected = _scan(objects, start, stop)
+    assert bool(expected[LANES[0]]) == (start.day == 20)
+    for lane in LANES:
+        assert [(queue_start and queue_start.obj_id, queue_end and queue_end.obj_id, ts)
+                for queue_start, queue_end, ts in boundaries[lane]] == expected[lane]
+
+
+
+def test_sharded_indexes_match_single_sensor_builds(tmp_path, monkeypatch):
+    monkeypatch.setattr(frame_cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(frame_cache, '_frame_caches', {})
+    data_dir = str(tmp_path / 'data')
+    first = write_dumps(Scenario(minutes=6, frame_rate=2.0), data_dir)
+    # Второй сенсор: другой префикс файлов и другой идентификатор в конфигурации
+    other_id = '22222222-0000-0000-0000-000000000000'
+    for path in write_dumps(Scenario(minutes=3, frame_rate=2.0, seed=1, prefix='Другой'), data_dir):
+        with open(path, encoding='utf-8') as f:
+            text = f.read().replace(read_sensor_config(first[0]).sensor_id, other_id)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    sensors = discover_sensors(data_dir)
+    assert set(sensors) == {read_sensor_config(first[0]).sensor_id, other_id}
+    assert sorted(sensors[other_id]['files']) == sensors[other_id]['files'] and len(sensors[other_id]['files']) == 1
+    indexes = build_sensor_indexes(sensors, max_workers=2)
+    for sensor_id, sensor in sensors.items():
+        store = FrameCache(str(tmp_path / sensor['name'])).get_all(sensor['files'], max_workers=1)
+        expected = build_queue_index(store, sensor['lanes'], sensor['spatial'])
+        index = indexes[sensor_id]
+        assert np.array_equal(index['ts'], expected['ts'])
+        assert list(index['lanes']) == sensor['lanes']
+        for lane, data in expected['lanes'].items():
+            for key, values in data.items():
+                assert np.array_equal(index['lanes'][lane][key], values, equal_nan=values.dtype.kind == 'f')
+        assert index['zone_events'] == expected['zone_events']
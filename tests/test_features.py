@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from algorithm.features import WINDOWS, FeatureWindows
+from algorithm.rollups import LANE_METRICS
+from algorithm.timestamps import MICROS
+
+LANES = [0, 1]
+T0 = 1_742_480_400 * MICROS
+
+
+@pytest.fixture(scope='module')
+def series():
+    # Кадры по 100 мс с разрывами до 20 минут, ряды с пропусками
+    rng = np.random.default_rng(11)
+    ts = T0 + np.cumsum(rng.choice([100_000, 3 * MICROS, 70 * MICROS, 1200 * MICROS], size=6000,
+                                   p=[0.97, 0.02, 0.008, 0.002]))
+    values = {(lane, name): np.where(rng.random(len(ts)) < 0.2, np.nan, rng.random(len(ts)) * 30)
+              for lane in LANES for name in LANE_METRICS}
+    return ts, values
+
+
+def _naive(ts, values, now):
+    # Окно (lo, hi) - закрытые секунды s, для которых now - hi <= s < now - lo
+    seconds = ts // MICROS
+    rows = []
+    for lane in LANES:
+        row = [lane, now // 3600 % 24]
+        for lo, hi in WINDOWS:
+            picked = (seconds >= now - hi) & (seconds < now - lo) & (seconds < now)
+            for name in LANE_METRICS:
+                column = values[(lane, name)][:len(ts)][picked]
+                column = column[~np.isnan(column)]
+                row.append(column.mean() if len(column) else np.nan)
+        rows.append(row)
+    return np.array(rows, dtype=np.float64)
+
+
+def test_features_match_recomputed_windows(series):
+    ts, values = series
+    windows = FeatureWindows(LANES)
+    checked = 0
+    for i, t in enumerate(ts.tolist()):
+        if windows.add(t, {key: column[i] for key, column in values.items()}) and i % 37 == 0:
+            assert np.allclose(windows.features(), _naive(ts[:i + 1], values, t // MICROS), equal_nan=True)
+            checked += 1
+    assert checked > 10
+
+
+def test_add_series_matches_add(series):
+    ts, values = series
+    one_by_one, batched = FeatureWindows(LANES), FeatureWindows(LANES)
+    for i, t in enumerate(ts.tolist()):
+        one_by_one.add(t, {key: column[i] for key, column in values.items()})
+    batched.add_series(ts, values)
+    assert batched.time == one_by_one.time
+    assert np.allclose(batched.features(), one_by_one.features(), equal_nan=True)
@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pytest
+
+from algorithm.frames import FrameStore
+from algorithm.json_to_models import iter_objects
+from backend import frame_cache
+from backend.frame_cache import FrameCache
+from benchmarks.generator import Scenario, write_dumps
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    parsed = []
+    parse_file = frame_cache.parse_file
+
+    def counting(file_path, store_path):
+        parsed.append(os.path.basename(file_path))
+        return parse_file(file_path, store_path)
+
+    monkeypatch.setattr(frame_cache, 'parse_file', counting)
+    return parsed
+
+
+def test_manifest_invalidated_on_mtime_and_size(tmp_path, parses):
+    path = write_dumps(Scenario(minutes=0.5), str(tmp_path / 'data'))[0]
+    expected = FrameStore.from_objects(iter_objects(path))
+    cache = FrameCache(str(tmp_path / 'cache'))
+    assert len(cache.get(path)) == len(expected)
+    assert len(FrameCache(str(tmp_path / 'cache')).get(path)) == len(expected)
+    assert len(parses) == 1
+
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    cache.get(path)
+    assert len(parses) == 2
+
+    # Тот же mtime, другой размер
+    stat = os.stat(path)
+    with open(path, 'a') as f:
+        f.write('\n')
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    store = cache.get(path)
+    assert len(parses) == 3
+    assert np.array_equal(store.columns['time'], expected.columns['time'])
+
+
+def test_consolidated_store_rebuilt_only_on_change(tmp_path, parses):
+    paths = write_dumps(Scenario(minutes=6, frame_rate=2.0), str(tmp_path / 'data'))
+    cache = FrameCache(str(tmp_path / 'cache'))
+    first = cache.get_all(paths, max_workers=1)
+    assert len(first) == sum(len(FrameStore.from_objects(iter_objects(path))) for path in paths)
+    again = FrameCache(str(tmp_path / 'cache')).get_all(paths, max_workers=1)
+    assert np.array_equal(again.offsets, first.offsets) and len(parses) == len(paths)
+
+    stat = os.stat(paths[-1])
+    os.utime(paths[-1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    cache.get_all(paths, max_workers=1)
+    assert parses[len(paths):] == [os.path.basename(paths[-1])]
+
+
+def test_parallel_load_matches_sequential_objects(tmp_path):
+    paths = write_dumps(Scenario(minutes=11, frame_rate=2), str(tmp_path / 'data'))
+    store = FrameCache(str(tmp_path / 'cache')).get_all(paths, max_workers=3)
+    expected = FrameStore.from_objects([obj for path in paths for obj in iter_objects(path)])
+    assert np.array_equal(store.offsets, expected.offsets)
+    for name, column in expected.columns.items():
+        assert np.array_equal(store.columns[name], column)
@@ -0,0 +1,63 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from algorithm.frames import FrameStore
+from algorithm.json_to_models import iter_objects
+
+
+def _objects() -> list:
+    path = sorted(glob.glob(os.path.join(os.environ['DATA_DIR'], '*.json')))[0]
+    return list(iter_objects(path))[:300]
+
+
+def test_store_keeps_rows_of_every_frame():
+    objects = _objects()
+    store = FrameStore.from_objects(objects)
+    assert len(store) == len(objects)
+    assert store.n_rows == sum(len(obj.rows_data) for obj in objects)
+    for obj, frame in zip(objects, store):
+        assert [(row.obj_id, row.lane, row.obj_speed, row.point_x, row.point_y, row.heading, row.time, row.obj_class)
+                for row in obj.rows_data] == [tuple(row) for row in frame.rows_data]
+    assert np.array_equal(store.frame_times, [obj.rows_data[0].time for obj in objects])
+    assert store.row(store.offsets[5]) == store[5].rows_data[0]
+
+
+def test_slice_and_concat_round_trip():
+    store = FrameStore.from_objects(_objects())
+    parts = [store.slice(0, 100), store.slice(100, 250), store.slice(250)]
+    assert [len(part) for part in parts] == [100, 150, len(store) - 250]
+    joined = FrameStore.concat(parts)
+    assert np.array_equal(joined.offsets, store.offsets)
+    for name, column in store.columns.items():
+        assert np.array_equal(joined.columns[name], column)
+    assert list(store.take(np.arange(100, 250))) == list(parts[1])
+
+
+def _naive_merge(stores: list) -> list:
+    # Кадр со временем из более раннего хранилища - повтор, остальные сортируются по времени
+    seen, kept = set(), []
+    for i, store in enumerate(stores):
+        times = {int(t) for t in store.frame_times}
+        kept.extend((int(t), i, j, frame) for j, (t, frame) in enumerate(zip(store.frame_times, store))
+                    if int(t) not in seen)
+        seen |= times
+    return [frame for _, _, _, frame in sorted(kept, key=lambda item: item[:3])]
+
+
+@pytest.mark.parametrize('cuts', [
+    [(0, 100), (100, 200), (200, 300)],  # без пересечений
+    [(0, 120), (100, 220), (200, 300)],  # повторы на стыках
+    [(100, 200), (0, 150), (250, 300), (180, 260)],  # файлы вперемешку
+])
+def test_merge_matches_sort_and_dedupe(cuts):
+    store = FrameStore.from_objects([obj for obj in _objects() if obj.rows_data])
+    parts = [store.slice(lo, hi) for lo, hi in cuts]
+    rng = np.random.default_rng(len(cuts))
+    # Внутри последнего файла кадры тоже идут не по порядку
+    parts[-1] = parts[-1].take(rng.permutation(len(parts[-1])))
+    merged = FrameStore.merge(parts)
+    assert [frame.rows_data for frame in merged] == [frame.rows_data for frame in _naive_merge(parts)]
+    assert not np.any(np.diff(merged.frame_times) < 0)
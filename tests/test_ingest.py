@@ -0,0 +1,27 @@
+import glob
+import os
+
+import numpy as np
+
+from algorithm.frames import FrameStore
+from algorithm.json_to_models import iter_objects
+from algorithm.q import LANES, calculate_lane_metrics
+from backend.ingest import LiveMetrics
+
+
+def test_live_lane_state_matches_batch_kernel():
+    path = sorted(glob.glob(os.path.join(os.environ['DATA_DIR'], '*.json')))[0]
+    objects = list(iter_objects(path))[:1500]
+    batch = calculate_lane_metrics(FrameStore.from_objects(objects), LANES)
+    live = LiveMetrics(history_size=50)
+    snapshots = [live.process(obj) for obj in objects]
+    assert len(live.history) == 50 and live.last is snapshots[-1]
+    for i, snapshot in enumerate(snapshots):
+        assert snapshot['time'] == batch[LANES[0]]['ts'][i]
+        for lane in snapshot['lanes']:
+            data = batch[lane['laneId']]
+            queued = data['start_row'][i] >= 0
+            assert lane['carStartId'] == (data['start_id'][i] if queued else None)
+            assert lane['carEndId'] == (data['end_id'][i] if queued else None)
+            assert np.isclose(lane['queueLength'], data['length'][i])
+            assert np.isclose(lane['flowSpeed'], data['flow_speed'][i])
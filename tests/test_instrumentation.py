@@ -0,0 +1,58 @@
+import glob
+import os
+import random
+
+from algorithm.json_to_models import iter_objects
+from backend.ingest import LiveMetrics
+from backend.instrumentation import STAGE_SECONDS, Histogram, render
+
+
+def _samples(text: str) -> dict:
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value.replace('+Inf', 'inf'))
+    return samples
+
+
+def _stage_count(stage: str) -> float:
+    return _samples(render()).get(f'baikal_stage_seconds_count{{stage="{stage}"}}', 0)
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('test_histogram_seconds', "Проверка корзин", ('kind',), buckets=(0.1, 0.5, 1.0))
+    rng = random.Random(1)
+    values = [rng.choice([0.05, 0.1, 0.3, 0.5, 0.7, 1.0, 3.0, rng.random() * 2]) for _ in range(500)]
+    for value in values:
+        histogram.observe(value, 'a')
+    samples = _samples('\n'.join(histogram.render()))
+    # le - включительная граница, как в Prometheus
+    for bound, label in ((0.1, '0.1'), (0.5, '0.5'), (1.0, '1.0'), (float('inf'), '+Inf')):
+        assert samples[f'baikal_test_histogram_seconds_bucket{{kind="a",le="{label}"}}'] == \
+            sum(value <= bound for value in values)
+    assert samples['baikal_test_histogram_seconds_count{kind="a"}'] == len(values)
+    assert abs(samples['baikal_test_histogram_seconds_sum{kind="a"}'] - sum(values)) < 1e-9
+
+
+def test_live_frames_record_every_stage():
+    path = sorted(glob.glob(os.path.join(os.environ['DATA_DIR'], '*.json')))[0]
+    frames = [obj for obj in iter_objects(path) if obj.rows_data][:200]
+    before = {stage: _stage_count(stage) for stage in ('track', 'queue', 'zones', 'metrics')}
+    live = LiveMetrics()
+    for frame in frames:
+        live.process(frame)
+    for stage, count in before.items():
+        assert _stage_count(stage) == count + len(frames)
+
+
+def test_metrics_endpoint(client):
+    client.get('/boundaries', params={'start': '2025-03-20T14:21:00', 'stop': '2025-03-20T14:21:10'})
+    with STAGE_SECONDS.time('test'):
+        pass
+    response = client.get('/metrics')
+    assert response.status_code == 200 and response.headers['content-type'].startswith('text/plain')
+    samples = _samples(response.text)
+    assert samples['baikal_stage_seconds_count{stage="test"}'] >= 1
+    assert samples['baikal_http_request_seconds_count{method="GET",route="/boundaries",status="200"}'] >= 1
+    assert 'baikal_index_resident_bytes' in samples
@@ -0,0 +1,16 @@
+import pytest
+
+from algorithm import json_to_models
+from algorithm.json_to_models import iter_objects, process_json_file, read_sensor_config
+from benchmarks.generator import Scenario, write_dumps
+
+
+@pytest.mark.parametrize('chunk_size', [json_to_models.CHUNK_SIZE, 61])
+def test_streaming_matches_json_load(tmp_path, monkeypatch, chunk_size):
+    path = write_dumps(Scenario(minutes=0.5), str(tmp_path))[0]
+    # Маленький блок режет строки и числа на границах буфера
+    monkeypatch.setattr(json_to_models, 'CHUNK_SIZE', chunk_size)
+    expected = process_json_file(path)[0]
+    frames = list(iter_objects(path))
+    assert frames and frames == [frame for frame in expected.objects if frame.rows_data]
+    assert read_sensor_config(path) == expected.model_copy(update={'objects': []})
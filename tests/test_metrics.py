@@ -0,0 +1,124 @@
+import glob
+import os
+import random
+import subprocess
+import sys
+from collections import deque
+
+import pytest
+
+from algorithm.json_to_models import iter_objects
+from algorithm.metrics import avg_stops_count, calc_time_diff, queue_time
+from algorithm.metrics.avg_stops_count import AVG_STOPS_VALUE_THRESHOLD_MIN, StopsWindow
+from algorithm.metrics.delay_time import (
+    DelayTracker, calc_avg_delay_time, calculate_time, check_heading, has_left, is_traffic_lane, standard_time_seconds,
+)
+from algorithm.timestamps import MICROS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class RescannedStops:
+    """Прежний подсчет: deque остановок, которую каждый кадр проходят целиком"""
+
+    def __init__(self):
+        self.stops = deque()
+        self.tracked = set()
+
+    def remove_car(self, car_id: int) -> None:
+        self.stops = deque(stop for stop in self.stops if stop[1] != car_id)
+
+    def average(self, curr_ts: int) -> float:
+        if not self.stops or not self.tracked:
+            return 0.0
+        while self.stops and self.stops[0][0] < curr_ts - AVG_STOPS_VALUE_THRESHOLD_MIN * 60 * MICROS:
+            self.stops.popleft()
+        return len([stop for stop in self.stops if stop[1] in self.tracked]) / len(self.tracked)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_stops_window_matches_rescan(seed):
+    rng = random.Random(seed)
+    window, expected = StopsWindow(), RescannedStops()
+    ts = 0
+    for _ in range(5000):
+        ts += rng.randrange(0, 2 * MICROS)
+        car_id = rng.randrange(20)
+        action = rng.random()
+        if action < 0.3:
+            window.track(car_id)
+            expected.tracked.add(car_id)
+        elif action < 0.45:
+            window.untrack(car_id)
+            expected.tracked.discard(car_id)
+        elif action < 0.8:
+            stop_ts = ts - rng.randrange(0, 10 * MICROS)
+            window.add(stop_ts, car_id)
+            expected.stops.append((stop_ts, car_id))
+        else:
+            window.remove_car(car_id)
+            expected.remove_car(car_id)
+        assert window.average(ts) == pytest.approx(expected.average(ts))
+
+
+def _delays_with_time_entries(objects: list) -> list:
+    # Прежний расчет: все наблюдения машины в time_entries и проход по всем машинам на каждом кадре
+    cars, car_leaves, avg_sum, result = {}, deque(), 0, []
+    for frame in objects:
+        curr_ts = frame.rows_data[0].time
+        for car in frame.rows_data:
+            if not is_traffic_lane(car.lane) and check_heading(car.heading):
+                continue
+            car_data = cars.setdefault(car.obj_id, {'from_beginning': False, 'time_entries': []})
+            if car.point_x >= 200:
+                car_data['from_beginning'] = True
+            if car.point_x <= 200:
+                car_data['time_entries'].append((car.time, car.lane))
+        sum_delay, sum_cars = 0, 0
+        for car_id, car_data in list(cars.items()):
+            entries = car_data['time_entries']
+            if entries and has_left(curr_ts, entries[-1][0]):
+                if car_data['from_beginning'] and is_traffic_lane(entries[0][1]):
+                    delay = calculate_time(entries[-1][0], entries[0][0]) - standard_time_seconds
+                    sum_delay += delay
+                    avg_sum += delay
+                    sum_cars += 1
+                    car_leaves.append((curr_ts, delay))
+                del cars[car_id]
+        if sum_cars:
+            result.append({'time': curr_ts, 'avg_delay_time': sum_delay / sum_cars,
+                           'avg_delay_time_mins': max(0, calc_avg_delay_time(curr_ts, avg_sum, car_leaves))})
+    return result
+
+
+def test_delay_tracker_matches_time_entries():
+    path = sorted(glob.glob(os.path.join(os.environ['DATA_DIR'], '*.json')))[0]
+    objects = list(iter_objects(path))
+    expected = _delays_with_time_entries(objects)
+    tracker = DelayTracker()
+    actual = []
+    for frame in objects:
+        delays = tracker.update(frame)
+        if delays:
+            actual.append({'time': frame.rows_data[0].time, 'avg_delay_time': delays[0],
+                           'avg_delay_time_mins': delays[1]})
+    assert expected and actual == [pytest.approx(item) for item in expected]
+    # Состояние держится только для машин, которые еще в зоне сенсора
+    assert len(tracker.cars) <= 2 * max(len(frame.rows_data) for frame in objects[-100:])
+
+
+def test_metrics_import_without_loading_data():
+    code = "import sys, algorithm.metrics; print(any(name.startswith('backend') for name in sys.modules))"
+    env = {**os.environ, 'DATA_DIR': os.path.join(os.environ['DATA_DIR'], 'missing')}
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
+
+
+@pytest.mark.parametrize('calculate', [avg_stops_count.avg_multiple_stops, queue_time.avg_multiple_stops,
+                                       calc_time_diff])
+def test_metric_runs_share_no_state(calculate):
+    paths = sorted(glob.glob(os.path.join(os.environ['DATA_DIR'], '*.json')))
+    first, second = list(iter_objects(paths[0])), list(iter_objects(paths[1]))
+    expected = calculate(second)
+    calculate(first)
+    assert calculate(second) == expected
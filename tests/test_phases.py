@@ -0,0 +1,59 @@
+import itertools
+import random
+
+import pytest
+
+from algorithm.phases import CYCLE_SECS, Movement, PhaseOptimizer, compatibility_masks, max_weight_clique
+
+
+def _is_clique(mask: int, adjacency) -> bool:
+    members = [v for v in range(len(adjacency)) if mask >> v & 1]
+    return all(adjacency[a] >> b & 1 for a, b in itertools.combinations(members, 2))
+
+
+def _brute_force(weights, adjacency, candidates) -> float:
+    best = 0.0
+    for mask in range(1 << len(weights)):
+        if mask & ~candidates or not _is_clique(mask, adjacency):
+            continue
+        best = max(best, sum(weights[v] for v in range(len(weights)) if mask >> v & 1))
+    return best
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_clique_matches_brute_force(seed):
+    rng = random.Random(seed)
+    n = rng.randint(1, 11)
+    density = rng.choice([0.2, 0.5, 0.8])
+    adjacency = [0] * n
+    for a, b in itertools.combinations(range(n), 2):
+        if rng.random() < density:
+            adjacency[a] |= 1 << b
+            adjacency[b] |= 1 << a
+    # Повторяющиеся и нулевые веса, как у округленных весов полос
+    weights = [rng.choice([0.0, 0.5, 1.0, 2.5, rng.uniform(0, 10)]) for _ in range(n)]
+    candidates = rng.getrandbits(n) if seed % 2 else (1 << n) - 1
+    weight, clique = max_weight_clique(weights, adjacency, candidates)
+    assert weight == pytest.approx(_brute_force(weights, adjacency, candidates))
+    assert not clique & ~candidates and _is_clique(clique, adjacency)
+    assert weight == pytest.approx(sum(weights[v] for v in range(n) if clique >> v & 1))
+
+
+def test_phases_are_compatible_and_cached():
+    movements = [Movement('s', approach * 3 + i, approach, turn)
+                 for approach in range(4) for i, turn in enumerate(['right', 'through', 'left'])]
+    optimizer = PhaseOptimizer(movements)
+    adjacency = compatibility_masks(movements)
+    lanes = {('s', m.lane): {'queueLength': 7.0 * (m.lane % 5 + 1), 'delay': 10.0 * m.approach}
+             for m in movements}
+    phases = optimizer.recommend(lanes)
+    served = set()
+    for phase in phases:
+        mask = sum(1 << movements.index(m) for m in phase['movements'])
+        assert _is_clique(mask, adjacency)
+        served.update(phase['movements'])
+    assert served == set(movements)
+    assert sum(phase['green'] for phase in phases) == pytest.approx(CYCLE_SECS)
+    # Те же веса после округления решаются из кэша
+    lanes[('s', 0)]['queueLength'] += 0.1
+    assert optimizer.recommend(lanes) == phases and optimizer.hits == 1
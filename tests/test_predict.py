@@ -0,0 +1,78 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from algorithm.timestamps import from_micros
+from backend.predict import PredictionService
+
+
+class BlockingModel:
+    """Модель, оценка которой ждет разрешения теста"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        self.started.set()
+        self.release.wait(5)
+        return np.zeros(len(features))
+
+
+class FastModel:
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        return np.zeros(len(features))
+
+
+def _wait(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.001)
+    return False
+
+
+def _features(service: PredictionService) -> np.ndarray:
+    return np.zeros((len(service.windows.lanes), len(service.windows.feature_names)))
+
+
+def test_submit_while_scoring_is_not_lost():
+    model = BlockingModel()
+    service = PredictionService([0, 1], model=model)
+    service._submit(1_000_000, _features(service))
+    assert model.started.wait(5)
+    # Оценка первого батча идет, следующие должны дождаться ее и оцениться
+    service._submit(2_000_000, _features(service))
+    service._submit(3_000_000, _features(service))
+    model.release.set()
+    assert _wait(lambda: service.get() is not None and service.get()['time'] == from_micros(3_000_000))
+    assert _wait(lambda: service.backlog == 0)
+    service.shutdown()
+
+
+class HookedPool(ThreadPoolExecutor):
+    """Пул, который после первой задачи, но до завершения ее future, вызывает hook"""
+
+    def __init__(self, hook):
+        super().__init__(max_workers=1)
+        self.hook = hook
+
+    def submit(self, fn, *args, **kwargs):
+        def run():
+            fn(*args, **kwargs)
+            hook, self.hook = self.hook, None
+            if hook is not None:
+                hook()
+        return super().submit(run)
+
+
+def test_submit_before_score_future_completes():
+    service = PredictionService([0], model=FastModel(),
+                                pool=HookedPool(lambda: service._submit(2_000_000, _features(service))))
+    service._submit(1_000_000, _features(service))
+    assert _wait(lambda: service.get() is not None and service.get()['time'] == from_micros(2_000_000))
+    assert _wait(lambda: service.backlog == 0)
+    service.shutdown()
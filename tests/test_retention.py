@@ -0,0 +1,89 @@
+import os
+import shutil
+
+import numpy as np
+
+from algorithm.rollups import build_rollups, summarize
+from algorithm.timestamps import micros
+from backend import data_loader, frame_cache
+from backend.retention import (
+    SegmentCache, index_nbytes, load_history, load_segment, save_history, spill_index,
+)
+from benchmarks.generator import Scenario, write_dumps
+
+
+def test_rebuilds_keep_only_horizon_and_all_rollups(tmp_path, monkeypatch):
+    monkeypatch.setattr(frame_cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(frame_cache, '_frame_caches', {})
+    monkeypatch.setattr(data_loader, 'RETENTION_HORIZON', 150.0)
+    paths = write_dumps(Scenario(minutes=11, frame_rate=2.0), str(tmp_path / 'dumps'))
+    lanes = next(iter(data_loader.discover_sensors(str(tmp_path / 'dumps')).values()))['lanes']
+    full = data_loader.build_queue_index(frame_cache.FrameCache(str(tmp_path / 'full')).get_all(paths), lanes,
+                                         horizon=0)
+
+    # Дампы приходят по одному, индекс пересобирается после каждого и еще раз без новых файлов
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    for path in paths + [None]:
+        if path is not None:
+            shutil.copy(path, data_dir)
+        sensors = data_loader.discover_sensors(str(data_dir))
+        index = next(iter(data_loader.build_sensor_indexes(sensors).values()))
+        ts = index['ts']
+        assert ts[-1] - ts[0] <= micros(150)
+        assert np.array_equal(index['store'].frame_times, ts)
+        for data in index['lanes'].values():
+            queued = data['start_row'] >= 0
+            assert np.array_equal(index['store'].columns['time'][data['start_row'][queued]], ts[queued])
+
+    cache = frame_cache.get_frame_cache(data_loader._sensor_cache_name(next(iter(sensors))))
+    assert sorted(cache.manifest['evicted']) == [os.path.basename(path) for path in paths[:1]]
+    assert not os.path.exists(cache._store_path(os.path.basename(paths[0])))
+    expected, actual = summarize(full['rollups']), summarize(index['rollups'])
+    assert set(expected) == set(actual)
+    for key in expected:
+        assert actual[key]['count'] == expected[key]['count']
+        assert np.isclose(actual[key]['sum'], expected[key]['sum'])
+
+
+def _index(seed: int, frames: int = 1000) -> dict:
+    rng = np.random.default_rng(seed)
+    return {'ts': np.arange(frames, dtype=np.int64) * 100_000,
+            'lanes': {lane: {'length': rng.random(frames), 'start_row': rng.integers(-1, 50, frames)}
+                      for lane in (0, 1)}}
+
+
+def test_spilled_segments_round_trip_and_stay_in_budget(tmp_path):
+    indexes = {f's{i}': _index(i) for i in range(3)}
+    expected = {sensor: {'ts': index['ts'].copy(),
+                         'lanes': {lane: {key: values.copy() for key, values in data.items()}
+                                   for lane, data in index['lanes'].items()}}
+                for sensor, index in indexes.items()}
+    size = index_nbytes(indexes['s0'])
+    spilled = {sensor: load_segment(spill_index(index, str(tmp_path / sensor))) for sensor, index in indexes.items()}
+    # В бюджет помещаются два индекса, третий вытесняет давно не запрошенный
+    cache = SegmentCache(budget=2 * size)
+    for sensor in ('s0', 's1', 's0', 's2'):
+        resident = cache.get(sensor, spilled[sensor])
+        assert np.array_equal(resident['ts'], expected[sensor]['ts'])
+        for lane, data in expected[sensor]['lanes'].items():
+            for key, values in data.items():
+                assert np.array_equal(resident['lanes'][lane][key], values)
+    assert list(cache.resident) == ['s0', 's2'] and cache.nbytes <= cache.budget
+    # Индекс больше бюджета читается через mmap и в память не копируется
+    assert SegmentCache(budget=size - 1).get('s0', spilled['s0']) is spilled['s0']
+
+
+def test_history_round_trip(tmp_path):
+    index = _index(5)
+    series = {(lane, 'length'): data['length'] for lane, data in index['lanes'].items()}
+    history = {'until': int(index['ts'][-1]) + 1, 'rollups': build_rollups(index['ts'], series)}
+    save_history(history, str(tmp_path / 'history'))
+    loaded = load_history(str(tmp_path / 'history'))
+    assert loaded['until'] == history['until'] and set(loaded['rollups']) == set(history['rollups'])
+    for name, level in history['rollups'].items():
+        assert np.array_equal(loaded['rollups'][name].bucket, level.bucket)
+        for key, stats in level.stats.items():
+            for agg, values in stats.items():
+                assert np.array_equal(loaded['rollups'][name].stats[key][agg], values, equal_nan=True)
+    assert load_history(str(tmp_path / 'missing')) is None
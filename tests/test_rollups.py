@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from algorithm.rollups import AGGREGATES, RESOLUTIONS, RollupAccumulator, build_rollups, summarize, summary_range
+from algorithm.timestamps import MICROS
+
+T0 = 1_742_480_400 * MICROS
+
+
+@pytest.fixture(scope='module')
+def series():
+    # Кадры ~10 в секунду с разрывами, ряды с пропусками
+    rng = np.random.default_rng(7)
+    ts = T0 + np.cumsum(rng.choice([100_000, 100_000, 100_000, 7 * MICROS, 400 * MICROS], size=4000,
+                                   p=[0.9, 0.05, 0.04, 0.009, 0.001]))
+    values = {
+        (0, 'queueLength'): np.where(rng.random(len(ts)) < 0.3, np.nan, rng.random(len(ts)) * 50),
+        (1, 'delay'): rng.random(len(ts)) * 10,
+    }
+    return ts, values
+
+
+def _naive(ts, values, lo_us, hi_us):
+    picked = values[(ts >= lo_us) & (ts < hi_us)]
+    picked = picked[~np.isnan(picked)]
+    if not len(picked):
+        return {'count': 0, 'sum': 0.0, 'min': np.nan, 'max': np.nan, 'last': np.nan}
+    return {'count': len(picked), 'sum': picked.sum(), 'min': picked.min(), 'max': picked.max(), 'last': picked[-1]}
+
+
+def _assert_stats(actual, expected):
+    for agg in AGGREGATES:
+        assert actual[agg] == pytest.approx(expected[agg], nan_ok=True), agg
+
+
+def test_buckets_match_raw_values(series):
+    ts, values = series
+    levels = build_rollups(ts, values)
+    for name, step in RESOLUTIONS.items():
+        level = levels[name]
+        step_us = step * MICROS
+        assert np.array_equal(level.bucket, np.unique(ts // step_us * step_us))
+        for key, data in values.items():
+            for i in range(0, len(level), max(len(level) // 50, 1)):
+                bucket = int(level.bucket[i])
+                _assert_stats({agg: level.stats[key][agg][i] for agg in AGGREGATES},
+                              _naive(ts, data, bucket, bucket + step_us))
+
+
+def test_accumulator_matches_build_rollups(series):
+    ts, values = series
+    expected = build_rollups(ts, values)
+    accumulator = RollupAccumulator(retention={})
+    for i, t in enumerate(ts):
+        accumulator.add(int(t), {key: data[i] for key, data in values.items()})
+    actual = accumulator.levels()
+    for name in RESOLUTIONS:
+        assert np.array_equal(actual[name].bucket, expected[name].bucket)
+        for key in values:
+            for agg in AGGREGATES:
+                assert np.allclose(actual[name].stats[key][agg], expected[name].stats[key][agg], equal_nan=True)
+
+
+@pytest.mark.parametrize('start, stop', [(None, None), (3.3, 250.7), (61.05, 1000.0), (0.0, 0.05)])
+def test_summarize_matches_raw_values(series, start, stop):
+    ts, values = series
+    levels = build_rollups(ts, values)
+    start_us = None if start is None else T0 + int(start * MICROS)
+    stop_us = None if stop is None else T0 + int(stop * MICROS)
+    result = summarize(levels, start_us, stop_us)
+    period = summary_range(levels, start_us, stop_us)
+    for key, data in values.items():
+        expected = _naive(ts, data, *period) if period else _naive(ts, data, 0, 0)
+        _assert_stats(result[key], expected)
+        if expected['count']:
+            assert result[key]['mean'] == pytest.approx(expected['sum'] / expected['count'])
@@ -0,0 +1,60 @@
+import glob
+import os
+
+import numpy as np
+
+from algorithm.json_to_models import iter_objects, read_sensor_config
+from algorithm.metrics.avg_stops_count import check_heading, is_traffic_lane
+from algorithm.spatial import SpatialIndex, _distance_to_polyline, _inside_polygon, _lane_centerline, _zone_polygon
+
+
+def _path() -> str:
+    return sorted(glob.glob(os.path.join(os.environ['DATA_DIR'], '*.json')))[0]
+
+
+def test_fallback_matches_hardcoded_filters():
+    rows = [row for obj in iter_objects(_path()) for row in obj.rows_data]
+    spatial = SpatialIndex.fallback()
+    classes = spatial.classify(rows)
+    assert classes.lane == [row.lane for row in rows]
+    assert classes.stop_dist == [row.point_x for row in rows]
+    assert classes.traffic == [is_traffic_lane(row.lane) for row in rows]
+    assert classes.heading_ok == [check_heading(row.heading) for row in rows]
+
+    # Векторный путь без геометрии дает то же самое
+    arrays = spatial.classify_arrays([row.lane for row in rows], [row.point_x for row in rows],
+                                     [row.point_y for row in rows], [row.heading for row in rows])
+    assert arrays['traffic'].tolist() == classes.traffic
+    assert arrays['heading_ok'].tolist() == classes.heading_ok
+    assert np.allclose(arrays['stop_dist'], classes.stop_dist)
+
+
+def test_grid_lookup_matches_geometry():
+    spatial = SpatialIndex.from_config(read_sensor_config(_path()))
+    rng = np.random.default_rng(3)
+    lo, hi = spatial.origin - 5, spatial.origin + np.array(spatial.shape) * spatial.cell_size + 5
+    x, y = rng.uniform(lo[0], hi[0], 20000), rng.uniform(lo[1], hi[1], 20000)
+
+    # Точный ответ: ближайшая осевая линия в пределах половины ширины и проверка многоугольника
+    dist = np.array([_distance_to_polyline(x, y, _lane_centerline(lane)) for lane in spatial.lanes])
+    nearest = dist.argmin(axis=0)
+    inside_lane = dist[nearest, np.arange(len(x))] <= np.array([lane.width / 2 for lane in spatial.lanes])[nearest]
+    lane = np.where(inside_lane, np.array([lane.lane_index for lane in spatial.lanes])[nearest], -1)
+    polygons = [_zone_polygon(zone) for zone in spatial.zones]
+    zone = np.full(len(x), -1)
+    for i, polygon in reversed(list(enumerate(polygons))):
+        zone[_inside_polygon(x, y, polygon)] = i
+
+    # Растр ошибается только в ячейках на границах полос и зон
+    margin = spatial.cell_size * np.sqrt(2)
+    sorted_dist = np.sort(dist, axis=0)
+    near_lane_edge = (np.abs(dist - np.array([[lane.width / 2] for lane in spatial.lanes])) < margin).any(axis=0) \
+        | (sorted_dist[1] - sorted_dist[0] < margin)
+    near_zone_edge = np.zeros(len(x), dtype=bool)
+    for polygon in polygons:
+        near_zone_edge |= _distance_to_polyline(x, y, np.vstack([polygon, polygon[:1]])) < margin
+
+    geo_lane, geo_zone = spatial.lookup(x, y)
+    assert (lane >= 0).any() and (zone >= 0).any()
+    assert np.array_equal(geo_lane[~near_lane_edge], lane[~near_lane_edge])
+    assert np.array_equal(geo_zone[~near_zone_edge], zone[~near_zone_edge])
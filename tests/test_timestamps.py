@@ -0,0 +1,53 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from algorithm.timestamps import (
+    MICROS, TIME_FORMAT, format_micros, from_micros, micros, parse_micros, seconds, to_micros,
+)
+
+
+@pytest.mark.parametrize('value', ['2025-03-20 14:20:00.5', '2025-03-20 14:20:00.123456', '2024-02-29 23:59:59.999999',
+                                   '2025-03-20 14:20:00', '2025-03-20T14:20:00.100000'])
+def test_parse_micros_matches_datetime(value):
+    assert parse_micros(value) == to_micros(datetime.fromisoformat(value))
+
+
+@pytest.mark.parametrize('value', ['2025-03-20 -1:20:00.000000', '2025-03-20 14:+1:00.000000',
+                                   '2025-13-20 14:20:00.000000', '2025-02-30 14:20:00.000000',
+                                   '2025-03-20 24:00:00.000000', '2025-03-20 14:20:00.-00001',
+                                   '2025-03-20 14:20:00.12345+', '2025-03-20 14:20:00.000000+03:00'])
+def test_parse_micros_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        parse_micros(value)
+
+
+def test_parse_micros_format():
+    dt = datetime(2025, 3, 20, 14, 20, 1, 700000)
+    assert parse_micros(dt.strftime(TIME_FORMAT)) == to_micros(dt)
+
+
+def test_random_times_match_strptime():
+    rng = random.Random(24)
+    start = datetime(1990, 1, 1)
+    for _ in range(2000):
+        dt = start + timedelta(microseconds=rng.randrange(110 * 365 * 86400 * MICROS))
+        # Дробная часть бывает от 1 до 6 знаков, как у разных прошивок сенсора
+        value = dt.strftime(TIME_FORMAT)[:rng.randint(21, 26)]
+        expected = datetime.strptime(value, TIME_FORMAT)
+        assert parse_micros(value) == to_micros(expected)
+        assert from_micros(to_micros(expected)) == expected
+        assert parse_micros(format_micros(parse_micros(value))) == parse_micros(value)
+
+
+def test_integer_intervals_match_timedelta():
+    rng = random.Random(7)
+    base = datetime(2025, 3, 20, 14, 20)
+    for _ in range(500):
+        a = base + timedelta(microseconds=rng.randrange(3600 * MICROS))
+        b = a + timedelta(microseconds=rng.randrange(-20 * MICROS, 20 * MICROS))
+        elapsed = to_micros(b) - to_micros(a)
+        assert seconds(elapsed) == (b - a).total_seconds()
+        # Проверки вида has_left: целые микросекунды против timedelta
+        assert (elapsed >= micros(10)) == ((b - a).total_seconds() >= 10)
@@ -0,0 +1,59 @@
+import glob
+import os
+from types import SimpleNamespace
+
+import numpy as np
+
+from algorithm.frames import FrameStore
+from algorithm.json_to_models import iter_objects
+from algorithm.q import _track_starts
+from algorithm.timestamps import MICROS
+from algorithm.tracks import TRACK_GAP_SECS, TrackStore
+
+T0 = 1_742_480_400 * MICROS
+
+
+def _frame(seconds, *rows):
+    time = T0 + int(seconds * MICROS)
+    return SimpleNamespace(rows_data=[SimpleNamespace(time=time, obj_id=obj_id, point_x=x, lane=lane)
+                                      for obj_id, x, lane in rows])
+
+
+def test_reused_id_starts_new_track():
+    store = TrackStore(capacity=1)
+    first = store.update(_frame(0, (7, 100.0, 0), (8, 50.0, 1)))
+    # Машина 7 проехала 4 м за 0.1 с, машина 8 прыгнула на 150 м - это уже другая машина
+    second = store.update(_frame(0.1, (7, 96.0, 0), (8, 200.0, 1)))
+    assert second.keys[0] == first.keys[0]
+    assert second.keys[1] not in first.keys and second.ended == [first.keys[1]]
+    # Смена полосы через одну - тоже другая машина
+    third = store.update(_frame(0.2, (7, 95.0, 2), (8, 199.0, 1)))
+    assert third.keys[1] == second.keys[1] and third.ended == [first.keys[0]]
+    assert len(store) == 2
+
+
+def test_id_seen_after_gap_starts_new_track():
+    store = TrackStore()
+    first = store.update(_frame(0, (7, 100.0, 0)))
+    store.update(_frame(1, (9, 10.0, 1)))
+    # Машину 7 не видели TRACK_GAP_SECS, ее трек закрывается по куче
+    expired = store.update(_frame(TRACK_GAP_SECS + 0.5, (9, 11.0, 1)))
+    assert expired.ended == first.keys and len(store) == 1
+    back = store.update(_frame(TRACK_GAP_SECS + 0.6, (7, 100.0, 0)))
+    assert back.keys[0] not in first.keys
+    # Слоты закрытых треков переиспользуются, хранилище не растет
+    assert len(store.key) == 1024
+
+
+def test_track_starts_match_vectorized_rules():
+    path = sorted(glob.glob(os.path.join(os.environ['DATA_DIR'], '*.json')))[0]
+    frames = [obj for obj in iter_objects(path) if obj.rows_data]
+    store = FrameStore.from_objects(frames)
+    starts = _track_starts(store)
+    tracks = TrackStore(capacity=8)
+    first_times = []
+    for frame in frames:
+        slots = tracks.update(frame).slots
+        first_times.extend(tracks.first_time[slot] for slot in slots)
+    assert np.array_equal(store.columns['time'][starts], np.array(first_times))
+    assert tracks.next_key == len(np.unique(starts))
@@ -0,0 +1,69 @@
+import glob
+import math
+import os
+
+import pytest
+
+from algorithm.frames import FrameStore
+from algorithm.json_to_models import iter_objects, read_sensor_config
+from algorithm.spatial import SpatialIndex
+from algorithm.triggers import TriggerEngine
+
+
+def _engine(path: str, classes: int) -> TriggerEngine:
+    spatial = SpatialIndex.from_config(read_sensor_config(path))
+    for zone in spatial.zones:
+        zone.trigger.classes = classes
+    return TriggerEngine(spatial)
+
+
+def test_zero_class_mask_passes_all_classes():
+    path = sorted(glob.glob(os.path.join(os.environ['DATA_DIR'], '*.json')))[0]
+    store = FrameStore.from_objects(iter_objects(path))
+    _, all_classes, _ = _engine(path, 0xFFFF).evaluate(store)
+    _, zero_mask, events = _engine(path, 0).evaluate(store)
+    assert all_classes.sum() > 0 and events
+    assert (zero_mask == all_classes).all()
+
+
+def _naive_counts(engine: TriggerEngine, frame) -> list:
+    # Прямая проверка условий триггера по каждой строке
+    counts = [0] * len(engine)
+    classes = engine.spatial.classify(frame.rows_data)
+    for row, zone in zip(frame.rows_data, classes.zone):
+        if zone < 0:
+            continue
+        trigger = engine.spatial.zones[zone].trigger
+        distance = math.hypot(row.point_x, row.point_y)
+        if trigger.min_speed is not None and row.obj_speed < trigger.min_speed \
+                or trigger.max_speed is not None and row.obj_speed > trigger.max_speed \
+                or trigger.min_range is not None and distance < trigger.min_range \
+                or trigger.max_range is not None and distance > trigger.max_range:
+            continue
+        if trigger.classes and row.obj_class > 0 and not trigger.classes >> (row.obj_class - 1) & 1:
+            continue
+        counts[zone] += 1
+    return counts
+
+
+@pytest.mark.parametrize('classes, limits', [
+    (0xFFFF, {}),
+    (0xFFFF, {'min_time': 0.5, 'max_time': 2.0, 'max_speed': 20}),
+    (0b1100, {'min_time': 1.0, 'min_range': 61, 'max_range': 63}),
+])
+def test_evaluate_matches_naive_per_frame(classes, limits):
+    path = sorted(glob.glob(os.path.join(os.environ['DATA_DIR'], '*.json')))[0]
+    frames = [obj for obj in iter_objects(path) if obj.rows_data]
+    spatial = _engine(path, classes).spatial
+    for zone in spatial.zones:
+        for key, value in limits.items():
+            setattr(zone.trigger, key, value)
+    engine = TriggerEngine(spatial)
+    _, counts, events = TriggerEngine(spatial).evaluate(FrameStore.from_objects(frames))
+
+    streamed = []
+    for i, frame in enumerate(frames):
+        streamed.extend(engine.update(frame))
+        assert counts[i].tolist() == _naive_counts(engine, frame)
+    assert events == streamed
+    assert counts.sum() > 0 and events
@@ -8,13 +8,14 @@ import os
 # Добавляем путь к корневой директории
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from algorithm.metrics.avg_stops_count import avg_multiple_stops
+from algorithm.timestamps import from_micros
 
 def plot_avg_stops():
     # Получаем данные
     data = avg_multiple_stops()
     
     # Разделяем данные на временные метки и значения
-    timestamps = [item[0] for item in data]
+    timestamps = [from_micros(item[0]) for item in data]
     avg_stops = [item[1] for item in data]
     
     # Создаем график
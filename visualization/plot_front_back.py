@@ -0,0 +1,59 @@
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+from datetime import datetime
+import logging
+import sys
+import os
+
+# Добавляем путь к корневой директории
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from backend.data_loader import get_queue_boundaries
+
+logger = logging.getLogger(__name__)
+
+def drow_front_back(start_time: datetime = datetime(2025, 3, 20, 14, 20, 0),
+                    end_time: datetime = datetime(2025, 3, 20, 14, 25, 0)):
+    data = get_queue_boundaries(start_time, end_time)
+
+    # Создаем график для каждого lane
+    for lane_id, lane_data in data.items():
+        # Подготовка данных
+        timestamps = []
+        start_points = []
+        end_points = []
+
+        for start, end, ts in lane_data:
+            timestamps.append(ts)
+            start_points.append(start.point_x if start else 0)
+            end_points.append(end.point_x if end else 0)
+
+        # Создание графика
+        plt.figure(figsize=(12, 6))
+
+        # Добавление линий без маркеров
+        plt.plot(timestamps, start_points, 'b-', label=f'Lane {lane_id} Start', linewidth=2)
+        plt.plot(timestamps, end_points, 'r-', label=f'Lane {lane_id} End', linewidth=2)
+
+        # Настройка графика
+        plt.title(f'Lane {lane_id} Data ({start_time:%H:%M}-{end_time:%H:%M})', fontsize=14)
+        plt.xlabel('Time', fontsize=12)
+        plt.ylabel('Point X', fontsize=12)
+        plt.grid(True, linestyle='--', alpha=0.7)
+        plt.legend(fontsize=10)
+
+        # Установка границ по оси X
+        plt.xlim(start_time, end_time)
+
+        # Форматирование оси времени
+        plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
+        plt.gcf().autofmt_xdate()  # Автоматический поворот меток времени
+
+        # Сохранение графика
+        plt.savefig(f'static/lane_{lane_id}_plot.png', dpi=300, bbox_inches='tight')
+        plt.close()  # Закрываем график для освобождения памяти
+
+        # Логируем создание графика
+        logger.info(f"Created plot for lane {lane_id}")
+
+if __name__ == "__main__":
+    drow_front_back()